@@ -0,0 +1,76 @@
+from app.config import settings
+from app.encoded_track import encoders
+from app import metrics
+import weakref
+import time
+
+listeners_admitted = metrics.counter("listeners_admitted_total")
+listeners_queued = metrics.counter("listeners_queued_total")
+listeners_rejected = metrics.counter("listeners_rejected_total")
+
+
+class ListenerBudget:
+    """
+    How many listeners this process can carry: its CPU budget, less what the
+    live encoders use, over the CPU each listener was measured to cost.
+    Measurements only start once enough listeners are connected for the
+    per-listener share to stand out from idle work.
+    """
+
+    def __init__(self):
+        self.listener_cost = settings.listener_cpu_cost
+        self.encode_load = 0.0
+        self.in_use = 0
+        self.measured_at = time.monotonic()
+        self.cpu_at = time.process_time()
+
+    def measure(self):
+        now, cpu = time.monotonic(), time.process_time()
+        elapsed = now - self.measured_at
+        if elapsed < settings.listener_budget_interval_seconds:
+            return
+
+        used = (cpu - self.cpu_at) / elapsed
+        self.measured_at, self.cpu_at = now, cpu
+        self.encode_load = sum(
+            encoder.encode_load for encoder in encoders if encoder.readyState == "live"
+        )
+        if self.in_use >= settings.listener_cost_min_sample:
+            sample = max(used - self.encode_load, 0.0) / self.in_use
+            self.listener_cost = 0.8 * self.listener_cost + 0.2 * sample
+
+    @property
+    def limit(self) -> int:
+        self.measure()
+        available = settings.listener_cpu_budget - self.encode_load
+        return max(0, int(available / max(self.listener_cost, 1e-6)))
+
+    def has_room(self) -> bool:
+        return self.in_use < self.limit
+
+
+listener_budget = ListenerBudget()
+
+metrics.gauge("listener_budget", lambda: listener_budget.limit)
+metrics.gauge("listeners_in_use", lambda: listener_budget.in_use)
+metrics.gauge("listener_cpu_cost", lambda: listener_budget.listener_cost)
+
+# Concert managers with listeners waiting for a slot
+waiting_rooms: weakref.WeakSet = weakref.WeakSet()
+
+
+def capacity_share(max_capacity: int) -> int:
+    """
+    This process's part of a concert's capacity, so that processes relaying
+    the same concert never let in more than the concert holds between them.
+    """
+    return max_capacity // max(settings.relay_processes, 1)
+
+
+def release_slot():
+    """
+    Give a listener's slot back, letting in whoever waits for one next.
+    """
+    listener_budget.in_use -= 1
+    for room in list(waiting_rooms):
+        room.admit_waiting()
@@ -0,0 +1,40 @@
+"""add concert search vector
+
+Revision ID: 9c3e7f1a2b64
+Revises: 4b5d4e1b8ac3
+Create Date: 2026-10-18 20:05:12.402113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e7f1a2b64'
+down_revision: Union[str, Sequence[str], None] = '4b5d4e1b8ac3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('concert', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(
+            "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'B')",
+            persisted=True,
+        ),
+        nullable=True,
+    ))
+    op.create_index('ix_concert_search_vector', 'concert', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_concert_search_vector', table_name='concert', postgresql_using='gin')
+    op.drop_column('concert', 'search_vector')
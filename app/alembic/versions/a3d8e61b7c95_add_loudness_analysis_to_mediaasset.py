@@ -0,0 +1,34 @@
+"""add loudness analysis to mediaasset
+
+Revision ID: a3d8e61b7c95
+Revises: f7c19a3e5d42
+Create Date: 2026-10-18 22:04:13.518207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3d8e61b7c95'
+down_revision: Union[str, Sequence[str], None] = 'f7c19a3e5d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Assets transcoded before this play at unity gain and have no peaks
+    op.add_column('mediaasset', sa.Column('integrated_loudness', sa.Float(), nullable=True))
+    op.add_column('mediaasset', sa.Column('true_peak', sa.Float(), nullable=True))
+    op.add_column('mediaasset', sa.Column('peaks_url', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('mediaasset', 'peaks_url')
+    op.drop_column('mediaasset', 'true_peak')
+    op.drop_column('mediaasset', 'integrated_loudness')
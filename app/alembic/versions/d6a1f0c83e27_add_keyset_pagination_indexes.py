@@ -0,0 +1,32 @@
+"""add keyset pagination indexes
+
+Revision ID: d6a1f0c83e27
+Revises: 9c3e7f1a2b64
+Create Date: 2026-10-18 20:21:40.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6a1f0c83e27'
+down_revision: Union[str, Sequence[str], None] = '9c3e7f1a2b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_concert_start_time_id', 'concert', ['start_time', 'id'], unique=False)
+    op.create_index('ix_concert_popularity_id', 'concert', ['popularity', 'id'], unique=False)
+    op.create_index('ix_mediaasset_artist_id_id', 'mediaasset', ['artist_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_mediaasset_artist_id_id', table_name='mediaasset')
+    op.drop_index('ix_concert_popularity_id', table_name='concert')
+    op.drop_index('ix_concert_start_time_id', table_name='concert')
@@ -0,0 +1,42 @@
+"""add media blobs
+
+Revision ID: e5b82c4d9f10
+Revises: d6a1f0c83e27
+Create Date: 2026-10-18 20:58:03.771402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b82c4d9f10'
+down_revision: Union[str, Sequence[str], None] = 'd6a1f0c83e27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('mediablob',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('url', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('content_hash')
+    )
+    op.add_column('mediaasset', sa.Column('blob_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('mediaasset_blob_id_fkey', 'mediaasset', 'mediablob', ['blob_id'], ['id'])
+    op.create_unique_constraint('unique_artist_blob', 'mediaasset', ['artist_id', 'blob_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('unique_artist_blob', 'mediaasset', type_='unique')
+    op.drop_constraint('mediaasset_blob_id_fkey', 'mediaasset', type_='foreignkey')
+    op.drop_column('mediaasset', 'blob_id')
+    op.drop_table('mediablob')
@@ -0,0 +1,44 @@
+"""add transcode jobs to mediaasset
+
+Revision ID: f7c19a3e5d42
+Revises: e5b82c4d9f10
+Create Date: 2026-10-18 21:19:47.205518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7c19a3e5d42'
+down_revision: Union[str, Sequence[str], None] = 'e5b82c4d9f10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing assets start pending, so the queue transcodes them too
+    op.add_column('mediaasset', sa.Column('transcode_status', sqlmodel.sql.sqltypes.AutoString(), nullable=False, server_default='pending'))
+    op.add_column('mediaasset', sa.Column('transcoded_url', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.add_column('mediaasset', sa.Column('transcode_attempts', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('mediaasset', sa.Column('transcode_error', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.add_column('mediaasset', sa.Column('transcode_available_at', sa.DateTime(), nullable=True))
+    op.add_column('mediaasset', sa.Column('transcode_started_at', sa.DateTime(), nullable=True))
+    op.alter_column('mediaasset', 'transcode_status', server_default=None)
+    op.alter_column('mediaasset', 'transcode_attempts', server_default=None)
+    op.create_index('ix_mediaasset_transcode_queue', 'mediaasset', ['transcode_status', 'transcode_available_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_mediaasset_transcode_queue', table_name='mediaasset')
+    op.drop_column('mediaasset', 'transcode_started_at')
+    op.drop_column('mediaasset', 'transcode_available_at')
+    op.drop_column('mediaasset', 'transcode_error')
+    op.drop_column('mediaasset', 'transcode_attempts')
+    op.drop_column('mediaasset', 'transcoded_url')
+    op.drop_column('mediaasset', 'transcode_status')
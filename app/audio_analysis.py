@@ -0,0 +1,259 @@
+from dataclasses import dataclass
+from typing import Iterator
+from av import AudioResampler
+from numpy.lib.stride_tricks import sliding_window_view
+from app.config import settings
+import numpy as np
+import struct
+import av
+
+# The K-weighting coefficients below are the BS.1770 ones for this rate
+ANALYSIS_SAMPLE_RATE = 48000
+# Loudness is measured over 400 ms blocks overlapping by 75%, so in steps of
+# 100 ms sub-blocks
+SUBBLOCK_SAMPLES = ANALYSIS_SAMPLE_RATE // 10
+CHUNK_SAMPLES = SUBBLOCK_SAMPLES * 16
+
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+# High shelf then high pass, as (b, a) biquad coefficients
+K_WEIGHTING = [
+    (
+        [1.53512485958697, -2.69169618940638, 1.19839281085285],
+        [1.0, -1.69065929318241, 0.73248077421585],
+    ),
+    (
+        [1.0, -2.0, 1.0],
+        [1.0, -1.99004745483398, 0.99007225036621],
+    ),
+]
+K_WEIGHTING_TAPS = 16384
+
+TRUE_PEAK_OVERSAMPLING = 4
+TRUE_PEAK_TAPS_PER_PHASE = 12
+
+# Waveform file: header, then per level a peak count and that many (min, max)
+# int8 pairs. Each level halves the resolution of the one before it.
+PEAKS_MAGIC = b"VPKS"
+PEAKS_VERSION = 1
+PEAKS_HEADER = struct.Struct("<4sHIIH")  # magic, version, sample rate, samples per peak, levels
+PEAKS_LEVEL = struct.Struct("<I")
+PEAKS_SAMPLES_PER_PEAK = 512
+PEAKS_MIN_COUNT = 128
+
+
+def impulse_response(stages: list[tuple[list[float], list[float]]], length: int) -> np.ndarray:
+    """
+    FIR equivalent of a cascade of biquads, sampled from their frequency
+    response. Their poles have decayed far below float precision within length
+    samples, so truncating the response loses nothing.
+    """
+    e = np.exp(-1j * np.pi * np.linspace(0, 1, length // 2 + 1))
+    response = np.ones_like(e)
+    for b, a in stages:
+        response *= np.polyval(b[::-1], e) / np.polyval(a[::-1], e)
+    return np.fft.irfft(response, length)
+
+
+def interpolation_filter() -> np.ndarray:
+    """
+    Windowed sinc low pass for oversampling, one row of taps per phase.
+    """
+    length = TRUE_PEAK_OVERSAMPLING * TRUE_PEAK_TAPS_PER_PHASE
+    n = np.arange(length) - (length - 1) / 2
+    taps = np.sinc(n / TRUE_PEAK_OVERSAMPLING) * np.kaiser(length, 8.0)
+    phases = taps.reshape(TRUE_PEAK_TAPS_PER_PHASE, TRUE_PEAK_OVERSAMPLING).T
+    # Every phase passes DC unchanged
+    return phases / phases.sum(axis=1, keepdims=True)
+
+
+class StreamingFIR:
+    """
+    FFT convolution over consecutive chunks of a signal, carrying the end of
+    each chunk over as history for the next.
+    """
+
+    def __init__(self, taps: np.ndarray, channels: int):
+        self.taps = taps
+        self.history = np.zeros((channels, len(taps) - 1))
+        self.spectra: dict[int, np.ndarray] = {}
+
+    def __call__(self, samples: np.ndarray) -> np.ndarray:
+        padded = np.concatenate([self.history, samples], axis=1)
+        self.history = padded[:, samples.shape[1] :]
+
+        size = padded.shape[1] + len(self.taps) - 1
+        fft_size = 1 << (size - 1).bit_length()
+        if fft_size not in self.spectra:
+            self.spectra[fft_size] = np.fft.rfft(self.taps, fft_size)
+
+        filtered = np.fft.irfft(np.fft.rfft(padded, fft_size) * self.spectra[fft_size], fft_size)
+        return filtered[:, len(self.taps) - 1 : padded.shape[1]]
+
+
+class Oversampler:
+    """
+    Polyphase interpolation over consecutive chunks. The filter is short, so
+    every phase is computed directly in one matrix product.
+    """
+
+    def __init__(self, phases: np.ndarray, channels: int):
+        # Reversed so a sliding window over the input lines up with the taps
+        self.taps = phases[:, ::-1].T
+        self.history = np.zeros((channels, phases.shape[1] - 1))
+
+    def __call__(self, samples: np.ndarray) -> np.ndarray:
+        padded = np.concatenate([self.history, samples], axis=1)
+        self.history = padded[:, samples.shape[1] :]
+        windows = sliding_window_view(padded, self.taps.shape[0], axis=1)
+        return windows @ self.taps
+
+
+def lufs(energy: np.ndarray) -> np.ndarray:
+    return -0.691 + 10 * np.log10(np.maximum(energy, 1e-20))
+
+
+@dataclass
+class Analysis:
+    integrated_loudness: float | None
+    true_peak: float | None
+    peaks: bytes
+
+
+class AudioAnalyser:
+    """
+    EBU R128 integrated loudness, true peak and waveform peaks, measured in a
+    single pass over chunks of (channels, samples) float audio at 48 kHz.
+    Every chunk but the last must be a whole number of sub-blocks long.
+    """
+
+    def __init__(self, channels: int = 2):
+        self.k_weighting = StreamingFIR(
+            impulse_response(K_WEIGHTING, K_WEIGHTING_TAPS), channels
+        )
+        self.oversampler = Oversampler(interpolation_filter(), channels)
+        self.energies: list[np.ndarray] = []
+        self.peak = 0.0
+        self.minimums: list[np.ndarray] = []
+        self.maximums: list[np.ndarray] = []
+
+    def add(self, samples: np.ndarray):
+        samples = samples.astype(np.float64)
+        channels, length = samples.shape
+
+        # Mean square of each whole sub-block per channel, a trailing partial
+        # sub-block never completes a gating block
+        whole = length - length % SUBBLOCK_SAMPLES
+        weighted = self.k_weighting(samples)[:, :whole]
+        self.energies.append(
+            np.square(weighted).reshape(channels, -1, SUBBLOCK_SAMPLES).mean(axis=2)
+        )
+
+        self.peak = max(self.peak, float(np.abs(self.oversampler(samples)).max()))
+
+        remainder = -length % PEAKS_SAMPLES_PER_PEAK
+        bins = np.pad(samples, ((0, 0), (0, remainder)), mode="edge").reshape(
+            channels, -1, PEAKS_SAMPLES_PER_PEAK
+        )
+        self.minimums.append(bins.min(axis=(0, 2)))
+        self.maximums.append(bins.max(axis=(0, 2)))
+
+    def integrated_loudness(self) -> float | None:
+        energies = np.concatenate(self.energies, axis=1)
+        if energies.shape[1] < 4:
+            return None
+
+        # Channel weights are 1 for left and right
+        blocks = sliding_window_view(energies, 4, axis=1).mean(axis=2).sum(axis=0)
+        loudness = lufs(blocks)
+
+        above_absolute = loudness > ABSOLUTE_GATE_LUFS
+        if not above_absolute.any():
+            return None
+        relative_gate = lufs(blocks[above_absolute].mean()) + RELATIVE_GATE_LU
+        gated = blocks[above_absolute & (loudness > relative_gate)]
+        return float(lufs(gated.mean()))
+
+    def true_peak(self) -> float | None:
+        if self.peak == 0:
+            return None
+        return float(20 * np.log10(self.peak))
+
+    def peaks(self) -> bytes:
+        minimums = np.concatenate(self.minimums) if self.minimums else np.zeros(0)
+        maximums = np.concatenate(self.maximums) if self.maximums else np.zeros(0)
+
+        levels = [(minimums, maximums)]
+        while len(levels[-1][0]) > PEAKS_MIN_COUNT:
+            minimums, maximums = levels[-1]
+            if len(minimums) % 2:
+                minimums = np.append(minimums, minimums[-1])
+                maximums = np.append(maximums, maximums[-1])
+            levels.append((minimums.reshape(-1, 2).min(axis=1), maximums.reshape(-1, 2).max(axis=1)))
+
+        parts = [
+            PEAKS_HEADER.pack(
+                PEAKS_MAGIC,
+                PEAKS_VERSION,
+                ANALYSIS_SAMPLE_RATE,
+                PEAKS_SAMPLES_PER_PEAK,
+                len(levels),
+            )
+        ]
+        for minimums, maximums in levels:
+            pairs = np.stack([minimums, maximums], axis=1)
+            parts.append(PEAKS_LEVEL.pack(len(pairs)))
+            parts.append(np.round(np.clip(pairs, -1, 1) * 127).astype(np.int8).tobytes())
+        return b"".join(parts)
+
+    def result(self) -> Analysis:
+        return Analysis(self.integrated_loudness(), self.true_peak(), self.peaks())
+
+
+def read_chunks(file: str) -> Iterator[np.ndarray]:
+    """
+    Decode a file into stereo float chunks of CHUNK_SAMPLES, the last one
+    possibly shorter.
+    """
+    resampler = AudioResampler(format="fltp", layout="stereo", rate=ANALYSIS_SAMPLE_RATE)
+    pending: list[np.ndarray] = []
+    size = 0
+
+    with av.open(file) as container:
+        for frame in container.decode(audio=0):
+            for out in resampler.resample(frame):
+                pending.append(out.to_ndarray())
+                size += out.samples
+            while size >= CHUNK_SAMPLES:
+                samples = np.concatenate(pending, axis=1)
+                yield samples[:, :CHUNK_SAMPLES]
+                pending = [samples[:, CHUNK_SAMPLES:]]
+                size -= CHUNK_SAMPLES
+
+        for out in resampler.resample(None):
+            pending.append(out.to_ndarray())
+            size += out.samples
+
+    if size:
+        yield np.concatenate(pending, axis=1)
+
+
+def analyse_file(file: str) -> Analysis:
+    analyser = AudioAnalyser()
+    for samples in read_chunks(file):
+        analyser.add(samples)
+    return analyser.result()
+
+
+def playback_gain(integrated_loudness: float | None, true_peak: float | None) -> float:
+    """
+    Linear gain bringing a track to the target loudness, held back so its true
+    peak stays under the ceiling. Unanalysed tracks play unchanged.
+    """
+    if integrated_loudness is None:
+        return 1.0
+    gain_db = settings.loudness_target_lufs - integrated_loudness
+    if true_peak is not None:
+        gain_db = min(gain_db, settings.true_peak_ceiling_dbtp - true_peak)
+    return float(10 ** (gain_db / 20))
@@ -0,0 +1,41 @@
+from typing import BinaryIO
+import av
+
+AUDIO_METADATA_FIELDS = ("duration", "codec", "bit_rate", "frequency", "channels", "channel_layout")
+
+
+def probe_audio(file: BinaryIO) -> tuple[dict, str]:
+    """
+    Read the MediaAsset metadata of an uploaded file with PyAV, along with the
+    name of its container format. Only the container headers are read, unless
+    the format has no duration in them, in which case the packets are walked
+    without decoding them.
+    """
+    with av.open(file, mode="r") as container:
+        if not container.streams.audio:
+            raise ValueError("No audio stream found")
+        stream = container.streams.audio[0]
+
+        if container.duration is not None:
+            duration = container.duration / av.time_base
+        elif stream.duration is not None and stream.time_base is not None:
+            duration = float(stream.duration * stream.time_base)
+        else:
+            end = 0
+            for packet in container.demux(stream):
+                if packet.pts is not None and packet.duration is not None:
+                    end = max(end, packet.pts + packet.duration)
+            duration = float(end * stream.time_base) if stream.time_base else 0.0
+
+        codec_context = stream.codec_context
+        bit_rate = codec_context.bit_rate or container.bit_rate or 0
+
+        metadata = {
+            "duration": round(duration),
+            "codec": codec_context.codec.canonical_name,
+            "bit_rate": bit_rate,
+            "frequency": codec_context.sample_rate,
+            "channels": codec_context.channels,
+            "channel_layout": codec_context.layout.name if codec_context.layout else None,
+        }
+        return metadata, container.format.name
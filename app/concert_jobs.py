@@ -0,0 +1,84 @@
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.jobstores.base import JobLookupError
+from datetime import datetime, timedelta
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.config import settings
+from app.database import async_engine
+from app.dependencies.scheduler import get_scheduler
+from app.models.concert import Concert
+import asyncio
+
+# Jobs live in the database, so they reference these functions by name
+# and only carry the concert id.
+
+
+def start_job_id(concert_id: int) -> str:
+    return f"concert-{concert_id}-start"
+
+
+def prerender_job_id(concert_id: int) -> str:
+    return f"concert-{concert_id}-prerender"
+
+
+def schedule_concert(concert_id: int, start_time: datetime):
+    scheduler = get_scheduler()
+    unschedule_concert(concert_id)
+
+    if start_time <= datetime.now():
+        return
+
+    scheduler.add_job(
+        start_concert,
+        DateTrigger(run_date=start_time),
+        args=[concert_id],
+        id=start_job_id(concert_id),
+        replace_existing=True,
+    )
+
+    prerender_time = start_time - timedelta(minutes=settings.prerender_lead_minutes)
+    scheduler.add_job(
+        prerender_concert,
+        DateTrigger(run_date=max(prerender_time, datetime.now())),
+        args=[concert_id],
+        id=prerender_job_id(concert_id),
+        replace_existing=True,
+    )
+
+
+def schedule_concerts(concerts: list[tuple[int, datetime]]):
+    for concert_id, start_time in concerts:
+        schedule_concert(concert_id, start_time)
+
+
+def unschedule_concert(concert_id: int):
+    scheduler = get_scheduler()
+    for job_id in (start_job_id(concert_id), prerender_job_id(concert_id)):
+        try:
+            scheduler.remove_job(job_id)
+        except JobLookupError:
+            pass
+
+
+def scheduled_job_ids() -> set[str]:
+    return {job.id for job in get_scheduler().get_jobs()}
+
+
+async def start_concert(concert_id: int):
+    from app.dependencies.concerts import get_concert_manager
+
+    async with AsyncSession(async_engine) as session:
+        concert = await session.get(Concert, concert_id)
+    if concert is None:
+        return
+    # Awaited so a failure shows up as the job's error
+    await asyncio.wrap_future(get_concert_manager(concert).start())
+
+
+async def prerender_concert(concert_id: int):
+    from app.dependencies.concerts import get_concert_manager
+
+    async with AsyncSession(async_engine) as session:
+        concert = await session.get(Concert, concert_id)
+    if concert is None:
+        return
+    await asyncio.wrap_future(get_concert_manager(concert).start_prerender())
@@ -1,110 +1,348 @@
 import asyncio
 from aiortc import MediaStreamTrack, RTCPeerConnection
-from aiortc.contrib.media import MediaPlayer, MediaRelay
-from app.dependencies.db import SessionDep
-from app.models.concert import ConcertSetlistItem, Concert
-from app.models.artist import MediaAsset
+from aiortc.contrib.media import MediaRelay
+from aiortc.mediastreams import MediaStreamError
+from app.database import async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models.concert import ConcertSetlistItem
+from app.models.artist import MediaAsset, TRANSCODE_READY
 from sqlmodel import select, col
-from apscheduler.triggers.date import DateTrigger
 from fastapi import WebSocket
 from fastapi.websockets import WebSocketState
-from app.dependencies.scheduler import get_scheduler
-from apscheduler.job import Job
-from apscheduler.jobstores.base import JobLookupError
 from typing import TypedDict, Dict
+from collections import deque
 from uuid import uuid4
 from aiortc import RTCPeerConnection, RTCSessionDescription
 from aiortc.sdp import candidate_from_sdp
-import subprocess
+from app.storage import local_path
+from app.audio_analysis import playback_gain
+from app.setlist_track import SetlistTrack
+from app.encoded_track import OpusEncodedTrack
+from app.origin_feed import CONCERT_ENDED_CLOSE_CODE, FEED_READY_MESSAGE, OriginFeedTrack
+from app.hls import HlsSegmenter
+from app.outbox import Outbox
+from app.reactions import ReactionAggregator
+from app.admission import (
+    listener_budget,
+    listeners_admitted,
+    listeners_queued,
+    listeners_rejected,
+    release_slot,
+    waiting_rooms,
+)
+from app.workers import is_edge, internal_headers
+from websockets.asyncio.client import connect
+from app.config import settings
+from app import metrics
 import asyncio
-import os, tempfile
+import concurrent.futures
+import json
+import time
+
+# Try again later, sent to listeners turned away by a full waiting room
+REJECTED_CLOSE_CODE = 1013
+# Going away, sent to listeners still waiting when the concert is stopped
+STOPPED_CLOSE_CODE = 1001
+
+FIRST_FRAME_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+first_frame_time = metrics.histogram("listener_first_frame_seconds", FIRST_FRAME_BUCKETS)
+
+# Normal closure, what the origin's feed ends with when it is shut down cleanly
+NORMAL_CLOSE_CODE = 1000
+
+# How long an edge waits before reconnecting to the origin's feed
+ORIGIN_RETRY_SECONDS = 1
+
+# One frame, how often a listener checks whether its edge noticed a lost feed
+FEED_POLL_SECONDS = 0.02
+
+# Offers are answered on the event loop, a crowd offering at once is let
+# through a few at a time
+negotiations = asyncio.Semaphore(settings.max_concurrent_negotiations)
+
+
+class ListenerTrack(MediaStreamTrack):
+    """
+    Attached to a listener's sender as soon as it joins and kept there, so
+    going live needs no renegotiation. Waits for the concert to go live,
+    then forwards the broadcast. On an edge the origin feed can drop and come
+    back as a new track, which it subscribes to in turn, since a sender stops
+    for good once its track ends. Also times how long the listener waited for
+    its first frame.
+    """
+
+    kind = "audio"
+
+    def __init__(self, manager: "ConcertManager"):
+        super().__init__()
+        self.manager = manager
+        self.joined_at = time.perf_counter()
+        self.source: MediaStreamTrack | None = None
+        self.track: MediaStreamTrack | None = None
+        self.timed = False
+
+    async def recv(self):
+        while True:
+            if self.track is None:
+                await self.manager.live_event.wait()
+                self.source = self.manager.broadcast_track
+                self.track = self.manager.relay.subscribe(self.source)  # type: ignore
+
+            try:
+                frame = await self.track.recv()
+            except MediaStreamError:
+                self.track.stop()
+                self.track = None
+                if not is_edge():
+                    raise
+                # Wait for the edge to notice the lost feed before waiting on a new one
+                while self.manager.broadcast_track is self.source:
+                    await asyncio.sleep(FEED_POLL_SECONDS)
+                continue
+
+            if not self.timed:
+                self.timed = True
+                first_frame_time.observe(
+                    time.perf_counter() - max(self.joined_at, self.manager.live_at)
+                )
+            return frame
+
+    def stop(self):
+        super().stop()
+        if self.track is not None:
+            self.track.stop()
+            self.track = None
 
 
 class Listener(TypedDict):
     pc: RTCPeerConnection
     ws: WebSocket
+    outbox: Outbox
+
+
+def needs_renegotiation(pc: RTCPeerConnection) -> bool:
+    """
+    Whether a negotiated connection ended up without our audio sender.
+    """
+    if pc.remoteDescription is None:
+        return False
+    return not any(
+        t.kind == "audio" and t.currentDirection in ("sendonly", "sendrecv")
+        for t in pc.getTransceivers()
+    )
 
 
-def merge_audio_tracks(files: list[str]):
-    temp_file = tempfile.NamedTemporaryFile(suffix=".wav", delete=False).name
-    ffmpeg_cmd = ["ffmpeg"]
-    for f in files:
-        ffmpeg_cmd.extend(["-i", f])
-    ffmpeg_cmd.extend(
-        [
-            "-filter_complex",
-            f"concat=n={len(files)}:v=0:a=1[outa]",
-            "-map",
-            "[outa]",
-            "-ar",
-            "48000",
-            "-ac",
-            "2",
-            "-c:a",
-            "pcm_s16le",
-            temp_file,
-            "-y",
-        ]
-    )
-    subprocess.run(
-        ffmpeg_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
-    )
-    return temp_file
+def run_on_main_loop(coro):
+    from app.main import MAIN_LOOP
+
+    if MAIN_LOOP is None:
+        raise RuntimeError("Main loop not initialized yet")
+
+    return asyncio.run_coroutine_threadsafe(coro, MAIN_LOOP)
 
 
 class ConcertManager:
-    def __init__(self, id: int, session: SessionDep):
+    def __init__(self, id: int):
         self.id = id
         self.listeners: Dict[str, Listener] = {}
-        self.session = session
         self.playlist_track: MediaStreamTrack | None = None
-        self.start_job: Job | None = None
+        self.broadcast_track: MediaStreamTrack | None = None
         self._dummy_task: asyncio.Task | None = None
-        self._temp_file: str | None = None
+        self._origin_task: asyncio.Task | None = None
+        self.live_event = asyncio.Event()
+        self.finished = False
+        self.starting = False
+        self._rendered: list[tuple[str, float]] = []
+        self._render_lock = asyncio.Lock()
         self.relay = MediaRelay()
+        self.hls: HlsSegmenter | None = None
+        self.live_at = 0.0
+        # This process's share of Concert.max_capacity, kept current by the
+        # dependency handing this out
+        self.capacity: int | None = None
+        # Listeners waiting for a slot, with the future that lets them in
+        self.waiting: deque[tuple[asyncio.Future, Outbox]] = deque()
+        self._reserved = 0
+        self._positions_task: asyncio.Task | None = None
+        self.reactions = ReactionAggregator(
+            lambda: (listener["outbox"] for listener in self.listeners.values())
+        )
 
     async def _consume_dummy(self):
-        if not self.playlist_track:
+        if not self.broadcast_track:
             return
-        dummy_track = self.relay.subscribe(self.playlist_track)
+        dummy_track = self.relay.subscribe(self.broadcast_track)
         while True:
             try:
                 await dummy_track.recv()
             except Exception:
                 break  # Track ended
+        self.finished = True
+
+    @property
+    def is_live(self) -> bool:
+        return self.broadcast_track is not None and not self.finished
+
+    @property
+    def is_idle(self) -> bool:
+        """
+        Whether the manager holds nothing worth keeping in memory: no audience,
+        no stream and no upcoming start.
+        """
+        return (
+            not self.listeners
+            and not self.waiting
+            and not self.is_live
+            and not self.starting
+            and self._origin_task is None
+        )
 
-    def start(self):
-        from app.main import MAIN_LOOP
-
-        if MAIN_LOOP is None:
-            raise RuntimeError("Main loop not initialized yet")
-
-        asyncio.run_coroutine_threadsafe(self._start_async(), MAIN_LOOP)
+    def start(self) -> concurrent.futures.Future:
+        return run_on_main_loop(self._start_async())
+
+    def start_prerender(self) -> concurrent.futures.Future:
+        return run_on_main_loop(self.prerender())
+
+    async def prerender(self):
+        """
+        Fetch the transcoded setlist onto local disk off the event loop, paired
+        with the gain each track plays at. Assets still waiting on their
+        transcode are left out of the concert.
+        """
+        async with self._render_lock:
+            async with AsyncSession(async_engine) as session:
+                playlist = (
+                    await session.exec(
+                        select(
+                            MediaAsset.id,
+                            MediaAsset.transcode_status,
+                            MediaAsset.transcoded_url,
+                            MediaAsset.integrated_loudness,
+                            MediaAsset.true_peak,
+                        )
+                        .join(ConcertSetlistItem)
+                        .where(ConcertSetlistItem.concert_id == self.id)
+                        .order_by(col(ConcertSetlistItem.track_number))
+                    )
+                ).all()
+
+            tracks = []
+            for asset_id, transcode_status, transcoded_url, loudness, true_peak in playlist:
+                if transcode_status != TRANSCODE_READY or transcoded_url is None:
+                    print("Skipping untranscoded asset", asset_id, "in concert", self.id)
+                    continue
+                tracks.append((transcoded_url, playback_gain(loudness, true_peak)))
+
+            self._rendered = await asyncio.to_thread(
+                lambda: [(local_path(url), gain) for url, gain in tracks]
+            )
+            return self._rendered
 
     async def _start_async(self):
         print("Starting playlist")
-        playlist = self.session.exec(
-            select(MediaAsset.url)
-            .join(ConcertSetlistItem)
-            .where(ConcertSetlistItem.concert_id == self.id)
-            .order_by(col(ConcertSetlistItem.track_number))
-        ).all()
+        self.starting = True
+        try:
+            # Only fetches tracks missed by the pre-render, e.g. late setlist edits
+            tracks = await self.prerender()
 
-        self._temp_file = merge_audio_tracks(list(playlist))
-        self.playlist_track = MediaPlayer(self._temp_file).audio
+            self.playlist_track = SetlistTrack(
+                [file for file, _ in tracks], [gain for _, gain in tracks]
+            )
+            source = self.playlist_track
+            if settings.hls_enabled:
+                # Two readers of one track would split its frames between them
+                self.hls = HlsSegmenter(self.relay.subscribe(self.playlist_track))
+                self.hls.start()
+                source = self.relay.subscribe(self.playlist_track)
+            # Encode once for the whole audience rather than once per peer connection
+            await self._go_live(OpusEncodedTrack(source) if settings.encode_once else source)
+        finally:
+            self.starting = False
+
+    async def _go_live(self, track: MediaStreamTrack):
+        self.broadcast_track = track
+        self.finished = False
+        self.starting = False
+        self.live_at = time.perf_counter()
+        self.live_event.set()
 
         if self._dummy_task is None:
             self._dummy_task = asyncio.create_task(self._consume_dummy())
 
-        for listener_id, listener in list(self.listeners.items()):
-            self.add_track_to_listener(listener_id)
+        # Every listener's ListenerTrack picks the broadcast up by itself, also
+        # when an edge's origin feed comes back. Only a client whose offer left
+        # out our audio needs another round.
+        for listener in list(self.listeners.values()):
+            if needs_renegotiation(listener["pc"]):
+                listener["outbox"].send({"type": "renegotiate"})
+
+    def subscribe_encoded(self) -> MediaStreamTrack:
+        assert self.broadcast_track is not None
+        track = self.relay.subscribe(self.broadcast_track)
+        return track if settings.encode_once else OpusEncodedTrack(track)
+
+    async def _follow_origin(self):
+        """
+        On an edge, pull the concert's encoded stream from the origin node and
+        relay it to this process's listeners for as long as any are connected.
+        A lost feed is reconnected, but once the origin says the concert is
+        over, or closes cleanly after it went live, the concert ends here too.
+        """
+        url = f"ws://{settings.relay_origin}/internal/concerts/{self.id}/feed"
+        ended = False
 
-            try:
-                await listener["ws"].send_json({"type": "renegotiate"})
-            except Exception as e:
-                print("Failed to send renegotiate to listener", listener_id, e)
+        try:
+            while self.listeners:
+                connection = None
+                went_live = False
+                error = None
+                try:
+                    async with connect(url, additional_headers=internal_headers()) as connection:
+                        # The origin says so once the concert is live
+                        ready = await connection.recv()
+                        if ready != FEED_READY_MESSAGE:
+                            raise ValueError(f"Unexpected feed message {ready!r}")
+                        await self._go_live(OriginFeedTrack(connection))
+                        went_live = True
+                        if self._dummy_task:
+                            await self._dummy_task
+                except Exception as e:
+                    error = e
+
+                close_code = connection.close_code if connection is not None else None
+                if close_code == CONCERT_ENDED_CLOSE_CODE or (
+                    went_live and close_code == NORMAL_CLOSE_CODE
+                ):
+                    ended = True
+                    break
+                if error is not None:
+                    print("Lost origin feed for concert", self.id, error)
+
+                self._drop_feed()
+                await asyncio.sleep(ORIGIN_RETRY_SECONDS)
+        except asyncio.CancelledError:
+            # Nobody left to relay to, or stopped
+            self._drop_feed()
+            raise
+
+        # Cleared first, so stopping doesn't cancel this task
+        self._origin_task = None
+        if ended:
+            print("Concert", self.id, "ended on the origin")
+            await self.stop()
+
+    def _drop_feed(self):
+        if self.broadcast_track:
+            self.broadcast_track.stop()
+        self._dummy_task = None
+        self.broadcast_track = None
+        self.live_event.clear()
 
     async def stop(self):
+        if self._origin_task:
+            self._origin_task.cancel()
+            self._origin_task = None
         if self._dummy_task:
             self._dummy_task.cancel()
             try:
@@ -112,39 +350,34 @@ class ConcertManager:
             except asyncio.CancelledError:
                 pass
             self._dummy_task = None
+        if self.broadcast_track:
+            self.broadcast_track.stop()
+        # Cancelled, the dummy consumer never got to mark the end itself
+        self.finished = True
+        self.broadcast_track = None
+        self.live_event.clear()
+        # With HLS on, the broadcast is a relay subscriber, stopping it
+        # leaves the setlist decoding
         if self.playlist_track:
             self.playlist_track.stop()
-        self.remove_schedule_start()
-        for listener_id in self.listeners.keys():
+            self.playlist_track = None
+        if self.hls:
+            self.hls.stop()
+            self.hls = None
+        self.reactions.stop()
+        while self.waiting:
+            admitted, _ = self.waiting.popleft()
+            admitted.set_result(False)
+        waiting_rooms.discard(self)
+        if self._positions_task:
+            self._positions_task.cancel()
+        for listener_id in list(self.listeners.keys()):
             await self.remove_listener(listener_id)
-        if self._temp_file and os.path.exists(self._temp_file):
-            os.remove(self._temp_file)
-
-    def schedule_start(self):
-        start_time = self.session.exec(
-            select(Concert.start_time).where(Concert.id == self.id)
-        ).first()
-        if start_time is None:
-            print("No start time set.")
-            return
-
-        scheduler = get_scheduler()
-        self.remove_schedule_start()
-        self.start_job = scheduler.add_job(self.start, DateTrigger(run_date=start_time))
-
-    def remove_schedule_start(self):
-        if self.start_job is None:
-            return
-
-        try:
-            self.start_job.remove()
-        except JobLookupError:
-            pass
 
     def add_pc_handlers(self, listener_id: str):
         listener = self.listeners[listener_id]
         pc = listener["pc"]
-        ws = listener["ws"]
+        outbox = listener["outbox"]
 
         async def on_state_change():
             if pc.connectionState in ("failed", "closed", "disconnected"):
@@ -153,7 +386,7 @@ class ConcertManager:
         async def on_icecandidate(candidate):
             if candidate is None:
                 return
-            await ws.send_json(
+            outbox.send(
                 {
                     "type": "candidate",
                     "candidate": candidate.candidate,
@@ -165,59 +398,156 @@ class ConcertManager:
         pc.on("connectionstatechange", on_state_change)
         pc.on("icecandidate", on_icecandidate)
 
-    def add_track_to_listener(self, listener_id: str):
-        listener = self.listeners[listener_id]
-
+    def _has_slot(self) -> bool:
+        if self.capacity is not None and len(self.listeners) + self._reserved >= self.capacity:
+            return False
+        return listener_budget.has_room()
+
+    def _take_slot(self):
+        # Held from admission until the listener is registered
+        self._reserved += 1
+        listener_budget.in_use += 1
+        listeners_admitted.inc()
+
+    def _give_back_slot(self):
+        self._reserved -= 1
+        release_slot()
+
+    def admit_waiting(self):
+        while self.waiting and self._has_slot():
+            admitted, outbox = self.waiting.popleft()
+            self._take_slot()
+            admitted.set_result(True)
+            # A stale position must not arrive after this
+            outbox.latest = None
+            outbox.send({"type": "admitted"})
+        if not self.waiting:
+            waiting_rooms.discard(self)
+
+    async def _update_positions(self):
         try:
-            listener["pc"].addTrack(self.relay.subscribe(self.playlist_track))  # type: ignore
-        except Exception as e:
-            print("Failed to add track to listener", listener_id, e)
+            while self.waiting:
+                for position, (_, outbox) in enumerate(self.waiting, 1):
+                    outbox.put_latest(json.dumps({"type": "waiting", "position": position}))
+                await asyncio.sleep(settings.waiting_room_update_seconds)
+        finally:
+            self._positions_task = None
+
+    async def _admit(self, listener: Listener) -> bool:
+        if not self.waiting and self._has_slot():
+            self._take_slot()
+            return True
 
-    async def add_listener(self, listener: Listener):
+        ws = listener["ws"]
+        if len(self.waiting) >= settings.waiting_room_size:
+            listeners_rejected.inc()
+            await ws.close(code=REJECTED_CLOSE_CODE)
+            return False
+
+        admitted = asyncio.get_running_loop().create_future()
+        entry = (admitted, listener["outbox"])
+        self.waiting.append(entry)
+        waiting_rooms.add(self)
+        listeners_queued.inc()
+        if self._positions_task is None:
+            self._positions_task = asyncio.create_task(self._update_positions())
+        else:
+            listener["outbox"].put_latest(
+                json.dumps({"type": "waiting", "position": len(self.waiting)})
+            )
+
+        # Reading is the only way to notice a client leaving while it waits
+        receive = asyncio.ensure_future(ws.receive())
+        handed_over = False
+        try:
+            while not admitted.done():
+                await asyncio.wait({admitted, receive}, return_when=asyncio.FIRST_COMPLETED)
+                if receive.done() and not admitted.done():
+                    if receive.exception() or receive.result()["type"] == "websocket.disconnect":
+                        return False
+                    # Anything sent before admission is ignored, offers included
+                    receive = asyncio.ensure_future(ws.receive())
+            if not admitted.result():
+                await ws.close(code=STOPPED_CLOSE_CODE)
+                return False
+            handed_over = True
+            return True
+        finally:
+            receive.cancel()
+            if not admitted.done():
+                admitted.cancel()
+                self.waiting.remove(entry)
+            elif admitted.result() and not handed_over:
+                # Let in, but cancelled before the caller could register it
+                self._give_back_slot()
+
+    async def add_listener(self, listener: Listener) -> str | None:
+        """
+        Registers a listener once there is room for it in the concert and in
+        this process, holding it in the waiting room until then. Returns None
+        if it never got in.
+        """
         await listener["ws"].accept()
+        listener["outbox"].start()
+
+        if not await self._admit(listener):
+            listener["outbox"].stop()
+            return None
 
         listener_id = str(uuid4())
         self.listeners[listener_id] = listener
+        self._reserved -= 1
 
-        if self.playlist_track:
-            self.add_track_to_listener(listener_id)
+        # Pre-attached, so the client's first offer already negotiates the
+        # audio it will get once the concert is live
+        sender = listener["pc"].addTransceiver("audio", direction="sendonly").sender
+        sender.replaceTrack(ListenerTrack(self))
 
         self.add_pc_handlers(listener_id)
 
+        if is_edge() and self._origin_task is None:
+            self._origin_task = asyncio.create_task(self._follow_origin())
+
         return listener_id
 
     async def remove_listener(self, listener_id: str):
         if listener_id not in self.listeners:
             return
         listener = self.listeners.pop(listener_id)
+        listener["outbox"].stop()
+        release_slot()
+
+        if not self.listeners and not self.waiting and self._origin_task:
+            # Stop pulling the origin's feed with nobody left here to hear it
+            self._origin_task.cancel()
+            self._origin_task = None
 
-        if listener["ws"].application_state == WebSocketState.DISCONNECTED:
-            await listener["ws"].close()
+        ws = listener["ws"]
+        if WebSocketState.DISCONNECTED not in (ws.client_state, ws.application_state):
+            try:
+                await ws.close()
+            except Exception as e:
+                print("Failed to close listener", listener_id, e)
 
         await listener["pc"].close()
 
-    async def send_reaction(self, emoji: str, from_: str):
-        for listener_id, listener in self.listeners.items():
-            if listener_id == from_:
-                continue
-            await listener["ws"].send_json(
-                {
-                    "type": "emoji",
-                    "emoji": emoji,
-                }
-            )
+    def send_reaction(self, emoji):
+        """
+        Counted into the next reactions frame, which reaches the sender too.
+        """
+        self.reactions.record(emoji)
 
     async def receive_offer(self, listener_id: str, data):
         listener = self.listeners[listener_id]
         pc = listener["pc"]
-        ws = listener["ws"]
 
         offer = RTCSessionDescription(sdp=data["sdp"], type="offer")
-        await pc.setRemoteDescription(offer)
-        answer = await pc.createAnswer()
-        await pc.setLocalDescription(answer)
+        async with negotiations:
+            await pc.setRemoteDescription(offer)
+            answer = await pc.createAnswer()
+            await pc.setLocalDescription(answer)
 
-        await ws.send_json(
+        listener["outbox"].send(
             {
                 "type": "answer",
                 "sdp": pc.localDescription.sdp,
@@ -1,18 +1,108 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import Literal
 
 class Settings(BaseSettings):
     secret_key: str = "12345"
+    # Shared by workers, edges and the front-end on /internal, which stays
+    # closed while unset. Never reuse secret_key, it signs user tokens
+    internal_token: str | None = None
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 15
+    user_cache_ttl_seconds: int = 30
+    user_cache_max_entries: int = 10000
+    argon2_time_cost: int = 3
+    argon2_memory_cost: int = 65536
+    argon2_parallelism: int = 4
+    password_hash_workers: int = 4
+    password_hash_max_queue: int = 256
     db_user: str = "user"
     db_pass: str = "password"
     db_host: str = "localhost"
     db_name: str = "mydb"
     db_port: int = 5432
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: int = 30
+    db_pool_pre_ping: bool = True
+    db_statement_timeout_ms: int = 5000
+    # Searches matching more concerts than this are listed upcoming first
+    # rather than ranked, as ranking reads every match
+    search_rank_max_matches: int = 1000
 
     cloudinary_cloud_name: str = ""
     cloudinary_api_key: str = ""
     cloudinary_api_secret: str = ""
+    # Cloudinary needs chunks of at least 5 MB
+    cloudinary_chunk_bytes: int = 6 * 1024 * 1024
+
+    media_storage: Literal["cloudinary", "local"] = "cloudinary"
+    media_dir: str = "app/media"
+    # Local copies of remote media, named by content hash
+    media_cache_dir: str = "media_cache"
+    upload_chunk_bytes: int = 1024 * 1024
+    upload_workers: int = 8
+
+    transcode_workers: int = 2
+    transcode_poll_seconds: int = 5
+    transcode_max_attempts: int = 5
+    # Retries back off from this, doubling every attempt
+    transcode_retry_base_seconds: int = 30
+    # Jobs processing for longer are assumed lost with their process
+    transcode_timeout_seconds: int = 1800
+    # Concerts play every track at this loudness, unless that would push its
+    # true peak over the ceiling
+    loudness_target_lufs: float = -14.0
+    true_peak_ceiling_dbtp: float = -1.0
+
+    prerender_lead_minutes: int = 30
+    concert_schedule_window_hours: int = 24
+    concert_sweep_interval_minutes: int = 10
+    max_concert_managers: int = 1000
+    # Views are held in memory for up to this long, or until this many pile up
+    view_flush_interval_seconds: int = 10
+    view_flush_max_pending: int = 10000
+    response_cache_max_entries: int = 5000
+    response_cache_ttl_seconds: int = 30
+    # "module:Class" of a shared CacheBackend, in-process LRU when unset
+    response_cache_backend: str | None = None
+
+    scheduler_lock_key: int = 4801
+    scheduler_lease_seconds: int = 5
+    scheduler_misfire_grace_seconds: int = 60
+    stream_buffer_frames: int = 50
+    # Reactions are coalesced into one broadcast per tick
+    reaction_tick_ms: int = 100
+    # Signaling messages a listener may leave unread before it is disconnected
+    outbox_max_signaling: int = 64
+    max_concurrent_negotiations: int = 32
+    # Share of a core this process may spend on listeners, and a starting
+    # guess of what one costs until enough are connected to measure it
+    listener_cpu_budget: float = 0.8
+    listener_cpu_cost: float = 0.002
+    listener_cost_min_sample: int = 50
+    listener_budget_interval_seconds: int = 5
+    waiting_room_size: int = 1000
+    waiting_room_update_seconds: int = 2
+    encode_once: bool = True
+    # Passive listeners can follow a concert over HLS instead of WebRTC
+    hls_enabled: bool = True
+    hls_segment_seconds: float = 2.0
+    hls_window_segments: int = 6
+    hls_bit_rate: int = 128000
+    # Segments a front-end keeps for its workers' passive listeners
+    hls_proxy_cache_entries: int = 256
+
+    # Above 0 this process routes concerts to worker processes it spawns. At 0
+    # concerts play from the scheduler leader only, so run a single process
+    concert_workers: int = 0
+    concert_worker_host: str = "127.0.0.1"
+    concert_worker_base_port: int = 8100
+    concert_worker_address: str | None = None
+
+    relay_origin: str | None = None
+    # Processes relaying the same concerts to listeners, origin and edges
+    # alike. Each counts only its own, so admits its share of max_capacity
+    relay_processes: int = 1
 
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8')
 
@@ -1,6 +1,25 @@
 from sqlmodel import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
 from app.config import settings
 
 DB_URL = f"postgresql://{settings.db_user}:{settings.db_pass}@{settings.db_host}:{settings.db_port}/{settings.db_name}"
+ASYNC_DB_URL = f"postgresql+asyncpg://{settings.db_user}:{settings.db_pass}@{settings.db_host}:{settings.db_port}/{settings.db_name}"
 
-engine = create_engine(DB_URL)
+pool_options = dict(
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_pre_ping=settings.db_pool_pre_ping,
+)
+
+engine = create_engine(
+    DB_URL,
+    connect_args={"options": f"-c statement_timeout={settings.db_statement_timeout_ms}"},
+    **pool_options,
+)
+
+async_engine = create_async_engine(
+    ASYNC_DB_URL,
+    connect_args={"server_settings": {"statement_timeout": str(settings.db_statement_timeout_ms)}},
+    **pool_options,
+)
@@ -1,14 +1,35 @@
 from fastapi import Depends, HTTPException, status
 from sqlmodel import select
-from app.models.concert import Concert
-from app.dependencies.db import SessionDep
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.orm import defer, joinedload, selectinload
+from datetime import datetime, timedelta
+from app.config import settings
+from app import metrics
+from app.models.concert import Concert, ConcertSetlistItem
+from app.dependencies.db import AsyncSessionDep
 from app.dependencies.artists import CurrentArtistDep
 from typing import Annotated
 from app.concert_manager import ConcertManager
+from app.admission import capacity_share
+from app.workers import RemoteConcertManager, is_front_end, supervisor
+from app.concert_jobs import schedule_concerts, scheduled_job_ids, start_job_id
+from app.leader import is_leader
+import asyncio
 
-def get_concert(concert_id: int, session: SessionDep) -> Concert:
-    concert = session.exec(
-        select(Concert).where(Concert.id == concert_id)
+# Everything ConcertPublic serializes, an async session cannot lazy load it
+# later. Many-to-one links ride along in a join, the setlist comes in one more
+# query for the whole page, so any page costs two queries.
+concert_public_options = (
+    joinedload(Concert.artist),  # type: ignore
+    selectinload(Concert.setlist_items).joinedload(ConcertSetlistItem.asset),  # type: ignore
+    defer(Concert.search_vector),  # type: ignore
+)
+
+async def get_concert(concert_id: int, session: AsyncSessionDep) -> Concert:
+    concert = (
+        await session.exec(
+            select(Concert).where(Concert.id == concert_id).options(*concert_public_options)
+        )
     ).first()
     if not concert:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Concert not found")
@@ -25,16 +46,75 @@ ArtistConcertDep = Annotated[Concert, Depends(get_artist_concert)]
 
 concert_managers: dict[int, ConcertManager] = {}
 
+managers_created = metrics.counter("concert_managers_created_total")
+managers_evicted = metrics.counter("concert_managers_evicted_total")
+metrics.gauge("concert_managers_live", lambda: sum(m.is_live for m in concert_managers.values()))
+metrics.gauge("concert_managers_idle", lambda: sum(m.is_idle for m in concert_managers.values()))
+
+
+def evict_idle_managers():
+    for concert_id, concert_manager in list(concert_managers.items()):
+        if concert_manager.is_idle:
+            del concert_managers[concert_id]
+            managers_evicted.inc()
+
+
+async def sync_concert_managers(session: AsyncSession):
+    """
+    Drop managers that have finished or have nothing left to do. The scheduler
+    leader also backfills start jobs for concerts entering the scheduling
+    window, which covers concerts created before jobs were persisted.
+    """
+    evict_idle_managers()
+
+    if not is_leader():
+        return
+
+    now = datetime.now()
+    concerts = (
+        await session.exec(
+            select(Concert)
+            .where(Concert.start_time > now)
+            .where(Concert.start_time <= now + timedelta(hours=settings.concert_schedule_window_hours))
+        )
+    ).all()
+
+    # The job store is synchronous, keep it off the event loop. One read of
+    # every job covers the whole window.
+    scheduled = await asyncio.to_thread(scheduled_job_ids)
+    missing = [
+        (concert.id, concert.start_time)
+        for concert in concerts
+        if concert.id is not None and start_job_id(concert.id) not in scheduled
+    ]
+    if missing:
+        await asyncio.to_thread(schedule_concerts, missing)
+
+
+def remote_concert_manager(concert_id: int) -> RemoteConcertManager:
+    address = supervisor.owner(concert_id)
+    if address is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="No concert workers available")
+    return RemoteConcertManager(concert_id, address)
+
+
 # Use the ConcertDep to ensure the concert exists
-def get_concert_manager(concert: ConcertDep, session: SessionDep) -> ConcertManager:
+def get_concert_manager(concert: ConcertDep) -> ConcertManager | RemoteConcertManager:
     assert concert.id is not None
+    if is_front_end():
+        return remote_concert_manager(concert.id)
     if concert.id not in concert_managers:
-        concert_managers[concert.id] = ConcertManager(concert.id, session)
+        if len(concert_managers) >= settings.max_concert_managers:
+            evict_idle_managers()
+        if len(concert_managers) >= settings.max_concert_managers:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many active concerts")
+        concert_managers[concert.id] = ConcertManager(concert.id)
+        managers_created.inc()
+    concert_managers[concert.id].capacity = capacity_share(concert.max_capacity)
     return concert_managers[concert.id]
-ConcertManagerDep = Annotated[ConcertManager, Depends(get_concert_manager)]
+ConcertManagerDep = Annotated[ConcertManager | RemoteConcertManager, Depends(get_concert_manager)]
 
-def get_artist_concert_manager(concert_manager: ConcertManagerDep, artist: CurrentArtistDep) -> ConcertManager:
-    if concert_manager.id != artist.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You do not have permission to access this concert manager")
+# Use the ArtistConcertDep to ensure the artist owns the concert
+def get_artist_concert_manager(concert_manager: ConcertManagerDep, concert: ArtistConcertDep) -> ConcertManager | RemoteConcertManager:
     return concert_manager
-ArtistConcertManagerDep = Annotated[ConcertManager, Depends(get_artist_concert_manager)]
\ No newline at end of file
+ArtistConcertManagerDep = Annotated[ConcertManager | RemoteConcertManager, Depends(get_artist_concert_manager)]
\ No newline at end of file
@@ -1,11 +1,21 @@
-from app.database import engine
+from app.database import engine, async_engine
 from typing import Annotated
 from fastapi import Depends
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 def get_session():
     with Session(engine) as session:
         yield session
     
 
-SessionDep = Annotated[Session, Depends(get_session)]
\ No newline at end of file
+SessionDep = Annotated[Session, Depends(get_session)]
+
+async def get_async_session():
+    # Objects stay usable after commit instead of lazily reloading, which
+    # an async session cannot do
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
@@ -0,0 +1,12 @@
+from fastapi import Header, HTTPException, status
+from app.config import settings
+import secrets
+
+
+def verify_internal_token(x_internal_token: str | None = Header(default=None)):
+    if (
+        settings.internal_token is None
+        or x_internal_token is None
+        or not secrets.compare_digest(x_internal_token, settings.internal_token)
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Internal endpoint")
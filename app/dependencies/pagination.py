@@ -0,0 +1,50 @@
+from fastapi import Depends, HTTPException, Query, status
+from typing import Annotated, Any, Callable
+import base64
+import json
+
+
+def encode_cursor(kind: str, key: list[Any]) -> str:
+    """
+    Opaque token for the next page, holding the sort key of the last item
+    returned so the next query can seek straight past it.
+    """
+    payload = json.dumps({"s": kind, "k": key}, default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def get_cursor(cursor: Annotated[str | None, Query()] = None) -> dict | None:
+    if cursor is None:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(payload, dict) or not isinstance(payload.get("k"), list):
+            raise ValueError
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return payload
+
+
+CursorDep = Annotated[dict | None, Depends(get_cursor)]
+
+
+def cursor_key(
+    cursor: dict | None, kind: str, *parsers: Callable[[Any], Any]
+) -> list[Any] | None:
+    """
+    Unpacks the sort key from a cursor made for the given sort order, parsing
+    each part back into the type of its column.
+    """
+    if cursor is None:
+        return None
+    key = cursor["k"]
+    if cursor.get("s") != kind or len(key) != len(parsers):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor belongs to a different sort order",
+        )
+    try:
+        return [parse(value) for parse, value in zip(parsers, key)]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
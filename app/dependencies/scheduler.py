@@ -1,10 +1,19 @@
 from fastapi import Depends
 from typing import Annotated
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from app.config import settings
+from app.database import engine
 
-scheduler = AsyncIOScheduler()
+scheduler = AsyncIOScheduler(
+    jobstores={"default": SQLAlchemyJobStore(engine=engine)},
+    job_defaults={
+        "coalesce": True,
+        "misfire_grace_time": settings.scheduler_misfire_grace_seconds,
+    },
+)
 
 def get_scheduler():
     return scheduler
 
-SchedulerDep = Annotated[AsyncIOScheduler, Depends(get_scheduler)]
\ No newline at end of file
+SchedulerDep = Annotated[AsyncIOScheduler, Depends(get_scheduler)]
@@ -3,14 +3,55 @@ from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from typing import Annotated
 from app.config import settings
-from app.dependencies.db import SessionDep
+from app.dependencies.db import AsyncSessionDep
 from app.models.user import User
+from app.models.artist import Artist
+from app.ttl_cache import TTLCache
+from app import metrics
 from sqlmodel import select
+from sqlalchemy.orm import selectinload
 import jwt
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_current_user(session: SessionDep, access_token: str | None = Cookie(default=None)):
+# Resolved users with their artist, keyed by both ("uid", id) and
+# ("sub", username) so either kind of token hits the same entry. Holds
+# detached copies, see detached_user
+user_cache: TTLCache[User] = TTLCache(
+    settings.user_cache_max_entries, settings.user_cache_ttl_seconds
+)
+user_cache_hits = metrics.counter("user_cache_hits_total")
+user_cache_misses = metrics.counter("user_cache_misses_total")
+metrics.gauge("user_cache_entries", lambda: len(user_cache))
+
+
+def detached_user(user: User) -> User:
+    """
+    A copy of a loaded user and their artist that belongs to no session. The
+    loaded instance expires with its session, on a rollback for one, and
+    would then fail every later request it was cached for.
+    """
+    copy = User(**user.model_dump())
+    if user.artist is not None:
+        copy.artist = Artist(**user.artist.model_dump())
+    return copy
+
+
+def cache_user(user: User):
+    user_cache.set(("uid", user.id), user)
+    user_cache.set(("sub", user.username), user)
+
+
+def invalidate_user(user: User):
+    """
+    Call whenever a user or their artist changes. Other processes only see
+    the change once their entry expires.
+    """
+    user_cache.delete(("uid", user.id))
+    user_cache.delete(("sub", user.username))
+
+
+async def get_current_user(session: AsyncSessionDep, access_token: str | None = Cookie(default=None)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -23,15 +64,33 @@ def get_current_user(session: SessionDep, access_token: str | None = Cookie(defa
     try:
         payload = jwt.decode(access_token, settings.secret_key, algorithms=[settings.algorithm])
         username = payload.get("sub")
+        user_id = payload.get("uid")
         if username is None:
             raise credentials_exception
     except InvalidTokenError:
         raise credentials_exception
-    
-    user = session.exec(select(User).where(User.username == username)).first()
+
+    # Tokens issued before the uid claim existed fall back to the username
+    key = ("uid", user_id) if user_id is not None else ("sub", username)
+    user = user_cache.get(key)
+    if user is not None:
+        user_cache_hits.inc()
+        return user
+    user_cache_misses.inc()
+
+    # The artist is loaded up front for get_current_artist
+    query = select(User).options(selectinload(User.artist))  # type: ignore
+    if user_id is not None:
+        query = query.where(User.id == user_id)
+    else:
+        query = query.where(User.username == username)
+    user = (await session.exec(query)).first()
     if user is None:
         raise credentials_exception
-    
+
+    # Handed out too, so a hit and a miss behave the same
+    user = detached_user(user)
+    cache_user(user)
     return user
 
 CurrentUserDep = Annotated[User, Depends(get_current_user)]
\ No newline at end of file
@@ -0,0 +1,53 @@
+from aiortc import MediaStreamTrack
+from aiortc.codecs.opus import OpusEncoder, TIME_BASE
+from av.packet import Packet
+from collections import deque
+import weakref
+import asyncio
+import time
+
+# Every encoder in this process, so admission can account for their CPU
+encoders: "weakref.WeakSet[OpusEncodedTrack]" = weakref.WeakSet()
+
+
+class OpusEncodedTrack(MediaStreamTrack):
+    """
+    Encodes the frames of a source track to Opus once, yielding packets that
+    every RTCRtpSender can packetize as-is instead of encoding them again.
+    """
+
+    kind = "audio"
+
+    def __init__(self, source: MediaStreamTrack):
+        super().__init__()
+        self.source = source
+        self.encoder = OpusEncoder()
+        self._pending: deque[Packet] = deque()
+        # Share of a core spent encoding, smoothed over recent frames
+        self.encode_load = 0.0
+        encoders.add(self)
+
+    async def recv(self) -> Packet:
+        while not self._pending:
+            frame = await self.source.recv()
+            payloads, timestamp = await asyncio.to_thread(self.encode, frame)
+
+            for payload in payloads:
+                packet = Packet(payload)
+                packet.pts = timestamp
+                packet.time_base = TIME_BASE
+                self._pending.append(packet)
+                timestamp += frame.samples
+
+        return self._pending.popleft()
+
+    def encode(self, frame):
+        started_at = time.thread_time()
+        result = self.encoder.encode(frame)
+        load = (time.thread_time() - started_at) / (frame.samples / frame.sample_rate)
+        self.encode_load = 0.9 * self.encode_load + 0.1 * load
+        return result
+
+    def stop(self):
+        super().stop()
+        self.source.stop()
@@ -0,0 +1,162 @@
+from collections import deque
+from dataclasses import dataclass
+from fractions import Fraction
+from aiortc import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from av import AudioFrame, AudioResampler
+from app.config import settings
+from app.transcode import CANONICAL_SAMPLE_RATE
+from app import metrics
+import asyncio
+import math
+import uuid
+import io
+import av
+
+PLAYLIST_NAME = "playlist.m3u8"
+PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+SEGMENT_CONTENT_TYPE = "video/mp2t"
+# Short enough for players to see each new segment in time
+PLAYLIST_MAX_AGE = 1
+
+# Segments stay fetchable for a while after leaving the playlist, for
+# clients that loaded it just before
+RETAINED_SEGMENTS = 4
+
+TIME_BASE = Fraction(1, CANONICAL_SAMPLE_RATE)
+
+segments_produced = metrics.counter("hls_segments_produced_total")
+segment_encode_time = metrics.histogram("hls_segment_encode_seconds", [0.01, 0.05, 0.1, 0.25, 0.5, 1])
+
+
+@dataclass
+class Segment:
+    name: str
+    duration: float
+    data: bytes
+
+
+def create_encoder() -> av.AudioCodecContext:
+    encoder = av.CodecContext.create("aac", "w")
+    encoder.sample_rate = CANONICAL_SAMPLE_RATE
+    encoder.layout = "stereo"
+    encoder.format = "fltp"
+    encoder.bit_rate = settings.hls_bit_rate
+    encoder.time_base = TIME_BASE
+    encoder.open()
+    return encoder
+
+
+class HlsSegmenter:
+    """
+    Encodes a concert's audio to AAC once and cuts it into MPEG-TS segments
+    behind a rolling playlist. Segments and playlist are kept as bytes, so
+    passive listeners cost a lookup each and nothing grows with their number.
+    """
+
+    def __init__(self, source: MediaStreamTrack):
+        self.source = source
+        self.encoder = create_encoder()
+        self.resampler = AudioResampler(format="fltp", layout="stereo", rate=CANONICAL_SAMPLE_RATE)
+        self.samples_in = 0
+        # Segment names differ between runs, so caches never mix two of them
+        self.run = uuid.uuid4().hex[:8]
+        self.sequence = 0
+        self.segments: deque[Segment] = deque(
+            maxlen=settings.hls_window_segments + RETAINED_SEGMENTS
+        )
+        self.ended = False
+        self.playlist = self._render_playlist()
+        self.task: asyncio.Task | None = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.source.stop()
+
+    def segment(self, name: str) -> Segment | None:
+        return next((segment for segment in self.segments if segment.name == name), None)
+
+    async def _run(self):
+        segment_samples = int(settings.hls_segment_seconds * CANONICAL_SAMPLE_RATE)
+        frames: list[AudioFrame] = []
+        samples = 0
+        try:
+            while True:
+                frame = await self.source.recv()
+                frames.append(frame)
+                samples += frame.samples
+                if samples >= segment_samples:
+                    await self._cut(frames)
+                    frames, samples = [], 0
+        except MediaStreamError:
+            await self._cut(frames, last=True)
+            self.ended = True
+            self.playlist = self._render_playlist()
+
+    async def _cut(self, frames: list[AudioFrame], last: bool = False):
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        data, duration = await asyncio.to_thread(self._encode_segment, frames, last)
+        segment_encode_time.observe(loop.time() - started_at)
+        if not data:
+            return
+
+        self.segments.append(Segment(f"segment-{self.run}-{self.sequence}.ts", duration, data))
+        self.sequence += 1
+        self.playlist = self._render_playlist()
+        segments_produced.inc()
+
+    def _encode_segment(self, frames: list[AudioFrame], last: bool) -> tuple[bytes, float]:
+        """
+        One encoder runs across every segment, so there are no priming gaps
+        at the boundaries. Each segment gets a muxer of its own, keeping the
+        encoder's timestamps so players see one continuous stream.
+        """
+        packets = []
+        samples_before = self.samples_in
+        for frame in [*frames, None] if last else frames:
+            for out in self.resampler.resample(frame):
+                out.pts = self.samples_in
+                out.time_base = TIME_BASE
+                self.samples_in += out.samples
+                packets.extend(self.encoder.encode(out))
+        if last:
+            # A stream ending on a segment boundary leaves nothing for the
+            # last one but the encoder's flush, which doesn't decode alone
+            if self.samples_in - samples_before < self.encoder.frame_size:
+                return b"", 0.0
+            packets.extend(self.encoder.encode(None))
+        if not packets:
+            return b"", 0.0
+
+        buffer = io.BytesIO()
+        with av.open(buffer, "w", format="mpegts", options={"mpegts_copyts": "1"}) as output:
+            stream = output.add_stream("aac", rate=CANONICAL_SAMPLE_RATE, layout="stereo")
+            for packet in packets:
+                packet.stream = stream
+                output.mux(packet)
+
+        # Every AAC packet carries one encoder frame of samples
+        return buffer.getvalue(), len(packets) * self.encoder.frame_size / CANONICAL_SAMPLE_RATE
+
+    def _render_playlist(self) -> bytes:
+        window = list(self.segments)[-settings.hls_window_segments :]
+        target = max((math.ceil(segment.duration) for segment in window), default=0)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{max(target, math.ceil(settings.hls_segment_seconds))}",
+            f"#EXT-X-MEDIA-SEQUENCE:{self.sequence - len(window)}",
+        ]
+        for segment in window:
+            lines.append(f"#EXTINF:{segment.duration:.3f},")
+            lines.append(segment.name)
+        if self.ended:
+            lines.append("#EXT-X-ENDLIST")
+        return ("\n".join(lines) + "\n").encode()
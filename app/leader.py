@@ -0,0 +1,101 @@
+from sqlalchemy import Connection, text
+from app.config import settings
+from app.database import engine
+from app.dependencies.scheduler import get_scheduler
+from app.workers import is_front_end
+import asyncio
+
+
+class LeaderLease:
+    """
+    Leadership is a Postgres advisory lock held on a dedicated connection.
+    The lock is released by the server as soon as that connection drops, so a
+    crashed leader cannot keep other processes from taking over.
+    """
+
+    def __init__(self, key: int):
+        self.key = key
+        self.connection: Connection | None = None
+
+    @property
+    def held(self) -> bool:
+        return self.connection is not None
+
+    def try_acquire(self) -> bool:
+        connection = engine.connect()
+        acquired = connection.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}
+        ).scalar()
+        connection.commit()
+
+        if acquired:
+            self.connection = connection
+        else:
+            connection.close()
+        return bool(acquired)
+
+    def check(self) -> bool:
+        assert self.connection is not None
+        try:
+            self.connection.execute(text("SELECT 1"))
+            self.connection.commit()
+            return True
+        except Exception:
+            self.connection.invalidate()
+            self.connection = None
+            return False
+
+    def release(self):
+        if self.connection is None:
+            return
+        try:
+            self.connection.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": self.key}
+            )
+            self.connection.commit()
+        finally:
+            self.connection.close()
+            self.connection = None
+
+
+lease = LeaderLease(settings.scheduler_lock_key)
+
+
+def is_leader() -> bool:
+    return lease.held
+
+
+async def lead_scheduler():
+    """
+    Keep trying to become the scheduler leader. Only the leader runs jobs, every
+    other process keeps its scheduler paused and just writes jobs to the store.
+    """
+    scheduler = get_scheduler()
+    warned = False
+    try:
+        while True:
+            try:
+                if lease.held:
+                    if not await asyncio.to_thread(lease.check):
+                        print("Lost scheduler leadership")
+                        scheduler.pause()
+                    else:
+                        # The scheduler only rereads the store for jobs this
+                        # process added, others' would wait for the next known one
+                        scheduler.wakeup()
+                elif await asyncio.to_thread(lease.try_acquire):
+                    print("Acquired scheduler leadership")
+                    scheduler.resume()
+                elif not is_front_end() and not warned:
+                    warned = True
+                    print(
+                        "Another process leads the scheduler, concerts only play to "
+                        "listeners of that process unless concert_workers is set"
+                    )
+            except Exception as e:
+                print("Scheduler leader election failed", e)
+
+            await asyncio.sleep(settings.scheduler_lease_seconds)
+    finally:
+        scheduler.pause()
+        await asyncio.to_thread(lease.release)
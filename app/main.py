@@ -1,9 +1,12 @@
 from fastapi import FastAPI
 from app import models
-from app.routers import concerts, users, authentication
+from app.routers import concerts, users, authentication, internal, artists, media
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 from app.dependencies.scheduler import get_scheduler
+from app.workers import is_front_end, is_worker, is_edge, require_internal_token, supervisor
+from app.leader import lead_scheduler
+from app.transcode_queue import transcode_queue
 import asyncio
 
 MAIN_LOOP = None
@@ -11,10 +14,30 @@ MAIN_LOOP = None
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global MAIN_LOOP
+    require_internal_token()
     MAIN_LOOP = asyncio.get_running_loop()
     scheduler = get_scheduler()
-    scheduler.start()
+    # Paused until this process wins the leader election, jobs can still be added
+    scheduler.start(paused=True)
+    leader_task = None
+    transcode_task = None
+    if not is_worker() and not is_edge():
+        leader_task = asyncio.create_task(lead_scheduler())
+        transcode_task = asyncio.create_task(transcode_queue.run())
+    if is_front_end():
+        await supervisor.start()
     yield
+    if is_front_end():
+        await supervisor.stop()
+    if leader_task:
+        leader_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await leader_task
+    if transcode_task:
+        transcode_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await transcode_task
+        transcode_queue.shutdown()
     scheduler.shutdown()
 
 app = FastAPI(lifespan=lifespan)
@@ -34,4 +57,7 @@ app.add_middleware(
 
 app.include_router(users.router)
 app.include_router(authentication.router)
-app.include_router(concerts.router)
\ No newline at end of file
+app.include_router(concerts.router)
+app.include_router(internal.router)
+app.include_router(artists.router)
+app.include_router(media.router)
\ No newline at end of file
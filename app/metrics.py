@@ -0,0 +1,62 @@
+from typing import Callable
+import bisect
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+
+class Histogram:
+    def __init__(self, buckets: list[float]):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        return {
+            "buckets": {
+                **{str(le): count for le, count in zip(self.buckets, self.counts)},
+                "+Inf": self.counts[-1],
+            },
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+
+counters: dict[str, Counter] = {}
+histograms: dict[str, Histogram] = {}
+gauges: dict[str, Callable[[], float]] = {}
+
+
+def counter(name: str) -> Counter:
+    if name not in counters:
+        counters[name] = Counter()
+    return counters[name]
+
+
+def histogram(name: str, buckets: list[float]) -> Histogram:
+    if name not in histograms:
+        histograms[name] = Histogram(buckets)
+    return histograms[name]
+
+
+def gauge(name: str, read: Callable[[], float]):
+    gauges[name] = read
+
+
+def snapshot() -> dict:
+    return {
+        "counters": {name: c.value for name, c in counters.items()},
+        "gauges": {name: read() for name, read in gauges.items()},
+        "histograms": {name: h.snapshot() for name, h in histograms.items()},
+    }
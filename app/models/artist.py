@@ -1,5 +1,6 @@
+from datetime import datetime as dt
 from typing import Optional, List, TYPE_CHECKING
-from sqlmodel import SQLModel, Field, Relationship
+from sqlmodel import SQLModel, Field, Relationship, Index, UniqueConstraint, BigInteger
 from app.models.pagination import PaginatedResponse
 
 if TYPE_CHECKING:
@@ -18,6 +19,25 @@ class Artist(ArtistBase, table=True):
 class ArtistPublic(ArtistBase):
     id: int
 
+TRANSCODE_PENDING = "pending"
+TRANSCODE_PROCESSING = "processing"
+TRANSCODE_READY = "ready"
+TRANSCODE_FAILED = "failed"
+
+# Filled in by a successful transcode, and shared by assets with the same content
+TRANSCODE_FIELDS = ("transcoded_url", "integrated_loudness", "true_peak", "peaks_url")
+
+class MediaBlob(SQLModel, table=True):
+    """
+    One stored copy of an uploaded file, shared by every asset with the same content.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    content_hash: str = Field(unique=True)
+    url: str
+    size: int = Field(sa_type=BigInteger)
+
+    assets: List["MediaAsset"] = Relationship(back_populates="blob")
+
 class MediaAssetBase(SQLModel):
     duration: int
     codec: str
@@ -35,8 +55,34 @@ class MediaAsset(MediaAssetBase, table=True):
     artist_id: int = Field(foreign_key="artist.id")
     artist: "Artist" = Relationship(back_populates="assets")
 
+    # Unset on assets uploaded before deduplication
+    blob_id: Optional[int] = Field(default=None, foreign_key="mediablob.id")
+    blob: Optional[MediaBlob] = Relationship(back_populates="assets")
+
+    # Transcode job state, see app/transcode_queue.py
+    transcode_status: str = Field(default=TRANSCODE_PENDING)
+    transcoded_url: Optional[str] = None
+    transcode_attempts: int = Field(default=0)
+    transcode_error: Optional[str] = None
+    transcode_available_at: Optional[dt] = None
+    transcode_started_at: Optional[dt] = None
+
+    # Analysis of the transcoded audio, see app/audio_analysis.py
+    integrated_loudness: Optional[float] = None
+    true_peak: Optional[float] = None
+    peaks_url: Optional[str] = None
+
+    __table_args__ = (
+        Index("ix_mediaasset_artist_id_id", "artist_id", "id"),
+        Index("ix_mediaasset_transcode_queue", "transcode_status", "transcode_available_at"),
+        UniqueConstraint("artist_id", "blob_id", name="unique_artist_blob"),
+    )
+
 class MediaAssetPublic(MediaAssetBase):
     id: int
+    transcode_status: str
+    integrated_loudness: Optional[float] = None
+    true_peak: Optional[float] = None
 
 class PaginatedMediaAssets(PaginatedResponse[MediaAssetPublic]):
     pass
\ No newline at end of file
@@ -1,6 +1,7 @@
 from datetime import datetime as dt, timedelta
 from typing import Optional, List, TYPE_CHECKING
-from sqlmodel import SQLModel, Field, Relationship, UniqueConstraint
+from sqlmodel import SQLModel, Field, Relationship, UniqueConstraint, Column, Computed, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from pydantic import BaseModel
 from app.models.pagination import PaginatedResponse
 
@@ -42,7 +43,7 @@ class ConcertSetlistItemPublic(ConcertSetlistItemBase):
 
 
 class ConcertSetlistItemCreate(ConcertSetlistItemBase):
-    pass
+    asset_id: int
 
 
 class ConcertBase(SQLModel):
@@ -63,6 +64,26 @@ class Concert(ConcertBase, table=True):
     setlist_items: List["ConcertSetlistItem"] = Relationship(back_populates="concert")
     popularity: int = Field(default=0)
 
+    # Maintained by Postgres for discover's full-text search, names rank above descriptions
+    search_vector: Optional[str] = Field(
+        default=None,
+        sa_column=Column(
+            TSVECTOR,
+            Computed(
+                "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+                "setweight(to_tsvector('english', coalesce(description, '')), 'B')",
+                persisted=True,
+            ),
+        ),
+    )
+
+    __table_args__ = (
+        Index("ix_concert_search_vector", "search_vector", postgresql_using="gin"),
+        # Keyset pagination for discover's upcoming and popularity orders
+        Index("ix_concert_start_time_id", "start_time", "id"),
+        Index("ix_concert_popularity_id", "popularity", "id"),
+    )
+
 
 class ConcertUpdate(SQLModel):
     name: str | None = None
@@ -83,6 +104,7 @@ class PaginatedConcerts(PaginatedResponse[ConcertPublic]):
     pass
 
 
-from app.models.artist import ArtistPublic
+from app.models.artist import ArtistPublic, MediaAssetPublic
 
+ConcertSetlistItemPublic.model_rebuild()
 ConcertPublic.model_rebuild()
@@ -1,4 +1,4 @@
-from typing import TypeVar, Generic, List
+from typing import TypeVar, Generic, List, Optional
 from sqlmodel import SQLModel
 
 T = TypeVar("T", bound=SQLModel)
@@ -8,4 +8,6 @@ class PaginatedResponse(SQLModel, Generic[T]):
     A generic response model for paginated lists of any SQLModel type.
     """
     # The list of items, where T can be Concert, MediaAsset, etc.
-    items: List[T]
\ No newline at end of file
+    items: List[T]
+    # Pass back as ?cursor= for the next page, None on the last page
+    next_cursor: Optional[str] = None
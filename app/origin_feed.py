@@ -0,0 +1,50 @@
+from aiortc import MediaStreamTrack
+from aiortc.codecs.opus import TIME_BASE
+from aiortc.mediastreams import MediaStreamError
+from av.packet import Packet
+from websockets.asyncio.client import ClientConnection
+from websockets.exceptions import ConnectionClosed
+
+PTS_BYTES = 8
+# Sent by the origin when the concert is over, so the edge stops reconnecting
+CONCERT_ENDED_CLOSE_CODE = 4000
+# Sent by the origin once the concert is live, ahead of the first packet
+FEED_READY_MESSAGE = "ready"
+
+
+def pack_feed_packet(packet: Packet) -> bytes:
+    assert packet.pts is not None
+    return packet.pts.to_bytes(PTS_BYTES, "big", signed=True) + bytes(packet)
+
+
+def unpack_feed_packet(message: bytes) -> Packet:
+    packet = Packet(message[PTS_BYTES:])
+    packet.pts = int.from_bytes(message[:PTS_BYTES], "big", signed=True)
+    packet.time_base = TIME_BASE
+    return packet
+
+
+class OriginFeedTrack(MediaStreamTrack):
+    """
+    Replays the Opus packets an origin node forwards over its concert feed,
+    so an edge can relay them to its own listeners without re-encoding.
+    """
+
+    kind = "audio"
+
+    def __init__(self, connection: ClientConnection):
+        super().__init__()
+        self.connection = connection
+
+    async def recv(self) -> Packet:
+        if self.readyState != "live":
+            raise MediaStreamError
+
+        try:
+            message = await self.connection.recv()
+        except ConnectionClosed:
+            self.stop()
+            raise MediaStreamError
+
+        assert isinstance(message, bytes)
+        return unpack_feed_packet(message)
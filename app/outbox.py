@@ -0,0 +1,112 @@
+from collections import deque
+from fastapi import WebSocket
+from app.config import settings
+from app import metrics
+import weakref
+import asyncio
+import json
+import time
+
+WRITE_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5]
+
+# Policy violation: the client stopped reading its signaling messages
+OVERFLOW_CLOSE_CODE = 1008
+
+frames_dropped = metrics.counter("outbox_frames_dropped_total")
+overflows = metrics.counter("outbox_overflows_total")
+write_time = metrics.histogram("outbox_write_seconds", WRITE_BUCKETS)
+
+outboxes: "weakref.WeakSet[Outbox]" = weakref.WeakSet()
+
+
+class Outbox:
+    """
+    Messages waiting to go out on one listener's websocket, written by a task
+    of its own so a slow socket only ever holds up itself.
+
+    Signaling goes first, through a bounded queue: a client that lets it fill
+    up is disconnected, as it could not complete a negotiation anyway.
+    Reactions only ever keep the latest frame, one still waiting when another
+    arrives is dropped.
+    """
+
+    def __init__(self, ws: WebSocket):
+        self.ws = ws
+        self.signaling: deque[str] = deque()
+        self.latest: str | None = None
+        self.ready = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.overflowed = False
+        outboxes.add(self)
+
+    @property
+    def depth(self) -> int:
+        return len(self.signaling) + (self.latest is not None)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._write())
+
+    def send(self, message: dict):
+        if self.overflowed:
+            return
+        if len(self.signaling) >= settings.outbox_max_signaling:
+            overflows.inc()
+            self.overflowed = True
+            self.signaling.clear()
+            self.latest = None
+        else:
+            self.signaling.append(json.dumps(message))
+        self.ready.set()
+
+    def put_latest(self, frame: str):
+        if self.overflowed:
+            return
+        if self.latest is not None:
+            frames_dropped.inc()
+        self.latest = frame
+        self.ready.set()
+
+    def _next_frame(self) -> str | None:
+        if self.signaling:
+            return self.signaling.popleft()
+        frame, self.latest = self.latest, None
+        return frame
+
+    async def _write(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+
+            if self.overflowed:
+                # The receive loop then sees the disconnect and removes the listener
+                try:
+                    await self.ws.close(code=OVERFLOW_CLOSE_CODE)
+                except Exception as e:
+                    print("Failed to close overflowing listener", e)
+                return
+
+            while (frame := self._next_frame()) is not None:
+                started_at = time.perf_counter()
+                try:
+                    await self.ws.send_text(frame)
+                except Exception as e:
+                    # The receive loop notices the disconnect and removes the listener
+                    print("Failed to write to listener", e)
+                    return
+                write_time.observe(time.perf_counter() - started_at)
+
+                # Overflow found while this write was blocked
+                if self.overflowed:
+                    self.ready.set()
+                    break
+
+    def stop(self):
+        outboxes.discard(self)
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+metrics.gauge("outbox_queued_frames", lambda: sum(outbox.depth for outbox in outboxes))
+metrics.gauge("outbox_max_depth", lambda: max((outbox.depth for outbox in outboxes), default=0))
@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, status
+from pwdlib import PasswordHash
+from pwdlib.hashers.argon2 import Argon2Hasher
+from app.config import settings
+from app import metrics
+import asyncio
+import time
+
+password_hash = PasswordHash(
+    (
+        Argon2Hasher(
+            time_cost=settings.argon2_time_cost,
+            memory_cost=settings.argon2_memory_cost,
+            parallelism=settings.argon2_parallelism,
+        ),
+    )
+)
+
+# argon2-cffi releases the GIL while hashing, so threads run in parallel
+executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers, thread_name_prefix="password-hash"
+)
+
+SECONDS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+
+in_flight = 0
+queue_wait = metrics.histogram("password_hash_queue_seconds", SECONDS_BUCKETS)
+hash_time = metrics.histogram("password_hash_seconds", SECONDS_BUCKETS)
+rejected = metrics.counter("password_hash_rejected_total")
+rehashed = metrics.counter("password_rehashed_total")
+metrics.gauge("password_hash_in_flight", lambda: in_flight)
+metrics.gauge(
+    "password_hash_queued", lambda: max(in_flight - settings.password_hash_workers, 0)
+)
+
+
+async def run_hasher(fn, *args):
+    """
+    Run an Argon2 call on the hashing pool, shedding load once the queue is full
+    so a login burst cannot pile up unbounded work.
+    """
+    global in_flight
+
+    if in_flight >= settings.password_hash_workers + settings.password_hash_max_queue:
+        rejected.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    queued_at = time.perf_counter()
+
+    def timed():
+        started_at = time.perf_counter()
+        queue_wait.observe(started_at - queued_at)
+        try:
+            return fn(*args)
+        finally:
+            hash_time.observe(time.perf_counter() - started_at)
+
+    in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, timed)
+    finally:
+        in_flight -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await run_hasher(password_hash.hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """
+    Returns whether the password matches, and a new hash to store if the
+    current one was made with outdated Argon2 parameters.
+    """
+    valid, updated_hash = await run_hasher(
+        password_hash.verify_and_update, password, hashed_password
+    )
+    if updated_hash is not None:
+        rehashed.inc()
+    return valid, updated_hash
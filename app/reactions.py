@@ -0,0 +1,68 @@
+from collections import Counter
+from typing import Callable, Iterable
+from app.config import settings
+from app.outbox import Outbox
+from app import metrics
+import asyncio
+import json
+
+# Caps what one tick can accumulate, whatever clients send
+MAX_EMOJI_LENGTH = 16
+MAX_DISTINCT_EMOJIS = 64
+
+reactions_received = metrics.counter("reactions_received_total")
+reactions_rejected = metrics.counter("reactions_rejected_total")
+reaction_broadcasts = metrics.counter("reaction_broadcasts_total")
+
+
+class ReactionAggregator:
+    """
+    Coalesces a concert's reactions into counts per emoji, broadcast once a
+    tick as a single frame, so the work per tick grows with the audience and
+    not with how fast it reacts.
+    """
+
+    def __init__(self, outboxes: Callable[[], Iterable[Outbox]]):
+        self.outboxes = outboxes
+        self.counts: Counter[str] = Counter()
+        self.task: asyncio.Task | None = None
+
+    def record(self, emoji):
+        if (
+            not isinstance(emoji, str)
+            or not emoji
+            or len(emoji) > MAX_EMOJI_LENGTH
+            or (emoji not in self.counts and len(self.counts) >= MAX_DISTINCT_EMOJIS)
+        ):
+            reactions_rejected.inc()
+            return
+
+        reactions_received.inc()
+        self.counts[emoji] += 1
+        if self.task is None:
+            self.task = asyncio.create_task(self._tick())
+
+    def flush(self):
+        if not self.counts:
+            return
+        # Serialized once, every listener gets the same bytes
+        frame = json.dumps({"type": "reactions", "counts": dict(self.counts)})
+        self.counts.clear()
+        for outbox in self.outboxes():
+            outbox.put_latest(frame)
+        reaction_broadcasts.inc()
+
+    async def _tick(self):
+        try:
+            # Runs only while reactions keep coming, idle concerts have no task
+            while self.counts:
+                await asyncio.sleep(settings.reaction_tick_ms / 1000)
+                self.flush()
+        finally:
+            self.task = None
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.counts.clear()
@@ -0,0 +1,140 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from fastapi import Request, Response, status
+from app.config import settings
+from app.ttl_cache import TTLCache
+from app import metrics
+from urllib.parse import urlencode
+import importlib
+import hashlib
+
+DISCOVER_TAG = "discover"
+
+cache_hits = metrics.counter("response_cache_hits_total")
+cache_misses = metrics.counter("response_cache_misses_total")
+not_modified = metrics.counter("response_cache_not_modified_total")
+
+
+def concert_tag(concert_id: int) -> str:
+    return f"concert:{concert_id}"
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+
+
+class CacheBackend(ABC):
+    """
+    Storage for cached responses. Every tag has a generation that invalidation
+    bumps, so a response rendered from rows read before an invalidation is
+    never stored after it.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> CachedResponse | None: ...
+
+    @abstractmethod
+    async def generations(self, tags: list[str]) -> list[int]: ...
+
+    @abstractmethod
+    async def set(
+        self, key: str, value: CachedResponse, tags: list[str], generations: list[int]
+    ): ...
+
+    @abstractmethod
+    async def invalidate(self, tags: list[str]): ...
+
+
+class MemoryBackend(CacheBackend):
+    """
+    Per-process LRU. Invalidations only reach the process that made them, so
+    run a shared backend when serving from several processes.
+    """
+
+    def __init__(self):
+        self.entries: TTLCache[CachedResponse] = TTLCache(
+            settings.response_cache_max_entries, settings.response_cache_ttl_seconds
+        )
+        self.tag_keys: dict[str, set[str]] = {}
+        self.tag_generations: dict[str, int] = {}
+
+    async def get(self, key: str) -> CachedResponse | None:
+        return self.entries.get(key)
+
+    async def generations(self, tags: list[str]) -> list[int]:
+        return [self.tag_generations.get(tag, 0) for tag in tags]
+
+    async def set(
+        self, key: str, value: CachedResponse, tags: list[str], generations: list[int]
+    ):
+        if await self.generations(tags) != generations:
+            return
+        self.entries.set(key, value)
+        for tag in tags:
+            keys = self.tag_keys.setdefault(tag, set())
+            keys.add(key)
+            # Forget keys the LRU has since evicted
+            if len(keys) > 2 * self.entries.max_entries:
+                keys.intersection_update(self.entries.entries.keys())
+
+    async def invalidate(self, tags: list[str]):
+        for tag in tags:
+            self.tag_generations[tag] = self.tag_generations.get(tag, 0) + 1
+            for key in self.tag_keys.pop(tag, set()):
+                self.entries.delete(key)
+
+
+def load_backend() -> CacheBackend:
+    if settings.response_cache_backend is None:
+        return MemoryBackend()
+    module, name = settings.response_cache_backend.split(":")
+    return getattr(importlib.import_module(module), name)()
+
+
+backend = load_backend()
+
+
+def cache_key(request: Request) -> str:
+    """
+    The path plus its query parameters in a fixed order, so equivalent URLs
+    share an entry. Parameters are encoded again so a value containing "&" or
+    "=" can't pass for several parameters.
+    """
+    params = sorted((k, v) for k, v in request.query_params.multi_items() if v != "")
+    return request.url.path + "?" + urlencode(params)
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def to_response(request: Request, cached: CachedResponse) -> Response:
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if cached.etag in (tag.strip() for tag in if_none_match.split(",")):
+        not_modified.inc()
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
+
+
+async def cached_response(request: Request) -> Response | None:
+    cached = await backend.get(cache_key(request))
+    if cached is None:
+        cache_misses.inc()
+        return None
+    cache_hits.inc()
+    return to_response(request, cached)
+
+
+async def store_response(
+    request: Request, body: bytes, tags: list[str], generations: list[int]
+) -> Response:
+    cached = CachedResponse(body, etag_for(body))
+    await backend.set(cache_key(request), cached, tags, generations)
+    return to_response(request, cached)
+
+
+async def invalidate_concert(concert_id: int):
+    await backend.invalidate([concert_tag(concert_id), DISCOVER_TAG])
@@ -1,70 +1,230 @@
 from fastapi import APIRouter, UploadFile, HTTPException, Query, status
-from app.models.artist import MediaAsset, PaginatedMediaAssets, MediaAssetPublic
+from fastapi.responses import FileResponse
+from app.models.artist import (
+    MediaAsset,
+    MediaBlob,
+    PaginatedMediaAssets,
+    MediaAssetPublic,
+    TRANSCODE_FIELDS,
+    TRANSCODE_READY,
+)
 from app.dependencies.artists import CurrentArtistDep
-from app.dependencies.db import SessionDep
-from app.storage import upload, audio_content_types
-from sqlmodel import select
+from app.dependencies.db import AsyncSessionDep
+from app.dependencies.pagination import CursorDep, cursor_key, encode_cursor
+from app.storage import (
+    audio_content_types,
+    audio_extensions,
+    backend_for,
+    hash_file,
+    local_path,
+    run_upload,
+    storage,
+)
+from app.audio_probe import AUDIO_METADATA_FIELDS, probe_audio
+from app.transcode_queue import transcode_queue
+from app import metrics
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import select, col
 
 router = APIRouter(prefix="/artists")
 
+duplicate_uploads = metrics.counter("media_duplicate_uploads_total")
+bytes_deduplicated = metrics.counter("media_bytes_deduplicated_total")
+
 
 @router.get("/media", response_model=PaginatedMediaAssets)
 async def list_media(
     artist: CurrentArtistDep,
-    session: SessionDep,
+    session: AsyncSessionDep,
     limit: int = Query(30, ge=1, le=100),
-    offset: int = Query(0, ge=0),
+    cursor: CursorDep = None,
 ):
     assert artist.id is not None
 
-    assets = session.exec(
-        select(MediaAsset)
-        .where(MediaAsset.artist_id == artist.id)
-        .offset(offset)
-        .limit(limit + 1)
+    query = select(MediaAsset).where(MediaAsset.artist_id == artist.id)
+
+    key = cursor_key(cursor, "media", int)
+    if key is not None:
+        query = query.where(col(MediaAsset.id) > key[0])
+
+    assets = (
+        await session.exec(query.order_by(col(MediaAsset.id)).limit(limit + 1))
     ).all()
 
-    has_more = len(assets) > limit
     items = assets[:limit]
+    next_cursor = encode_cursor("media", [items[-1].id]) if len(assets) > limit else None
 
-    return {"items": items, "hasMore": has_more}
+    # The generic items field does not narrow them, so job internals would leak
+    return {
+        "items": [MediaAssetPublic.model_validate(item) for item in items],
+        "next_cursor": next_cursor,
+    }
 
 
 @router.post("/media", response_model=MediaAssetPublic)
-async def upload_media(file: UploadFile, session: SessionDep, artist: CurrentArtistDep):
+async def upload_media(file: UploadFile, session: AsyncSessionDep, artist: CurrentArtistDep):
     assert artist.id is not None
 
     if file.content_type not in audio_content_types:
         raise HTTPException(status_code=400, detail="Invalid audio format.")
 
-    content = await file.read()
-    result = upload(content, resource_type="video")
-
-    audio_data = result["audio"]
-
-    asset = MediaAsset(
-        url=result["url"],
-        artist_id=artist.id,
-        duration=result["duration"],
-        codec=audio_data["codec"],
-        bit_rate=result["bit_rate"],
-        frequency=audio_data["frequency"],
-        channels=audio_data["channels"],
-        channel_layout=audio_data["channel_layout"],
-    )
+    # The multipart parser has already spooled the body to disk, it is read
+    # from there in fixed size chunks rather than loaded into memory
+    content_hash, size = await run_upload(hash_file, file.file)
+
+    own_asset = await find_artist_asset(session, artist.id, content_hash)
+    if own_asset is not None:
+        # Re-uploading a file the artist already has is a no-op
+        duplicate_uploads.inc()
+        bytes_deduplicated.inc(size)
+        return own_asset
+
+    blob = (
+        await session.exec(select(MediaBlob).where(MediaBlob.content_hash == content_hash))
+    ).first()
+    reference = None
+    if blob is not None:
+        reference = (
+            await session.exec(select(MediaAsset).where(MediaAsset.blob_id == blob.id))
+        ).first()
+
+    if reference is not None:
+        duplicate_uploads.inc()
+        bytes_deduplicated.inc(size)
+        metadata = {field: getattr(reference, field) for field in AUDIO_METADATA_FIELDS}
+        if reference.transcode_status == TRANSCODE_READY:
+            # Same content, so the existing transcode serves this asset too
+            metadata["transcode_status"] = TRANSCODE_READY
+            for field in TRANSCODE_FIELDS:
+                metadata[field] = getattr(reference, field)
+    else:
+        try:
+            metadata, container_format = await run_upload(probe_audio, file.file)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Could not read audio file.")
+        if container_format not in audio_extensions:
+            raise HTTPException(status_code=400, detail="Invalid audio format.")
+        extension = audio_extensions[container_format]
+        await file.seek(0)
+
+    stored_url = None
+    if blob is None:
+        stored_url = await run_upload(storage.save, file.file, str(artist.id), extension)
+        blob = MediaBlob(content_hash=content_hash, url=stored_url, size=size)
+        session.add(blob)
+
+    asset = MediaAsset(url=blob.url, artist_id=artist.id, blob=blob, **metadata)
     session.add(asset)
-    session.commit()
+    try:
+        await session.commit()
+    except IntegrityError:
+        # A concurrent upload of the same content won the race
+        await session.rollback()
+        if stored_url is not None:
+            await delete_stored(stored_url)
+        own_asset = await find_artist_asset(session, artist.id, content_hash)
+        if own_asset is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT, detail="Upload conflicted, try again."
+            )
+        return own_asset
 
+    if asset.transcode_status != TRANSCODE_READY:
+        transcode_queue.notify()
     return asset
 
 
+async def find_artist_asset(
+    session: AsyncSession, artist_id: int, content_hash: str
+) -> MediaAsset | None:
+    return (
+        await session.exec(
+            select(MediaAsset)
+            .join(MediaBlob)
+            .where(MediaAsset.artist_id == artist_id)
+            .where(MediaBlob.content_hash == content_hash)
+        )
+    ).first()
+
+
+async def delete_stored(url: str):
+    try:
+        await run_upload(backend_for(url).delete, url)
+    except (ValueError, OSError) as e:
+        print("Failed to delete media", url, e)
+
+
 @router.delete("/media/{asset_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_media(asset_id: int, session: SessionDep, artist: CurrentArtistDep):
-    asset = session.exec(
-        select(MediaAsset)
-        .where(MediaAsset.artist_id == artist.id)
-        .where(MediaAsset.id == asset_id)
+async def delete_media(asset_id: int, session: AsyncSessionDep, artist: CurrentArtistDep):
+    asset = (
+        await session.exec(
+            select(MediaAsset)
+            .where(MediaAsset.artist_id == artist.id)
+            .where(MediaAsset.id == asset_id)
+        )
     ).first()
-    session.delete(asset)
-    session.commit()
+    if asset is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Media asset not found")
+
+    await session.delete(asset)
+
+    # The stored file goes once no asset shares its blob any more
+    orphaned_url = asset.url
+    if asset.blob_id is not None:
+        shared = (
+            await session.exec(
+                select(MediaAsset.id)
+                .where(MediaAsset.blob_id == asset.blob_id)
+                .where(MediaAsset.id != asset.id)
+            )
+        ).first()
+        if shared is None:
+            await session.delete(await session.get(MediaBlob, asset.blob_id))
+        else:
+            orphaned_url = None
+
+    # Duplicates may share the transcode and its peaks as well
+    orphaned_outputs = [asset.transcoded_url, asset.peaks_url]
+    if asset.transcoded_url is not None:
+        shared = (
+            await session.exec(
+                select(MediaAsset.id)
+                .where(MediaAsset.transcoded_url == asset.transcoded_url)
+                .where(MediaAsset.id != asset.id)
+            )
+        ).first()
+        if shared is not None:
+            orphaned_outputs = []
+
+    await session.commit()
+
+    for url in (orphaned_url, *orphaned_outputs):
+        if url is not None:
+            await delete_stored(url)
     return
+
+
+@router.get("/media/{asset_id}/peaks")
+async def get_media_peaks(asset_id: int, session: AsyncSessionDep, artist: CurrentArtistDep):
+    """
+    Waveform peaks of a transcoded asset, in the binary format described in
+    app/audio_analysis.py.
+    """
+    asset = (
+        await session.exec(
+            select(MediaAsset)
+            .where(MediaAsset.artist_id == artist.id)
+            .where(MediaAsset.id == asset_id)
+        )
+    ).first()
+    if asset is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Media asset not found")
+    if asset.peaks_url is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Media asset is not analysed yet ({asset.transcode_status}).",
+        )
+
+    path = await run_upload(local_path, asset.peaks_url)
+    return FileResponse(path, media_type="application/octet-stream")
@@ -2,34 +2,40 @@ from datetime import datetime, timedelta, timezone
 from typing import Annotated
 from fastapi import Depends, APIRouter, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from pwdlib import PasswordHash
 from app.config import settings
-from app.dependencies.db import SessionDep
+from app.dependencies.db import AsyncSessionDep
 from fastapi.responses import JSONResponse
 from app.models.user import User, UserPublic, UserCreate
+from app.passwords import hash_password, verify_password
+from app.dependencies.users import invalidate_user
 from sqlmodel import select
 import jwt
 
 
-password_hash = PasswordHash.recommended()
-
 router = APIRouter()
 
 
-def authenticate(username: str, password: str, session: SessionDep):
-    user = session.exec(select(User).where(User.username == username)).first()
+async def authenticate(username: str, password: str, session: AsyncSessionDep):
+    user = (await session.exec(select(User).where(User.username == username))).first()
     if not user:
         return False
-    if not password_hash.verify(password, user.hashed_password):
+    valid, updated_hash = await verify_password(password, user.hashed_password)
+    if not valid:
         return False
+    if updated_hash is not None:
+        # Argon2 parameters changed since this hash was made
+        user.hashed_password = updated_hash
+        session.add(user)
+        await session.commit()
+        invalidate_user(user)
     return user
 
 
 @router.post("/token")
 async def login_user(
-    form_data: Annotated[OAuth2PasswordRequestForm, Depends()], session: SessionDep
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()], session: AsyncSessionDep
 ):
-    user = authenticate(form_data.username, form_data.password, session)
+    user = await authenticate(form_data.username, form_data.password, session)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -40,6 +46,7 @@ async def login_user(
     token = jwt.encode(
         {
             "sub": user.username,
+            "uid": user.id,
             "exp": datetime.now(timezone.utc)
             + timedelta(minutes=settings.access_token_expire_minutes),
         },
@@ -56,14 +63,14 @@ async def login_user(
 @router.post("/register", response_model=UserPublic)
 async def register_user(
     user: UserCreate,
-    session: SessionDep
+    session: AsyncSessionDep
 ):
     user_data = user.model_dump(exclude_unset=True)
-    user_data["hashed_password"] = password_hash.hash(user_data.pop("password"))
+    user_data["hashed_password"] = await hash_password(user_data.pop("password"))
     
     user_db = User(**user_data)
     session.add(user_db)
-    session.commit()
-    session.refresh(user_db)
+    await session.commit()
+    invalidate_user(user_db)
 
     return user_db
\ No newline at end of file
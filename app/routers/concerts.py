@@ -1,5 +1,6 @@
 from fastapi import (
     APIRouter,
+    Request,
     UploadFile,
     HTTPException,
     Query,
@@ -8,6 +9,7 @@ from fastapi import (
     status,
     WebSocket,
     WebSocketDisconnect,
+    Response,
 )
 from app.models.concert import (
     ConcertPublic,
@@ -19,34 +21,70 @@ from app.models.concert import (
     ConcertSetlistItemCreate,
 )
 from app.dependencies.artists import CurrentArtistDep
-from app.dependencies.db import SessionDep
+from app.dependencies.db import AsyncSessionDep
+from app.dependencies.pagination import CursorDep, cursor_key, encode_cursor
 from app.dependencies.concerts import (
     ArtistConcertDep,
-    ConcertDep,
     ConcertManagerDep,
     ArtistConcertManagerDep,
+    concert_public_options,
+    get_concert as load_concert,
+    get_concert_manager,
+    remote_concert_manager,
 )
-from app.models.artist import MediaAsset
+from app.models.artist import MediaAsset, TRANSCODE_READY
 from aiortc import RTCPeerConnection
 from app.concert_manager import Listener
-from sqlmodel import select, col, nulls_last, Session
+from app.outbox import Outbox
+from sqlmodel import select, col, tuple_
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.models.concert import ImageUploadResponse
-from app.dependencies.concerts import get_concert_manager, concert_managers
+from app.dependencies.concerts import concert_managers, sync_concert_managers
+from app.concert_jobs import schedule_concert, unschedule_concert
+from app.config import settings
+import asyncio
+import httpx
 from typing import Literal, Optional
+from datetime import datetime as dt, timedelta
 from contextlib import asynccontextmanager
-from app.database import engine
-from app.storage import upload_image, image_content_types
+from app.database import async_engine
+from app.storage import image_content_types, image_extensions, run_upload, storage
+from app.workers import RemoteConcertManager, is_front_end
+from app.hls import PLAYLIST_CONTENT_TYPE, PLAYLIST_MAX_AGE, PLAYLIST_NAME, SEGMENT_CONTENT_TYPE
+from app.search import concert_search, too_many_to_rank
+from app.view_counter import view_counter
+from app.response_cache import (
+    DISCOVER_TAG,
+    backend as response_cache,
+    cached_response,
+    concert_tag,
+    invalidate_concert,
+    store_response,
+)
+
+
+async def sweep_concert_managers():
+    # Runs in every process, so it is kept out of the leader-only scheduler
+    while True:
+        try:
+            async with AsyncSession(async_engine) as session:
+                await sync_concert_managers(session)
+        except Exception as e:
+            print("Concert manager sweep failed", e)
+        await asyncio.sleep(settings.concert_sweep_interval_minutes * 60)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    with Session(engine) as session:
-        concerts = session.exec(select(Concert)).all()
-
-        for concert in concerts:
-            concert_manager = get_concert_manager(concert, session)
-            concert_manager.schedule_start()
+    sweep_task = asyncio.create_task(sweep_concert_managers())
+    view_flush_task = asyncio.create_task(view_counter.run())
     yield
+    sweep_task.cancel()
+    view_flush_task.cancel()
+    try:
+        await view_counter.flush()
+    except Exception as e:
+        print("Final concert view flush failed", e)
     for concert_manager in concert_managers.values():
         await concert_manager.stop()
 
@@ -55,113 +93,195 @@ router = APIRouter(prefix="/concerts", lifespan=lifespan)
 
 
 @router.post("/upload-image/{concert_id}", response_model=ImageUploadResponse)
-async def upload_concert_image(concert: ConcertDep, file: UploadFile):
+async def upload_concert_image(concert: ArtistConcertDep, file: UploadFile):
     assert concert.id is not None
 
     if file.content_type not in image_content_types:
         raise HTTPException(status_code=400, detail="Invalid image format.")
 
-    file_bytes = await file.read()
-
-    image_result = upload_image(file_bytes)
+    url = await run_upload(
+        storage.save,
+        file.file,
+        str(concert.artist_id),
+        image_extensions[file.content_type],
+        "image",
+    )
 
-    return {"cover_image_url": image_result.url}
+    return {"cover_image_url": url}
 
 
 @router.post("/create", response_model=ConcertPublic)
 async def create_concert(
-    session: SessionDep, artist: CurrentArtistDep, background_tasks: BackgroundTasks
+    session: AsyncSessionDep, artist: CurrentArtistDep, background_tasks: BackgroundTasks
 ):
     assert artist.id is not None
 
     concert_db = Concert(artist_id=artist.id)
     session.add(concert_db)
-    session.commit()
-    session.refresh(concert_db)
+    await session.commit()
     assert concert_db.id is not None
 
-    def schedule_start(concert_id: int):
-        with Session(engine) as s:
-            concert = s.get(Concert, concert_id)
-            if concert:
-                concert_manager = get_concert_manager(concert, s)
-                concert_manager.schedule_start()
+    concert_db = (
+        await session.exec(
+            select(Concert)
+            .where(Concert.id == concert_db.id)
+            .options(*concert_public_options)
+            .execution_options(populate_existing=True)
+        )
+    ).one()
 
-    background_tasks.add_task(schedule_start, concert_db.id)
+    await invalidate_concert(concert_db.id)
+    background_tasks.add_task(schedule_concert, concert_db.id, concert_db.start_time)
 
     return concert_db
 
 
 @router.get("/discover", response_model=PaginatedConcerts)
 async def discover_concerts(
-    session: SessionDep,
+    request: Request,
+    session: AsyncSessionDep,
     q: Optional[str] = None,
     artist_id: Optional[int] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
     limit: int = Query(20, ge=1, le=100),
-    offset: int = Query(0, ge=0),
-    sort_by: Literal["upcoming", "popularity"] = Query(
-        "upcoming", description="Sort order"
+    cursor: CursorDep = None,
+    sort_by: Optional[Literal["relevance", "upcoming", "popularity"]] = Query(
+        None,
+        description="Sort order, relevance by default when searching. Searches "
+        "matching very many concerts are listed upcoming first instead",
     ),
 ):
-    query = select(Concert)
+    # The same for every visitor, so served from the response cache
+    cached = await cached_response(request)
+    if cached is not None:
+        return cached
+    generations = await response_cache.generations([DISCOVER_TAG])
 
-    if q:
-        like_expr = f"%{q}%"
-        query = query.where(
-            (col(Concert.name).ilike(like_expr))
-            | (col(Concert.description).ilike(like_expr))
-        )
+    search = concert_search(q) if q else None
+    if sort_by is None:
+        sort_by = "relevance" if search is not None else "upcoming"
+
+    filters = []
+    if search is not None:
+        matches, rank = search
+        filters.append(matches)
 
     if artist_id:
-        query = query.where(Concert.artist_id == artist_id)
+        filters.append(Concert.artist_id == artist_id)
 
     if min_price is not None:
-        query = query.where(Concert.ticket_price >= min_price)
+        filters.append(Concert.ticket_price >= min_price)
 
     if max_price is not None:
-        query = query.where(Concert.ticket_price <= max_price)
-
-    sort_columns = {
-        "upcoming": nulls_last(col(Concert.start_time).asc()),
-        "popularity": col(Concert.popularity).desc(),
-    }
-
-    query = query.order_by(sort_columns[sort_by])
-
-    concerts = session.exec(query.offset(offset).limit(limit + 1)).all()
+        filters.append(Concert.ticket_price <= max_price)
+
+    if sort_by == "relevance":
+        if search is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Sorting by relevance needs a search query",
+            )
+        # Ranking reads every match, a term matching too many is listed
+        # upcoming first instead. Later pages follow what the first one did.
+        if cursor is None:
+            too_many = await too_many_to_rank(session, *filters)
+        else:
+            too_many = cursor.get("s") == "upcoming"
+        if too_many:
+            sort_by = "upcoming"
+
+    if sort_by == "relevance":
+        # Rows carry their rank, which the next page's cursor seeks past
+        query = select(Concert, rank)
+    else:
+        query = select(Concert)
+    query = query.options(*concert_public_options).where(*filters)
+
+    if sort_by == "relevance":
+        # Seek past the last (rank, popularity, id) seen. Every match is ranked
+        # either way, at most search_rank_max_matches of them, but a page only
+        # keeps its top rows rather than skipping all the earlier ones
+        seek = tuple_(rank, col(Concert.popularity), col(Concert.id))
+        key = cursor_key(cursor, sort_by, float, int, int)
+        if key is not None:
+            query = query.where(seek < tuple_(*key))
+        query = query.order_by(
+            rank.desc(), col(Concert.popularity).desc(), col(Concert.id).desc()
+        )
+        rows = (await session.exec(query.limit(limit + 1))).all()
+        concerts = [concert for concert, _ in rows]
+        ranks = [concert_rank for _, concert_rank in rows]
+    else:
+        # Seek past the last (sort column, id) seen, served by the matching
+        # composite index instead of scanning and discarding earlier pages
+        ascending = sort_by == "upcoming"
+        sort_field = "start_time" if ascending else "popularity"
+        sort_column = col(getattr(Concert, sort_field))
+        parse = dt.fromisoformat if ascending else int
+
+        seek = tuple_(sort_column, col(Concert.id))
+        key = cursor_key(cursor, sort_by, parse, int)
+        if key is not None:
+            query = query.where(seek > tuple_(*key) if ascending else seek < tuple_(*key))
+
+        if ascending:
+            query = query.order_by(sort_column.asc(), col(Concert.id).asc())
+        else:
+            query = query.order_by(sort_column.desc(), col(Concert.id).desc())
+
+        concerts = (await session.exec(query.limit(limit + 1))).all()
 
-    has_more = len(concerts) > limit
     items = concerts[:limit]
+    next_cursor = None
+    if len(concerts) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(
+            sort_by,
+            [ranks[limit - 1], last.popularity, last.id]
+            if sort_by == "relevance"
+            else [getattr(last, sort_field), last.id],
+        )
 
-    return {"items": items, "hasMore": has_more}
+    page = PaginatedConcerts.model_validate(
+        {"items": items, "next_cursor": next_cursor}, from_attributes=True
+    )
+    return await store_response(
+        request, page.model_dump_json().encode(), [DISCOVER_TAG], generations
+    )
 
 
 @router.get("/{concert_id}", response_model=ConcertPublic)
-async def get_concert(concert: ConcertDep, session: SessionDep):
-    concert.popularity += 1
-    session.commit()
-    return concert
+async def get_concert(concert_id: int, request: Request, session: AsyncSessionDep):
+    response = await cached_response(request)
+    if response is None:
+        tags = [concert_tag(concert_id)]
+        generations = await response_cache.generations(tags)
+        concert = await load_concert(concert_id, session)
+        body = ConcertPublic.model_validate(concert, from_attributes=True).model_dump_json()
+        response = await store_response(request, body.encode(), tags, generations)
+
+    view_counter.record(concert_id)
+    return response
 
 
 @router.patch("/{concert_id}", response_model=ConcertPublic)
 async def update_concert(
     concert: ArtistConcertDep,
     data: ConcertUpdate,
-    session: SessionDep,
-    concert_manager: ArtistConcertManagerDep,
+    session: AsyncSessionDep,
 ):
     assert concert.id is not None
     for key, value in data.model_dump(exclude_unset=True).items():
         setattr(concert, key, value)
 
     session.add(concert)
-    session.commit()
-    session.refresh(concert)
+    await session.commit()
+    await invalidate_concert(concert.id)
 
     if data.start_time:
-        concert_manager.schedule_start()
+        # The job store is synchronous, keep it off the event loop
+        await asyncio.to_thread(schedule_concert, concert.id, concert.start_time)
 
     return concert
 
@@ -170,11 +290,15 @@ async def update_concert(
 async def delete_concert(
     concert_manager: ArtistConcertManagerDep,
     concert: ArtistConcertDep,
-    session: SessionDep,
+    session: AsyncSessionDep,
 ):
+    assert concert.id is not None
+    await asyncio.to_thread(unschedule_concert, concert.id)
     await concert_manager.stop()
-    session.delete(concert)
-    session.commit()
+    concert_managers.pop(concert.id, None)
+    await session.delete(concert)
+    await session.commit()
+    await invalidate_concert(concert.id)
     return
 
 
@@ -183,22 +307,44 @@ async def create_setlist_item(
     item_data: ConcertSetlistItemCreate,
     artist: CurrentArtistDep,
     concert: ArtistConcertDep,
-    session: SessionDep,
+    session: AsyncSessionDep,
 ):
     item_db = ConcertSetlistItem.model_validate(
         item_data, update={"concert_id": concert.id}
     )
 
     # Check if artist owns the asset referenced in the request
-    session.exec(
-        select(MediaAsset)
-        .where(MediaAsset.artist_id == artist.id)
-        .where(MediaAsset.id == item_db.asset_id)
-    )
+    asset = (
+        await session.exec(
+            select(MediaAsset)
+            .where(MediaAsset.artist_id == artist.id)
+            .where(MediaAsset.id == item_db.asset_id)
+        )
+    ).first()
+    if asset is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Media asset not found")
+    # Concerts only ever play transcoded audio
+    if asset.transcode_status != TRANSCODE_READY:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Media asset is not ready yet ({asset.transcode_status}).",
+        )
 
+    item_db.asset = asset
     session.add(item_db)
-    session.commit()
-    session.refresh(item_db)
+    await session.commit()
+    await invalidate_concert(item_db.concert_id)
+
+    # Earlier edits are picked up by the scheduled prerender job, past it the
+    # new track has to be fetched now to be on disk by showtime. The item is
+    # saved either way, so a manager that can't be had now only means the
+    # start fetches the track itself.
+    now = dt.now()
+    if now < concert.start_time <= now + timedelta(minutes=settings.prerender_lead_minutes):
+        try:
+            get_concert_manager(concert).start_prerender()
+        except HTTPException as e:
+            print("Skipping setlist prerender for concert", concert.id, e.detail)
 
     return item_db
 
@@ -207,28 +353,80 @@ async def create_setlist_item(
     "/{concert_id}/setlist/{item_id}", status_code=status.HTTP_204_NO_CONTENT
 )
 async def delete_setlist_item(
-    concert: ArtistConcertDep, item_id: int, session: SessionDep
+    concert: ArtistConcertDep, item_id: int, session: AsyncSessionDep
 ):
-    setlist_item = session.exec(
-        select(ConcertSetlistItem)
-        .where(ConcertSetlistItem.id == item_id)
-        .where(ConcertSetlistItem.concert_id == concert.id)
-    )
-    session.delete(setlist_item)
-    session.commit()
+    setlist_item = (
+        await session.exec(
+            select(ConcertSetlistItem)
+            .where(ConcertSetlistItem.id == item_id)
+            .where(ConcertSetlistItem.concert_id == concert.id)
+        )
+    ).first()
+    if setlist_item is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Setlist item not found")
+
+    await session.delete(setlist_item)
+    await session.commit()
+    await invalidate_concert(setlist_item.concert_id)
     return
 
 
+@router.get("/{concert_id}/hls/{name}")
+async def get_hls(concert_id: int, name: str):
+    """
+    Serve a live concert's HLS playlist or one of its segments. Polled by
+    every passive listener, so it skips the database: a concert without a
+    live manager here has nothing to serve.
+    """
+    if is_front_end():
+        remote = remote_concert_manager(concert_id)
+        try:
+            upstream = await remote.fetch_hls(name)
+        except httpx.TransportError:
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Concert worker unavailable")
+        return Response(upstream.content, status_code=upstream.status_code, headers=upstream.headers)
+
+    concert_manager = concert_managers.get(concert_id)
+    hls = concert_manager.hls if concert_manager else None
+    if hls is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Concert is not streaming")
+
+    if name == PLAYLIST_NAME:
+        return Response(
+            hls.playlist,
+            media_type=PLAYLIST_CONTENT_TYPE,
+            headers={"Cache-Control": f"public, max-age={PLAYLIST_MAX_AGE}"},
+        )
+
+    segment = hls.segment(name)
+    if segment is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Segment not found")
+    # Segment names are never reused, see HlsSegmenter.run
+    return Response(
+        segment.data,
+        media_type=SEGMENT_CONTENT_TYPE,
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
 @router.websocket("/{concert_id}")
 async def live(ws: WebSocket, concert_manager: ConcertManagerDep):
+    if isinstance(concert_manager, RemoteConcertManager):
+        await concert_manager.proxy(ws)
+        return
+
     pc = RTCPeerConnection()
 
     listener: Listener = {
         "pc": pc,
         "ws": ws,
+        "outbox": Outbox(ws),
     }
 
     listener_id = await concert_manager.add_listener(listener)
+    if listener_id is None:
+        await pc.close()
+        return
 
     try:
         while True:
@@ -240,6 +438,9 @@ async def live(ws: WebSocket, concert_manager: ConcertManagerDep):
             elif t == "candidate":
                 await concert_manager.receive_candidate(listener_id, data)
             elif t == "emoji":
-                await concert_manager.send_reaction(data.get("emoji"), listener_id)
+                concert_manager.send_reaction(data.get("emoji"))
     except WebSocketDisconnect:
+        pass
+    finally:
+        # Also reached when the outbox closes an overflowing socket
         await concert_manager.remove_listener(listener_id)
@@ -0,0 +1,145 @@
+from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
+from aiortc.mediastreams import MediaStreamError
+from app.dependencies.internal import verify_internal_token
+from app.dependencies.concerts import (
+    ConcertManagerDep,
+    concert_managers,
+    evict_idle_managers,
+)
+from app.dependencies.db import AsyncSessionDep
+from app.models.artist import MediaAsset, MediaBlob
+from sqlalchemy import func, join
+from sqlmodel import select
+from app import metrics
+from app.origin_feed import CONCERT_ENDED_CLOSE_CODE, FEED_READY_MESSAGE, pack_feed_packet
+from app.concert_manager import ConcertManager
+from app.workers import is_front_end, is_worker, owns, supervisor, worker_addresses
+import concurrent.futures
+import asyncio
+
+router = APIRouter(prefix="/internal", dependencies=[Depends(verify_internal_token)])
+
+
+@router.get("/health")
+async def health():
+    return {"ok": True}
+
+
+@router.get("/metrics")
+async def read_metrics():
+    return metrics.snapshot()
+
+
+@router.get("/media/dedup")
+async def media_dedup_report(session: AsyncSessionDep):
+    """
+    Bytes actually stored against what every asset would take as its own copy.
+    """
+    blobs, stored_bytes = (
+        await session.exec(select(func.count(), func.coalesce(func.sum(MediaBlob.size), 0)))
+    ).one()
+    assets, referenced_bytes = (
+        await session.exec(
+            select(func.count(), func.coalesce(func.sum(MediaBlob.size), 0)).select_from(
+                join(MediaAsset, MediaBlob)
+            )
+        )
+    ).one()
+    return {
+        "blobs": blobs,
+        "assets": assets,
+        "stored_bytes": stored_bytes,
+        "referenced_bytes": referenced_bytes,
+        "bytes_saved": referenced_bytes - stored_bytes,
+    }
+
+
+@router.post("/workers")
+async def add_worker():
+    if not is_front_end():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    address = await supervisor.add_worker()
+    return {"address": address, "workers": supervisor.addresses}
+
+
+@router.put("/workers")
+async def assign_workers(workers: list[str]):
+    if not is_worker():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    worker_addresses[:] = workers
+
+    # Release idle concerts that moved to another worker. Any other one, live,
+    # starting or with an audience waiting for it, is kept here and pinned by
+    # the supervisor so its start and its audience stay together. Nothing is
+    # scheduled here: start jobs run on the front-end, which routes each to
+    # the concert's owner when it fires.
+    active = []
+    for concert_id, concert_manager in list(concert_managers.items()):
+        if not concert_manager.is_idle:
+            active.append(concert_id)
+        elif not owns(concert_id):
+            await concert_manager.stop()
+            del concert_managers[concert_id]
+
+    evict_idle_managers()
+
+    return {"active": active}
+
+
+async def run_control(concert_id: int, action: str, future: concurrent.futures.Future):
+    """
+    Wait for a start or prerender so its failure reaches the front-end's job
+    as an error status instead of vanishing on this worker.
+    """
+    try:
+        await asyncio.wrap_future(future)
+    except Exception as e:
+        print("Concert", concert_id, action, "failed", repr(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Concert {action} failed"
+        )
+
+
+@router.post("/concerts/{concert_id}/start")
+async def start_concert(concert_manager: ConcertManagerDep):
+    await run_control(concert_manager.id, "start", concert_manager.start())
+
+
+@router.post("/concerts/{concert_id}/prerender")
+async def prerender_concert(concert_manager: ConcertManagerDep):
+    await run_control(concert_manager.id, "prerender", concert_manager.start_prerender())
+
+
+@router.delete("/concerts/{concert_id}")
+async def stop_concert(concert_manager: ConcertManagerDep):
+    await concert_manager.stop()
+    concert_managers.pop(concert_manager.id, None)
+
+
+@router.websocket("/concerts/{concert_id}/feed")
+async def concert_feed(ws: WebSocket, concert_manager: ConcertManagerDep):
+    """
+    Forwards the concert's encoded stream to an edge node once it goes live.
+    """
+    if not isinstance(concert_manager, ConcertManager):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    await ws.accept()
+    await concert_manager.live_event.wait()
+    if concert_manager.finished:
+        await ws.close(code=CONCERT_ENDED_CLOSE_CODE)
+        return
+
+    track = concert_manager.subscribe_encoded()
+    try:
+        await ws.send_text(FEED_READY_MESSAGE)
+        while True:
+            packet = await track.recv()
+            await ws.send_bytes(pack_feed_packet(packet))
+    except MediaStreamError:
+        await ws.close(code=CONCERT_ENDED_CLOSE_CODE)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        track.stop()
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import FileResponse
+from app.storage import LOCAL_URL_PREFIX, backends, media_types
+import os
+
+router = APIRouter(prefix="/media")
+
+
+@router.get("/{folder}/{name}")
+async def get_media(folder: str, name: str):
+    """
+    Serves media kept by the local storage backend. FileResponse honours
+    Range headers, so players can seek without fetching the whole file. The
+    type comes from the extension the app stored it under and browsers may not
+    sniff another, so nothing stored here is ever rendered as a page.
+    """
+    try:
+        path = backends["local"].local_path(f"{LOCAL_URL_PREFIX}{folder}/{name}")
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Media not found")
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Media not found")
+    return FileResponse(
+        path,
+        media_type=media_types.get(os.path.splitext(path)[1], "application/octet-stream"),
+        headers={"X-Content-Type-Options": "nosniff"},
+    )
@@ -0,0 +1,57 @@
+from sqlalchemy import func, text
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.config import settings
+from app.models.concert import Concert
+import re
+
+
+def prefix_tsquery(q: str) -> str | None:
+    """
+    Turns free text into a tsquery where every word must match, the last as a
+    prefix so results show up while the user is still typing.
+    """
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    return " & ".join(words[:-1] + [f"{words[-1]}:*"])
+
+
+def concert_search(q: str):
+    """
+    Returns the where clause and rank expression for a discover search, both
+    backed by the GIN index on Concert.search_vector.
+    """
+    tsquery = prefix_tsquery(q)
+    if tsquery is None:
+        return None
+
+    query = func.to_tsquery("english", tsquery)
+    vector = col(Concert.search_vector)
+    return vector.op("@@")(query), func.ts_rank_cd(vector, query)
+
+
+# Postgres guesses a prefix matches at least 2% of the table, and under a
+# LIMIT would rather scan the table hoping to stop early, reading all of it
+# for a rare term. Match counts are made to come from the GIN index instead.
+INDEX_SCANS_ONLY = text("SET LOCAL enable_seqscan = off")
+RESTORE_SCANS = text("RESET enable_seqscan")
+
+
+def capped_match_count(*where):
+    """
+    Counts the concerts matching a search, stopping one past
+    settings.search_rank_max_matches so a common term costs little more than
+    a rare one. Run between INDEX_SCANS_ONLY and RESTORE_SCANS.
+    """
+    matching = select(col(Concert.id)).where(*where).limit(settings.search_rank_max_matches + 1)
+    return select(func.count()).select_from(matching.subquery())
+
+
+async def too_many_to_rank(session: AsyncSession, *where) -> bool:
+    await session.exec(INDEX_SCANS_ONLY)
+    try:
+        count = (await session.exec(capped_match_count(*where))).one()
+    finally:
+        await session.exec(RESTORE_SCANS)
+    return count > settings.search_rank_max_matches
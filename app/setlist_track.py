@@ -0,0 +1,146 @@
+from aiortc import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from av import AudioFrame, AudioResampler
+from av.audio.fifo import AudioFifo
+from fractions import Fraction
+from typing import Iterator
+from app.config import settings
+from app.transcode import CANONICAL_SAMPLE_RATE
+import numpy as np
+import asyncio
+import time
+import av
+
+# 20 ms at 48 kHz, the frame size Opus is fed with
+SAMPLES_PER_FRAME = 960
+TIME_BASE = Fraction(1, CANONICAL_SAMPLE_RATE)
+
+
+def apply_gain(frame: AudioFrame, gain: float) -> AudioFrame:
+    samples = frame.to_ndarray() * gain
+    scaled = AudioFrame.from_ndarray(
+        np.clip(samples, -32768, 32767).astype(np.int16), format="s16", layout="stereo"
+    )
+    scaled.sample_rate = frame.sample_rate
+    return scaled
+
+
+def decode_track(container, gain: float = 1.0) -> Iterator[AudioFrame]:
+    resampler = AudioResampler(format="s16", layout="stereo", rate=CANONICAL_SAMPLE_RATE)
+    try:
+        for frame in container.decode(audio=0):
+            for out in resampler.resample(frame):
+                yield out if gain == 1.0 else apply_gain(out, gain)
+        for out in resampler.resample(None):
+            yield out if gain == 1.0 else apply_gain(out, gain)
+    finally:
+        container.close()
+
+
+def open_track(file: str):
+    try:
+        return av.open(file)
+    except Exception as e:
+        print("Failed to open track", file, e)
+        return None
+
+
+class SetlistTrack(MediaStreamTrack):
+    """
+    Plays a setlist back track by track, decoding only a small buffer of frames
+    ahead of playback so memory use does not depend on the setlist length.
+    """
+
+    kind = "audio"
+
+    def __init__(
+        self,
+        files: list[str],
+        gains: list[float] | None = None,
+        buffer_frames: int | None = None,
+    ):
+        super().__init__()
+        self.files = files
+        # Loudness normalisation worked out at analysis time, see app/audio_analysis.py
+        self.gains = gains or [1.0] * len(files)
+        self._queue: asyncio.Queue[AudioFrame | None] = asyncio.Queue(
+            maxsize=buffer_frames or settings.stream_buffer_frames
+        )
+        self._decoder_task: asyncio.Task | None = None
+        self._start: float | None = None
+
+    async def _emit(self, frame: AudioFrame, pts: int) -> int:
+        frame.pts = pts
+        frame.time_base = TIME_BASE
+        await self._queue.put(frame)
+        return pts + frame.samples
+
+    async def _decode(self):
+        # A single FIFO spans every track so there is no gap at the boundaries
+        fifo = AudioFifo()
+        pts = 0
+
+        next_container = None
+        if self.files:
+            next_container = asyncio.ensure_future(asyncio.to_thread(open_track, self.files[0]))
+
+        for index in range(len(self.files)):
+            assert next_container is not None
+            container = await next_container
+
+            # Prefetch the next track while this one plays
+            if index + 1 < len(self.files):
+                next_container = asyncio.ensure_future(
+                    asyncio.to_thread(open_track, self.files[index + 1])
+                )
+
+            if container is None:
+                continue
+
+            frames = decode_track(container, self.gains[index])
+            while True:
+                try:
+                    frame = await asyncio.to_thread(next, frames, None)
+                except Exception as e:
+                    print("Failed to decode track", self.files[index], e)
+                    break
+                if frame is None:
+                    break
+
+                frame.pts = None
+                fifo.write(frame)
+                while (out := fifo.read(SAMPLES_PER_FRAME)) is not None:
+                    pts = await self._emit(out, pts)
+
+        if (out := fifo.read()) is not None:
+            await self._emit(out, pts)
+
+        await self._queue.put(None)
+
+    async def recv(self) -> AudioFrame:
+        if self.readyState != "live":
+            raise MediaStreamError
+
+        if self._decoder_task is None:
+            self._decoder_task = asyncio.create_task(self._decode())
+
+        frame = await self._queue.get()
+        if frame is None:
+            self.stop()
+            raise MediaStreamError
+
+        # Pace frames in real time, the same way aiortc's MediaPlayer does
+        if self._start is None:
+            self._start = time.time() - float(frame.pts * TIME_BASE)
+        else:
+            wait = self._start + float(frame.pts * TIME_BASE) - time.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        return frame
+
+    def stop(self):
+        super().stop()
+        if self._decoder_task is not None:
+            self._decoder_task.cancel()
+            self._decoder_task = None
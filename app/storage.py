@@ -1,6 +1,17 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Literal
 from app.config import settings
 import cloudinary
-from cloudinary.uploader import upload, upload_image
+from cloudinary.uploader import upload_large
+import tempfile
+import asyncio
+import hashlib
+import shutil
+import httpx
+import uuid
+import os
 
 cloudinary.config(
     cloud_name=settings.cloudinary_cloud_name,
@@ -25,3 +36,220 @@ audio_content_types = [
 ]
 
 image_content_types = ["image/jpeg", "image/png", "image/webp"]
+
+image_extensions = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"}
+
+# Stored audio is named after the container PyAV found in it, never after the
+# client's filename
+audio_extensions = {
+    "mp3": ".mp3",
+    "wav": ".wav",
+    "ogg": ".ogg",
+    "matroska,webm": ".webm",
+    "aac": ".aac",
+    "mov,mp4,m4a,3gp,3g2,mj2": ".m4a",
+    "aiff": ".aiff",
+    "flac": ".flac",
+}
+
+# What local media is served as, by the extensions the app stores it under
+media_types = {
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".ogg": "audio/ogg",
+    ".webm": "audio/webm",
+    ".aac": "audio/aac",
+    ".m4a": "audio/mp4",
+    ".aiff": "audio/aiff",
+    ".flac": "audio/flac",
+    ".jpg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+}
+
+LOCAL_URL_PREFIX = "/media/"
+
+MediaKind = Literal["audio", "image", "raw"]
+
+# Cloudinary files audio under its video resource type
+cloudinary_resource_types = {"audio": "video", "image": "image", "raw": "raw"}
+
+
+class StorageBackend(ABC):
+    """
+    Where uploaded media ends up. Calls block on file or network IO, so run
+    them in a thread. Range reads need no method of their own: local media is
+    served through FileResponse and remote URLs by their host, both of which
+    honour Range headers.
+    """
+
+    @abstractmethod
+    def owns(self, url: str) -> bool: ...
+
+    @abstractmethod
+    def save(self, file: BinaryIO, folder: str, extension: str, kind: MediaKind = "audio") -> str:
+        """
+        Stream the file from its current position and return its URL.
+        """
+
+    @abstractmethod
+    def local_path(self, url: str) -> str:
+        """
+        A path on this machine holding the object, for ffmpeg and PyAV.
+        """
+
+    @abstractmethod
+    def delete(self, url: str): ...
+
+
+class LocalStorage(StorageBackend):
+    """
+    Keeps media under root/<folder>/, served back at /media/<folder>/<name>.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def owns(self, url: str) -> bool:
+        return url.startswith(LOCAL_URL_PREFIX)
+
+    def local_path(self, url: str) -> str:
+        path = (self.root / url.removeprefix(LOCAL_URL_PREFIX)).resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise ValueError(f"{url} is outside the media directory")
+        return str(path)
+
+    def save(self, file: BinaryIO, folder: str, extension: str, kind: MediaKind = "audio") -> str:
+        directory = self.root / folder
+        directory.mkdir(parents=True, exist_ok=True)
+        name = f"{uuid.uuid4().hex}{extension}"
+        path = directory / name
+
+        # Write under a temporary name so a failed upload leaves nothing behind
+        partial = path.with_suffix(path.suffix + ".part")
+        try:
+            with open(partial, "wb") as destination:
+                shutil.copyfileobj(file, destination, settings.upload_chunk_bytes)
+            os.replace(partial, path)
+        finally:
+            if partial.exists():
+                partial.unlink()
+
+        return f"{LOCAL_URL_PREFIX}{folder}/{name}"
+
+    def delete(self, url: str):
+        Path(self.local_path(url)).unlink(missing_ok=True)
+
+
+class CloudinaryStorage(StorageBackend):
+    """
+    Remote objects are downloaded once into a local content-addressed cache,
+    so concert starts read setlist audio from disk instead of the network.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.objects = Path(cache_dir) / "objects"
+        self.urls = Path(cache_dir) / "urls"
+
+    def owns(self, url: str) -> bool:
+        return url.startswith(("http://", "https://"))
+
+    def save(self, file: BinaryIO, folder: str, extension: str, kind: MediaKind = "audio") -> str:
+        result = upload_large(
+            file,
+            resource_type=cloudinary_resource_types[kind],
+            chunk_size=settings.cloudinary_chunk_bytes,
+            filename=f"upload{extension}",
+        )
+        return result["url"]
+
+    def _url_entry(self, url: str) -> Path:
+        return self.urls / hashlib.sha256(url.encode()).hexdigest()
+
+    def _cached_path(self, url: str) -> Path | None:
+        entry = self._url_entry(url)
+        if not entry.exists():
+            return None
+        path = self.objects / entry.read_text().strip()
+        return path if path.exists() else None
+
+    def local_path(self, url: str) -> str:
+        cached = self._cached_path(url)
+        if cached is not None:
+            return str(cached)
+
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.urls.mkdir(parents=True, exist_ok=True)
+        fd, temp_file = tempfile.mkstemp(dir=self.objects)
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, "wb") as destination:
+                with httpx.stream("GET", url, follow_redirects=True) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_bytes(settings.upload_chunk_bytes):
+                        digest.update(chunk)
+                        destination.write(chunk)
+
+            # Identical objects behind different URLs share one file
+            content_hash = digest.hexdigest()
+            path = self.objects / content_hash
+            os.replace(temp_file, path)
+
+            entry = self._url_entry(url)
+            fd, temp_entry = tempfile.mkstemp(dir=self.urls)
+            with os.fdopen(fd, "w") as file:
+                file.write(content_hash)
+            os.replace(temp_entry, entry)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+        return str(path)
+
+    def delete(self, url: str):
+        # Other URLs may share the cached object, only forget this URL
+        self._url_entry(url).unlink(missing_ok=True)
+
+
+backends: dict[str, StorageBackend] = {
+    "local": LocalStorage(settings.media_dir),
+    "cloudinary": CloudinaryStorage(settings.media_cache_dir),
+}
+
+# New uploads go here, existing media is found through backend_for
+storage = backends[settings.media_storage]
+
+
+def backend_for(url: str) -> StorageBackend:
+    for backend in backends.values():
+        if backend.owns(url):
+            return backend
+    raise ValueError(f"No storage backend for {url}")
+
+
+def local_path(url: str) -> str:
+    return backend_for(url).local_path(url)
+
+
+def hash_file(file: BinaryIO) -> tuple[str, int]:
+    """
+    SHA-256 and size of a file, read in chunks and rewound afterwards.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := file.read(settings.upload_chunk_bytes):
+        digest.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    return digest.hexdigest(), size
+
+
+# Uploads get their own threads so a burst of them cannot starve other
+# to_thread callers
+upload_executor = ThreadPoolExecutor(
+    max_workers=settings.upload_workers, thread_name_prefix="media-upload"
+)
+
+
+async def run_upload(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(upload_executor, fn, *args)
@@ -0,0 +1,59 @@
+from av import AudioResampler
+from app.audio_analysis import analyse_file
+from app.storage import local_path, storage
+import tempfile
+import io
+import av
+import os
+
+# Every asset is transcoded once into this format, which is what concerts play
+CANONICAL_SAMPLE_RATE = 48000
+CANONICAL_LAYOUT = "stereo"
+CANONICAL_CODEC = "flac"
+CANONICAL_EXTENSION = ".flac"
+PEAKS_EXTENSION = ".peaks"
+
+
+def transcode_file(source: str, destination: str):
+    with av.open(source) as input_container, av.open(destination, "w", format="flac") as output:
+        output_stream = output.add_stream(
+            CANONICAL_CODEC, rate=CANONICAL_SAMPLE_RATE, layout=CANONICAL_LAYOUT
+        )
+        output_stream.format = "s16"
+        resampler = AudioResampler(
+            format="s16", layout=CANONICAL_LAYOUT, rate=CANONICAL_SAMPLE_RATE
+        )
+
+        def encode(frames):
+            for frame in frames:
+                output.mux(output_stream.encode(frame))
+
+        for frame in input_container.decode(audio=0):
+            encode(resampler.resample(frame))
+        encode(resampler.resample(None))
+        output.mux(output_stream.encode(None))
+
+
+def transcode_asset(url: str) -> dict:
+    """
+    Transcode an uploaded file into the canonical format, analyse the result
+    and store both, returning the MediaAsset fields to set. Runs in the
+    transcoder's process pool.
+    """
+    fd, temp_file = tempfile.mkstemp(suffix=CANONICAL_EXTENSION)
+    os.close(fd)
+    try:
+        transcode_file(local_path(url), temp_file)
+        analysis = analyse_file(temp_file)
+        with open(temp_file, "rb") as file:
+            transcoded_url = storage.save(file, "transcoded", CANONICAL_EXTENSION)
+    finally:
+        os.remove(temp_file)
+
+    peaks_url = storage.save(io.BytesIO(analysis.peaks), "peaks", PEAKS_EXTENSION, kind="raw")
+    return {
+        "transcoded_url": transcoded_url,
+        "integrated_loudness": analysis.integrated_loudness,
+        "true_peak": analysis.true_peak,
+        "peaks_url": peaks_url,
+    }
@@ -0,0 +1,200 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, update
+from sqlmodel import col, select
+from app.config import settings
+from app.database import async_engine
+from app.models.artist import (
+    MediaAsset,
+    TRANSCODE_FIELDS,
+    TRANSCODE_FAILED,
+    TRANSCODE_PENDING,
+    TRANSCODE_PROCESSING,
+    TRANSCODE_READY,
+)
+from app.storage import backend_for
+from app.transcode import transcode_asset
+from app import metrics
+import multiprocessing
+import asyncio
+import time
+
+SECONDS_BUCKETS = [1, 2.5, 5, 10, 30, 60, 120, 300, 600]
+
+transcode_time = metrics.histogram("transcode_seconds", SECONDS_BUCKETS)
+transcodes_completed = metrics.counter("transcodes_completed_total")
+transcodes_retried = metrics.counter("transcodes_retried_total")
+transcodes_failed = metrics.counter("transcodes_failed_total")
+
+
+async def claim_jobs(limit: int) -> list[tuple[int, str, int]]:
+    """
+    Mark up to limit due assets as processing and return them. SKIP LOCKED
+    lets every process poll the same table without handing out a job twice,
+    and jobs left processing by a crashed process become due again.
+    """
+    now = datetime.now()
+    stale = now - timedelta(seconds=settings.transcode_timeout_seconds)
+    due = (
+        select(MediaAsset.id)
+        .where(
+            or_(
+                and_(
+                    col(MediaAsset.transcode_status) == TRANSCODE_PENDING,
+                    or_(
+                        col(MediaAsset.transcode_available_at).is_(None),
+                        col(MediaAsset.transcode_available_at) <= now,
+                    ),
+                ),
+                and_(
+                    col(MediaAsset.transcode_status) == TRANSCODE_PROCESSING,
+                    col(MediaAsset.transcode_started_at) < stale,
+                ),
+            )
+        )
+        .order_by(col(MediaAsset.id))
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+
+    async with async_engine.begin() as connection:
+        result = await connection.execute(
+            update(MediaAsset)
+            .where(col(MediaAsset.id).in_(due.scalar_subquery()))
+            .values(
+                transcode_status=TRANSCODE_PROCESSING,
+                transcode_started_at=now,
+                transcode_attempts=col(MediaAsset.transcode_attempts) + 1,
+            )
+            .returning(col(MediaAsset.id), col(MediaAsset.url), col(MediaAsset.transcode_attempts))
+        )
+        return [(row[0], row[1], row[2]) for row in result.all()]
+
+
+async def ready_duplicate(asset_id: int) -> dict | None:
+    """
+    The transcode of another asset sharing this one's blob, if there is one.
+    """
+    blob_id = select(MediaAsset.blob_id).where(MediaAsset.id == asset_id).scalar_subquery()
+    async with async_engine.connect() as connection:
+        row = (
+            await connection.execute(
+                select(*(getattr(MediaAsset, field) for field in TRANSCODE_FIELDS))
+                .where(col(MediaAsset.blob_id) == blob_id)
+                .where(col(MediaAsset.transcode_status) == TRANSCODE_READY)
+                .limit(1)
+            )
+        ).first()
+        return dict(row._mapping) if row is not None else None
+
+
+async def complete_job(asset_id: int, outputs: dict) -> bool:
+    async with async_engine.begin() as connection:
+        result = await connection.execute(
+            update(MediaAsset)
+            .where(col(MediaAsset.id) == asset_id)
+            .values(transcode_status=TRANSCODE_READY, transcode_error=None, **outputs)
+        )
+        return result.rowcount > 0
+
+
+async def fail_job(asset_id: int, attempts: int, error: str):
+    values: dict = {"transcode_error": error[:1000]}
+    if attempts >= settings.transcode_max_attempts:
+        values["transcode_status"] = TRANSCODE_FAILED
+        transcodes_failed.inc()
+    else:
+        backoff = settings.transcode_retry_base_seconds * 2 ** (attempts - 1)
+        values["transcode_status"] = TRANSCODE_PENDING
+        values["transcode_available_at"] = datetime.now() + timedelta(seconds=backoff)
+        transcodes_retried.inc()
+
+    async with async_engine.begin() as connection:
+        await connection.execute(
+            update(MediaAsset).where(col(MediaAsset.id) == asset_id).values(**values)
+        )
+
+
+class TranscodeQueue:
+    """
+    Runs transcode jobs stored on MediaAsset rows in a local process pool,
+    so decoding and encoding never compete with the event loop for the GIL.
+    """
+
+    def __init__(self):
+        self.executor: ProcessPoolExecutor | None = None
+        self.running: set[asyncio.Task] = set()
+        self.wake = asyncio.Event()
+
+    def notify(self):
+        self.wake.set()
+
+    def pool(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # Forking a process that runs threads is unsafe, start workers fresh
+            self.executor = ProcessPoolExecutor(
+                max_workers=settings.transcode_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self.executor
+
+    async def process(self, asset_id: int, url: str, attempts: int):
+        started_at = time.perf_counter()
+        try:
+            outputs = await ready_duplicate(asset_id)
+            shared = outputs is not None
+            if outputs is None:
+                outputs = await asyncio.get_running_loop().run_in_executor(
+                    self.pool(), transcode_asset, url
+                )
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self.executor = None
+            print("Transcode failed", asset_id, repr(e))
+            await fail_job(asset_id, attempts, repr(e))
+            return
+
+        transcode_time.observe(time.perf_counter() - started_at)
+        if await complete_job(asset_id, outputs):
+            transcodes_completed.inc()
+        elif not shared:
+            # The asset was deleted while transcoding
+            for url in (outputs["transcoded_url"], outputs["peaks_url"]):
+                await asyncio.to_thread(backend_for(url).delete, url)
+
+    def _finished(self, task: asyncio.Task):
+        self.running.discard(task)
+        # A slot freed up, look for more work straight away
+        self.wake.set()
+
+    async def run(self):
+        while True:
+            free = settings.transcode_workers - len(self.running)
+            if free > 0:
+                try:
+                    jobs = await claim_jobs(free)
+                except Exception as e:
+                    print("Failed to claim transcode jobs", e)
+                    jobs = []
+                for job in jobs:
+                    task = asyncio.create_task(self.process(*job))
+                    self.running.add(task)
+                    task.add_done_callback(self._finished)
+
+            try:
+                await asyncio.wait_for(self.wake.wait(), settings.transcode_poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+
+    def shutdown(self):
+        for task in self.running:
+            task.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+transcode_queue = TranscodeQueue()
+metrics.gauge("transcodes_running", lambda: len(transcode_queue.running))
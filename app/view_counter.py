@@ -0,0 +1,82 @@
+from collections import Counter
+from sqlalchemy import Integer, column, update, values
+from sqlmodel import col
+from app.config import settings
+from app.database import async_engine
+from app.models.concert import Concert
+from app import metrics
+import asyncio
+
+# Postgres caps a statement at 32767 parameters, two per concert
+MAX_CONCERTS_PER_STATEMENT = 10000
+
+views_flushed = metrics.counter("concert_views_flushed_total")
+flush_failures = metrics.counter("concert_view_flush_failures_total")
+
+
+class ViewCounter:
+    """
+    Batches concert views in memory and adds them to popularity in one
+    UPDATE per flush, keeping the concert GET path free of writes.
+    """
+
+    def __init__(self):
+        self.pending: Counter[int] = Counter()
+        self.pending_views = 0
+        self.flush_now = asyncio.Event()
+
+    def record(self, concert_id: int):
+        self.pending[concert_id] += 1
+        self.pending_views += 1
+        # Bound how many views a crash can lose
+        if self.pending_views >= settings.view_flush_max_pending:
+            self.flush_now.set()
+
+    async def flush(self):
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, Counter()
+        self.pending_views = 0
+        # Lock rows in id order so concurrent flushes from other processes
+        # cannot deadlock
+        rows = sorted(batch.items())
+
+        try:
+            async with async_engine.begin() as connection:
+                for i in range(0, len(rows), MAX_CONCERTS_PER_STATEMENT):
+                    views = values(
+                        column("id", Integer), column("views", Integer), name="views"
+                    ).data(rows[i : i + MAX_CONCERTS_PER_STATEMENT])
+                    await connection.execute(
+                        update(Concert)
+                        .where(col(Concert.id) == views.c.id)
+                        .values(popularity=col(Concert.popularity) + views.c.views)
+                    )
+        except Exception:
+            # Keep the views for the next flush rather than dropping them
+            self.pending.update(batch)
+            self.pending_views += sum(batch.values())
+            flush_failures.inc()
+            raise
+
+        views_flushed.inc(sum(batch.values()))
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self.flush_now.wait(), settings.view_flush_interval_seconds
+                )
+            except asyncio.TimeoutError:
+                pass
+            self.flush_now.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                print("Concert view flush failed", e)
+
+
+view_counter = ViewCounter()
+metrics.gauge("concert_views_pending", lambda: view_counter.pending_views)
@@ -0,0 +1,327 @@
+from dataclasses import dataclass
+from fastapi import WebSocket, WebSocketDisconnect
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+from app.config import settings
+from app.hls import PLAYLIST_MAX_AGE, PLAYLIST_NAME, RETAINED_SEGMENTS
+from app.ttl_cache import TTLCache
+from app import metrics
+import concurrent.futures
+import subprocess
+import hashlib
+import asyncio
+import httpx
+import sys
+import os
+
+INTERNAL_TOKEN_HEADER = "x-internal-token"
+
+# Addresses of every concert worker, pushed to each worker by the supervisor
+worker_addresses: list[str] = []
+
+# Start, prerender and stop calls to a worker, tried with a doubling delay
+CONTROL_ATTEMPTS = 4
+CONTROL_RETRY_SECONDS = 0.5
+# Workers answer a start or prerender once it is done, which includes fetching
+# the setlist
+CONTROL_TIMEOUT_SECONDS = 120
+
+# How often the supervisor checks its workers are still running
+WORKER_POLL_SECONDS = 2
+
+hls_proxy_hits = metrics.counter("hls_proxy_cache_hits_total")
+hls_proxy_misses = metrics.counter("hls_proxy_cache_misses_total")
+
+
+@dataclass
+class HlsFile:
+    content: bytes
+    status_code: int
+    headers: dict[str, str]
+
+
+# Every passive listener asks for the same files. Segments never change and
+# are kept until their worker drops them too, the playlist for as long as
+# players may cache it, so each reaches a worker about once.
+hls_segments: TTLCache[HlsFile] = TTLCache(
+    settings.hls_proxy_cache_entries,
+    (settings.hls_window_segments + RETAINED_SEGMENTS) * settings.hls_segment_seconds,
+)
+hls_playlists: TTLCache[HlsFile] = TTLCache(settings.max_concert_managers, PLAYLIST_MAX_AGE)
+
+
+def is_front_end() -> bool:
+    return settings.concert_workers > 0 and settings.concert_worker_address is None
+
+
+def is_worker() -> bool:
+    return settings.concert_worker_address is not None
+
+
+def owner_of(concert_id: int, workers: list[str]) -> str | None:
+    """
+    Rendezvous hashing, so adding a worker only moves the concerts it now wins.
+    None while there are no workers.
+    """
+
+    def score(worker: str) -> bytes:
+        return hashlib.sha256(f"{worker}/{concert_id}".encode()).digest()
+
+    return max(workers, key=score, default=None)
+
+
+def is_edge() -> bool:
+    return settings.relay_origin is not None
+
+
+def owns(concert_id: int) -> bool:
+    # Edges only relay what the origin streams, they never start concerts
+    if is_edge():
+        return False
+    if not is_worker():
+        return not is_front_end()
+    if not worker_addresses:
+        return False
+    return owner_of(concert_id, worker_addresses) == settings.concert_worker_address
+
+
+def internal_headers() -> dict[str, str]:
+    return {INTERNAL_TOKEN_HEADER: settings.internal_token or ""}
+
+
+def require_internal_token():
+    """
+    Workers and edges talk to each other through /internal, which refuses
+    every request until a token is configured.
+    """
+    if (is_front_end() or is_worker() or is_edge()) and not settings.internal_token:
+        raise RuntimeError("internal_token must be set to run concert workers or edges")
+
+
+class WorkerSupervisor:
+    def __init__(self):
+        self.processes: dict[str, subprocess.Popen] = {}
+        # Concerts with a stream or audience stay on their worker until idle
+        self.pinned: dict[int, str] = {}
+        # Pooled, for calls to workers and above all the HLS polls of every
+        # passive listener
+        self.client: httpx.AsyncClient | None = None
+        self.next_port = settings.concert_worker_base_port
+        self._watch_task: asyncio.Task | None = None
+
+    @property
+    def addresses(self) -> list[str]:
+        return list(self.processes.keys())
+
+    def owner(self, concert_id: int) -> str | None:
+        return self.pinned.get(concert_id) or owner_of(concert_id, self.addresses)
+
+    async def _wait_ready(self, address: str, timeout: float = 30):
+        async with httpx.AsyncClient(headers=internal_headers()) as client:
+            for _ in range(int(timeout / 0.2)):
+                try:
+                    response = await client.get(f"http://{address}/internal/health")
+                    if response.is_success:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError(f"Concert worker {address} did not start")
+
+    def _spawn(self, address: str) -> subprocess.Popen:
+        host, port = address.rsplit(":", 1)
+        env = {**os.environ, "CONCERT_WORKER_ADDRESS": address}
+        return subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", host, "--port", port],
+            env=env,
+        )
+
+    async def add_worker(self) -> str:
+        address = f"{settings.concert_worker_host}:{self.next_port}"
+        self.next_port += 1
+        self.processes[address] = self._spawn(address)
+        await self._wait_ready(address)
+        await self.rebalance()
+        return address
+
+    async def _replace_exited(self):
+        """
+        Respawn workers that exited at the same address, so concerts keep
+        their owner. One that does not come back is dropped and its concerts
+        move to the others.
+        """
+        exited = [
+            address for address, process in self.processes.items() if process.poll() is not None
+        ]
+        if not exited:
+            return
+        for address in exited:
+            print("Concert worker", address, "exited with", self.processes[address].returncode)
+            self.processes[address] = self._spawn(address)
+            try:
+                await self._wait_ready(address)
+            except RuntimeError as e:
+                print(e)
+                self.processes.pop(address).kill()
+        await self.rebalance()
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(WORKER_POLL_SECONDS)
+            try:
+                await self._replace_exited()
+            except Exception as e:
+                print("Failed to replace concert workers", repr(e))
+
+    async def rebalance(self):
+        """
+        Push the current worker set to every worker. Each releases the idle
+        concerts it no longer owns and reports the others it keeps, which
+        stay pinned to it until they are idle. Concerts are still scheduled
+        here, start jobs reach whichever worker owns a concert when they fire.
+        """
+        async with httpx.AsyncClient(headers=internal_headers()) as client:
+            responses = await asyncio.gather(
+                *(
+                    client.put(f"http://{address}/internal/workers", json=self.addresses)
+                    for address in self.addresses
+                )
+            )
+
+        self.pinned = {
+            concert_id: address
+            for address, response in zip(self.addresses, responses)
+            for concert_id in response.json()["active"]
+        }
+
+    async def start(self):
+        self.client = httpx.AsyncClient()
+        for _ in range(settings.concert_workers):
+            await self.add_worker()
+        self._watch_task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        # Stopped first, or it would respawn the workers terminated below
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            await asyncio.to_thread(process.wait)
+        self.processes.clear()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+supervisor = WorkerSupervisor()
+
+
+class RemoteConcertManager:
+    """
+    Stands in for a ConcertManager owned by a worker process, forwarding
+    control calls and listener websockets to it.
+    """
+
+    def __init__(self, id: int, address: str):
+        self.id = id
+        self.address = address
+
+    async def _request(self, method: str, path: str):
+        """
+        Retried while the worker is unreachable or failing, e.g. restarting.
+        Errors are logged and raised once the attempts run out, or at once
+        when the worker refuses the request.
+        """
+        url = f"http://{self.address}/internal/concerts/{self.id}{path}"
+        for attempt in range(CONTROL_ATTEMPTS):
+            try:
+                assert supervisor.client is not None
+                response = await supervisor.client.request(
+                    method, url, headers=internal_headers(), timeout=CONTROL_TIMEOUT_SECONDS
+                )
+                response.raise_for_status()
+                return
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                refused = isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500
+                if refused or attempt == CONTROL_ATTEMPTS - 1:
+                    print("Concert worker", self.address, "failed", method, url, repr(e))
+                    raise
+                await asyncio.sleep(CONTROL_RETRY_SECONDS * 2**attempt)
+
+    def start(self) -> concurrent.futures.Future:
+        from app.concert_manager import run_on_main_loop
+
+        return run_on_main_loop(self._request("POST", "/start"))
+
+    def start_prerender(self) -> concurrent.futures.Future:
+        from app.concert_manager import run_on_main_loop
+
+        return run_on_main_loop(self._request("POST", "/prerender"))
+
+    async def stop(self):
+        await self._request("DELETE", "")
+
+    async def fetch_hls(self, name: str) -> HlsFile:
+        """
+        Raises httpx.TransportError when the worker can't be reached.
+        """
+        cache = hls_playlists if name == PLAYLIST_NAME else hls_segments
+        cached = cache.get((self.id, name))
+        if cached is not None:
+            hls_proxy_hits.inc()
+            return cached
+
+        hls_proxy_misses.inc()
+        assert supervisor.client is not None
+        response = await supervisor.client.get(
+            f"http://{self.address}/concerts/{self.id}/hls/{name}"
+        )
+        file = HlsFile(
+            response.content,
+            response.status_code,
+            {
+                key: response.headers[key]
+                for key in ("content-type", "cache-control")
+                if key in response.headers
+            },
+        )
+        if response.is_success:
+            cache.set((self.id, name), file)
+        return file
+
+    async def proxy(self, ws: WebSocket):
+        await ws.accept()
+
+        async with connect(f"ws://{self.address}/concerts/{self.id}") as upstream:
+
+            async def client_to_worker():
+                try:
+                    while True:
+                        await upstream.send(await ws.receive_text())
+                except WebSocketDisconnect:
+                    pass
+
+            async def worker_to_client():
+                try:
+                    async for message in upstream:
+                        await ws.send_text(str(message))
+                except ConnectionClosed:
+                    pass
+
+            tasks = [
+                asyncio.create_task(client_to_worker()),
+                asyncio.create_task(worker_to_client()),
+            ]
+            _, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+
+        # The worker's close code tells the client why, e.g. to retry later.
+        # 1005 and 1006 only describe a missing close frame and can't be sent
+        code = upstream.close_code
+        try:
+            await ws.close(code=code if code not in (None, 1005, 1006) else 1000)
+        except RuntimeError:
+            pass  # Already closed by the client
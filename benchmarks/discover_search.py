@@ -0,0 +1,144 @@
+"""
+Measures discover search latency over a large concert table, comparing the
+old ILIKE '%q%' scan against discover's full-text search on the GIN index:
+ranked, or upcoming first for a term matching more than
+search_rank_max_matches concerts.
+
+Concerts are generated server side under a throwaway artist, which is removed
+again afterwards unless --keep is passed. Needs a migrated database.
+
+    python -m benchmarks.discover_search --concerts 1000000
+"""
+
+from sqlalchemy import text
+from sqlmodel import Session, select, col
+from app.database import engine
+from app.models.concert import Concert
+from app.models.user import User  # noqa: F401, resolves the Artist relationships
+from app.config import settings
+from app.search import INDEX_SCANS_ONLY, RESTORE_SCANS, capped_match_count, concert_search
+import argparse
+import random
+import time
+
+WORDS = [
+    "acoustic", "ambient", "ballad", "blues", "chamber", "choir", "dance",
+    "electric", "evening", "festival", "folk", "funk", "garden", "gospel",
+    "jazz", "late", "live", "lounge", "midnight", "night", "orchestra",
+    "piano", "quartet", "rock", "session", "soul", "strings", "summer",
+    "symphony", "techno", "tour", "unplugged", "vinyl", "winter",
+]
+BENCHMARK_ARTIST = "discover-search-benchmark"
+# Common words match about a third of the table, the last query matches nothing
+QUERIES = ["jazz", "mid", "rock night", "sym", "acoustic garden sess", "vinyl", "zydeco"]
+
+
+def seed(session: Session, concerts: int) -> int:
+    # Bulk seeding takes far longer than the app's statement timeout
+    session.exec(text("SET LOCAL statement_timeout = 0"))
+    artist_id = session.exec(
+        text("INSERT INTO artist (name) VALUES (:name) RETURNING id"),
+        params={"name": BENCHMARK_ARTIST},
+    ).one()[0]
+
+    # Names of three random words and descriptions of twelve
+    words = "ARRAY[" + ", ".join(f"'{word}'" for word in WORDS) + "]"
+    pick = f"({words})[1 + floor(random() * {len(WORDS)})::int]"
+    session.exec(
+        text(
+            f"""
+            INSERT INTO concert
+                (name, description, start_time, max_capacity, ticket_price, artist_id, popularity)
+            SELECT
+                concat_ws(' ', {pick}, {pick}, {pick}),
+                concat_ws(' ', {', '.join([pick] * 12)}),
+                now() + (random() * interval '365 days'),
+                5000,
+                round((random() * 100)::numeric, 2),
+                :artist_id,
+                floor(random() * 10000)::int
+            FROM generate_series(1, :concerts)
+            """
+        ),
+        params={"artist_id": artist_id, "concerts": concerts},
+    )
+    session.commit()
+    session.exec(text("ANALYZE concert"))
+    return artist_id
+
+
+def ilike_search(session: Session, q: str):
+    like_expr = f"%{q}%"
+    query = (
+        select(Concert.id)
+        .where(col(Concert.name).ilike(like_expr) | col(Concert.description).ilike(like_expr))
+        .order_by(col(Concert.start_time).asc())
+        .limit(21)
+    )
+    return session.exec(query).all()
+
+
+def fulltext_search(session: Session, q: str):
+    # The same two steps as the first page of discover
+    search = concert_search(q)
+    assert search is not None
+    matches, rank = search
+    query = select(Concert.id).where(matches)
+    session.exec(INDEX_SCANS_ONLY)
+    count = session.exec(capped_match_count(matches)).one()
+    session.exec(RESTORE_SCANS)
+    if count > settings.search_rank_max_matches:
+        query = query.order_by(col(Concert.start_time).asc(), col(Concert.id).asc())
+    else:
+        query = query.order_by(rank.desc(), col(Concert.popularity).desc(), col(Concert.id).desc())
+    return session.exec(query.limit(21)).all()
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+def measure(session: Session, search, runs: int) -> list[float]:
+    latencies = []
+    for _ in range(runs):
+        q = random.choice(QUERIES)
+        start = time.perf_counter()
+        search(session, q)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concerts", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        print(f"Seeding {args.concerts} concerts...")
+        artist_id = seed(session, args.concerts)
+        try:
+            print(f"{'query':>9} {'p50 ms':>8} {'p99 ms':>8}")
+            for name, search in (("ilike", ilike_search), ("fulltext", fulltext_search)):
+                measure(session, search, 5)  # Warm the cache
+                latencies = measure(session, search, args.runs)
+                print(
+                    f"{name:>9} {percentile(latencies, 0.5) * 1000:>8.1f}"
+                    f" {percentile(latencies, 0.99) * 1000:>8.1f}"
+                )
+        finally:
+            if not args.keep:
+                # A query that timed out leaves the transaction aborted
+                session.rollback()
+                session.exec(text("SET LOCAL statement_timeout = 0"))
+                session.exec(
+                    text("DELETE FROM concert WHERE artist_id = :id"), params={"id": artist_id}
+                )
+                session.exec(text("DELETE FROM artist WHERE id = :id"), params={"id": artist_id})
+                session.commit()
+
+
+if __name__ == "__main__":
+    main()
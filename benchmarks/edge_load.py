@@ -0,0 +1,195 @@
+"""
+Load test for the relay tier: starts an origin and N edge processes on
+localhost, then ramps WebRTC listeners spread across the edges and reports
+how many can be served before audio delivery degrades.
+
+The concert must go live while the test runs, e.g. by pointing its start_time
+a few seconds ahead, and every process shares the configured database. Each
+process logs to a file in a temporary directory, printed at the start.
+
+    python -m benchmarks.edge_load <concert_id> --edges 1 2 4
+"""
+
+from aiortc import RTCPeerConnection, RTCSessionDescription
+from aiortc.mediastreams import MediaStreamError
+from websockets.asyncio.client import connect
+from dataclasses import dataclass
+from multiprocessing import Pool
+import subprocess
+import argparse
+import asyncio
+import secrets
+import tempfile
+import httpx
+import json
+import time
+import sys
+import os
+
+ORIGIN_PORT = 8200
+EDGE_BASE_PORT = 8201
+LISTEN_SECONDS = 10
+FRAMES_PER_SECOND = 50
+# A listener counts as served if it got at least this share of its frames
+DELIVERY_THRESHOLD = 0.95
+
+
+@dataclass
+class Server:
+    port: int
+    process: subprocess.Popen
+    log_path: str
+
+    def check_running(self):
+        if self.process.poll() is None:
+            return
+        with open(self.log_path) as log:
+            tail = "".join(log.readlines()[-20:])
+        raise RuntimeError(
+            f"Server on port {self.port} exited with {self.process.returncode},"
+            f" see {self.log_path}:\n{tail}"
+        )
+
+    def wait_ready(self):
+        for _ in range(150):
+            self.check_running()
+            try:
+                httpx.get(f"http://127.0.0.1:{self.port}/docs")
+                return
+            except httpx.TransportError:
+                time.sleep(0.2)
+        raise RuntimeError(f"Server on port {self.port} did not start")
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def spawn(port: int, env: dict[str, str], log_dir: str) -> Server:
+    log_path = os.path.join(log_dir, f"{port}.log")
+    # Appended to, as every run of edges reuses the same ports
+    with open(log_path, "a") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+            env={**os.environ, **env},
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    return Server(port, process, log_path)
+
+
+async def listen(url: str) -> int:
+    pc = RTCPeerConnection()
+    pc.addTransceiver("audio", direction="recvonly")
+    received = 0
+    first_frame = asyncio.Event()
+
+    @pc.on("track")
+    def on_track(track):
+        async def consume():
+            nonlocal received
+            try:
+                while True:
+                    await track.recv()
+                    received += 1
+                    first_frame.set()
+            except MediaStreamError:
+                pass
+
+        asyncio.ensure_future(consume())
+
+    async with connect(url) as ws:
+
+        async def send_offer():
+            await pc.setLocalDescription(await pc.createOffer())
+            await ws.send(json.dumps({"type": "offer", "sdp": pc.localDescription.sdp}))
+
+        async def signaling():
+            async for message in ws:
+                data = json.loads(message)
+                if data["type"] == "answer":
+                    await pc.setRemoteDescription(
+                        RTCSessionDescription(sdp=data["sdp"], type="answer")
+                    )
+                elif data["type"] == "renegotiate":
+                    await send_offer()
+
+        await send_offer()
+        signaling_task = asyncio.create_task(signaling())
+        await first_frame.wait()
+        received = 0
+        await asyncio.sleep(LISTEN_SECONDS)
+        signaling_task.cancel()
+
+    await pc.close()
+    return received
+
+
+async def run_listeners(urls: list[str]) -> list[int]:
+    return await asyncio.gather(*(listen(url) for url in urls))
+
+
+def run_listener_batch(urls: list[str]) -> list[int]:
+    return asyncio.run(run_listeners(urls))
+
+
+def measure(edge_ports: list[int], concert_id: int, listeners: int, processes: int) -> int:
+    urls = [
+        f"ws://127.0.0.1:{edge_ports[i % len(edge_ports)]}/concerts/{concert_id}"
+        for i in range(listeners)
+    ]
+    batches = [urls[i::processes] for i in range(processes)]
+    with Pool(processes) as pool:
+        results = [frames for batch in pool.map(run_listener_batch, batches) for frames in batch]
+
+    expected = LISTEN_SECONDS * FRAMES_PER_SECOND
+    return sum(1 for frames in results if frames >= expected * DELIVERY_THRESHOLD)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("concert_id", type=int)
+    parser.add_argument("--edges", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--step", type=int, default=50)
+    parser.add_argument("--max-listeners", type=int, default=2000)
+    parser.add_argument("--client-processes", type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+
+    # Edges pull the concert feed from the origin's /internal routes
+    env = {"INTERNAL_TOKEN": secrets.token_urlsafe(32)}
+    log_dir = tempfile.mkdtemp(prefix="edge_load-")
+    print(f"Server logs in {log_dir}")
+
+    origin = spawn(ORIGIN_PORT, env, log_dir)
+    try:
+        origin.wait_ready()
+        print(f"{'edges':>6} {'capacity':>9}")
+        for edge_count in args.edges:
+            edge_ports = [EDGE_BASE_PORT + i for i in range(edge_count)]
+            edges = [
+                spawn(port, {**env, "RELAY_ORIGIN": f"127.0.0.1:{ORIGIN_PORT}"}, log_dir)
+                for port in edge_ports
+            ]
+            try:
+                for edge in edges:
+                    edge.wait_ready()
+
+                capacity = 0
+                for listeners in range(args.step, args.max_listeners + 1, args.step):
+                    served = measure(edge_ports, args.concert_id, listeners, args.client_processes)
+                    # A crashed server would otherwise read as its capacity
+                    for server in [origin, *edges]:
+                        server.check_running()
+                    if served < listeners:
+                        break
+                    capacity = listeners
+                print(f"{edge_count:>6} {capacity:>9}")
+            finally:
+                for edge in edges:
+                    edge.stop()
+    finally:
+        origin.stop()
+
+
+if __name__ == "__main__":
+    main()
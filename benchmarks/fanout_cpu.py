@@ -0,0 +1,110 @@
+"""
+Compares the CPU cost per listener of encoding Opus once per peer against
+encoding it once per concert and fanning the packets out.
+
+Each simulated peer mirrors the work an RTCRtpSender does for every frame:
+pull from its MediaRelay proxy, encode or pack the audio, then build and
+serialize the RTP packet. SRTP and the network are left out since they cost
+the same in both modes.
+
+    python -m benchmarks.fanout_cpu
+"""
+
+from aiortc import MediaStreamTrack
+from aiortc.codecs.opus import OpusEncoder
+from aiortc.contrib.media import MediaRelay
+from aiortc.mediastreams import MediaStreamError
+from aiortc.rtp import RtpPacket
+from av import AudioFrame
+from fractions import Fraction
+from app.encoded_track import OpusEncodedTrack
+import numpy as np
+import asyncio
+import time
+
+PEER_COUNTS = [10, 100, 1000]
+FRAMES = 250  # 5 seconds of audio
+SAMPLES_PER_FRAME = 960
+
+
+class SineTrack(MediaStreamTrack):
+    kind = "audio"
+
+    def __init__(self, frames: int):
+        super().__init__()
+        self.remaining = frames
+        self.pts = 0
+        # Held until every peer has subscribed so nobody misses the start
+        self.ready = asyncio.Event()
+        t = np.arange(SAMPLES_PER_FRAME * 50) / 48000
+        tone = (np.sin(2 * np.pi * 440 * t) * 8000).astype(np.int16)
+        self.tone = np.repeat(tone, 2).reshape(1, -1)
+
+    async def recv(self):
+        await self.ready.wait()
+        if self.remaining == 0:
+            self.stop()
+            raise MediaStreamError
+        self.remaining -= 1
+
+        offset = (self.pts % (SAMPLES_PER_FRAME * 50)) * 2
+        samples = self.tone[:, offset : offset + SAMPLES_PER_FRAME * 2]
+        frame = AudioFrame.from_ndarray(samples, format="s16", layout="stereo")
+        frame.sample_rate = 48000
+        frame.pts = self.pts
+        frame.time_base = Fraction(1, 48000)
+        self.pts += SAMPLES_PER_FRAME
+        return frame
+
+
+async def run_peer(track: MediaStreamTrack, encode: bool):
+    encoder = OpusEncoder()
+    sequence = 0
+    while True:
+        try:
+            data = await track.recv()
+        except MediaStreamError:
+            return
+        if encode:
+            payloads, timestamp = encoder.encode(data)
+        else:
+            payloads, timestamp = encoder.pack(data)
+        for payload in payloads:
+            RtpPacket(
+                payload_type=111,
+                sequence_number=sequence,
+                timestamp=timestamp,
+                payload=payload,
+            ).serialize()
+            sequence = (sequence + 1) & 0xFFFF
+
+
+async def measure(peers: int, encode_once: bool) -> float:
+    relay = MediaRelay()
+    sine = SineTrack(FRAMES)
+    source: MediaStreamTrack = OpusEncodedTrack(sine) if encode_once else sine
+
+    tracks = [relay.subscribe(source) for _ in range(peers)]
+    tasks = [asyncio.create_task(run_peer(track, not encode_once)) for track in tracks]
+    await asyncio.sleep(0.1)
+
+    start = time.process_time()
+    sine.ready.set()
+    await asyncio.gather(*tasks)
+    cpu = time.process_time() - start
+
+    audio_seconds = FRAMES * SAMPLES_PER_FRAME / 48000
+    # CPU milliseconds per listener per second of audio
+    return cpu / peers / audio_seconds * 1000
+
+
+async def main():
+    print(f"{'peers':>6} {'per-peer encode':>18} {'encode once':>14}  (CPU ms per listener per audio second)")
+    for peers in PEER_COUNTS:
+        per_peer = await measure(peers, encode_once=False)
+        once = await measure(peers, encode_once=True)
+        print(f"{peers:>6} {per_peer:>18.3f} {once:>14.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+Compares login throughput and event loop stalls when Argon2 verification runs
+inline in the handler (as before) against running on the hashing pool.
+
+Each simulated login awaits a short stand-in for the user query and then
+verifies the password, while a ticker task measures how late the event loop
+wakes it, which is the stall a live concert sees.
+
+    python -m benchmarks.login_throughput
+"""
+
+from app.passwords import password_hash, verify_password
+from app.config import settings
+import argparse
+import asyncio
+import time
+
+PASSWORD = "correct horse battery staple"
+
+
+async def login_inline(hashed: str):
+    await asyncio.sleep(0.001)
+    password_hash.verify(PASSWORD, hashed)
+
+
+async def login_pooled(hashed: str):
+    await asyncio.sleep(0.001)
+    await verify_password(PASSWORD, hashed)
+
+
+async def measure(login, hashed: str, logins: int) -> tuple[float, float]:
+    lags = []
+    done = False
+
+    async def ticker():
+        while not done:
+            expected = time.perf_counter() + 0.005
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - expected)
+
+    ticker_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(login(hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    done = True
+    await ticker_task
+
+    return logins / elapsed, max(lags, default=0.0)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, nargs="+", default=[10, 50, 200])
+    args = parser.parse_args()
+
+    hashed = password_hash.hash(PASSWORD)
+    print(f"hashing pool: {settings.password_hash_workers} threads")
+    print(f"{'logins':>7} {'mode':>7} {'logins/s':>9} {'max loop stall ms':>18}")
+    for logins in args.logins:
+        for mode, login in (("inline", login_inline), ("pooled", login_pooled)):
+            throughput, stall = await measure(login, hashed, logins)
+            print(f"{logins:>7} {mode:>7} {throughput:>9.1f} {stall * 1000:>18.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
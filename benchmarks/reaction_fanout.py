@@ -0,0 +1,106 @@
+"""
+Compares broadcasting reactions inline, one awaited send per listener per
+emoji (as before), against the per-tick aggregator writing through each
+listener's outbox.
+
+A crowd spams emojis for a few seconds while a share of the sockets is slow.
+Reported are the sends made, how long the last fast listener waited for a
+reaction to reach it and how late the event loop woke a ticker task.
+
+    python -m benchmarks.reaction_fanout
+"""
+
+from app.outbox import Outbox
+from app.reactions import ReactionAggregator
+import argparse
+import asyncio
+import json
+import time
+
+
+class FakeSocket:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.sends = 0
+        self.last_received = 0.0
+
+    async def _send(self):
+        self.sends += 1
+        await asyncio.sleep(self.delay)
+        self.last_received = time.perf_counter()
+
+    async def send_json(self, data):
+        json.dumps(data)
+        await self._send()
+
+    async def send_text(self, data: str):
+        await self._send()
+
+
+async def react_inline(sockets: list[FakeSocket], emoji: str):
+    for ws in sockets:
+        await ws.send_json({"type": "emoji", "emoji": emoji})
+
+
+async def measure(mode: str, listeners: int, slow: int, rate: int, seconds: float):
+    sockets = [FakeSocket(0.05 if i < slow else 0) for i in range(listeners)]
+    outboxes = [Outbox(ws) for ws in sockets]  # type: ignore[arg-type]
+    aggregator = ReactionAggregator(lambda: outboxes)
+    if mode == "batched":
+        for outbox in outboxes:
+            outbox.start()
+
+    lags = []
+    done = False
+
+    async def ticker():
+        while not done:
+            expected = time.perf_counter() + 0.005
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - expected)
+
+    ticker_task = asyncio.create_task(ticker())
+    inline_tasks = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for _ in range(max(1, rate // 100)):
+            if mode == "inline":
+                # Every listener's receive loop awaits its own broadcast
+                inline_tasks.append(asyncio.create_task(react_inline(sockets, "🎉")))
+            else:
+                aggregator.record("🎉")
+        await asyncio.sleep(0.01)
+    last_reaction = time.perf_counter()
+
+    await asyncio.gather(*inline_tasks)
+    await asyncio.sleep(0.3)
+    done = True
+    await ticker_task
+    for outbox in outboxes:
+        outbox.stop()
+    aggregator.stop()
+
+    fast = sockets[slow:]
+    delivered = max(ws.last_received for ws in fast) - last_reaction
+    return sum(ws.sends for ws in sockets), delivered, max(lags, default=0.0)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listeners", type=int, default=2000)
+    parser.add_argument("--slow", type=int, default=20)
+    parser.add_argument("--rate", type=int, default=200, help="reactions per second")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(f"{args.listeners} listeners, {args.slow} slow, {args.rate} reactions/s")
+    print(f"{'mode':>8} {'sends':>9} {'last fast delivery s':>21} {'max loop stall ms':>18}")
+    for mode in ("inline", "batched"):
+        sends, delivered, lag = await measure(
+            mode, args.listeners, args.slow, args.rate, args.seconds
+        )
+        print(f"{mode:>8} {sends:>9} {delivered:>21.2f} {lag * 1000:>18.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
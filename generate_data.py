@@ -1,11 +1,14 @@
 from app.dependencies.db import get_session
+from app.database import async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 from faker import Faker
 from app.models.artist import *
 from app.models.concert import *
 from app.models.user import *
-from app.routers.authentication import password_hash
+from app.passwords import password_hash
 from app.routers.artists import upload_media
 from fastapi import UploadFile
+from starlette.datastructures import Headers
 import random
 import numpy as np
 from synthesizer import Synthesizer, Waveform
@@ -61,7 +64,9 @@ def generate_audio_file(duration_sec=5, sample_rate=22050) -> UploadFile:
     audio_bytes.seek(0)
 
     filename = f"{fake.word()}.wav"
-    return UploadFile(filename=filename, file=audio_bytes)
+    return UploadFile(
+        filename=filename, file=audio_bytes, headers=Headers({"content-type": "audio/wav"})
+    )
 
 async def generate_user(password=None):
     plain_password = password or fake.password()
@@ -101,7 +106,8 @@ async def generate_concert(artist: Artist):
 
 async def generate_asset(artist: Artist):
     file = generate_audio_file()
-    asset = await upload_media(file, session, artist)
+    async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+        asset = await upload_media(file, async_session, artist)
     return asset
 
 async def generate_song(asset: MediaAsset, concert: Concert, existing_tracks: int):
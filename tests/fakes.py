@@ -0,0 +1,94 @@
+from aiortc import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from fastapi.websockets import WebSocketState
+import asyncio
+import json
+import av
+import io
+import numpy as np
+
+
+class FakeSocket:
+    """
+    Records what the app writes to a listener's websocket. Writes block while
+    the socket is paused, like a client that stopped reading, and the client
+    only ever sends its leaving.
+    """
+
+    def __init__(self):
+        self.frames: list[dict] = []
+        self.closed_with: int | None = None
+        self.writable = asyncio.Event()
+        self.writable.set()
+        self.client_state = WebSocketState.CONNECTED
+        self.application_state = WebSocketState.CONNECTED
+        self.incoming: asyncio.Queue[dict] = asyncio.Queue()
+
+    def pause(self):
+        self.writable.clear()
+
+    def resume(self):
+        self.writable.set()
+
+    def leave(self):
+        self.incoming.put_nowait({"type": "websocket.disconnect", "code": 1000})
+
+    async def accept(self):
+        pass
+
+    async def receive(self) -> dict:
+        return await self.incoming.get()
+
+    async def send_text(self, frame: str):
+        await self.writable.wait()
+        self.frames.append(json.loads(frame))
+
+    async def send_json(self, data: dict):
+        await self.send_text(json.dumps(data))
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+        self.client_state = WebSocketState.DISCONNECTED
+        self.application_state = WebSocketState.DISCONNECTED
+
+
+class FakeFeed(MediaStreamTrack):
+    """
+    Plays the given frames, then ends like a dropped origin feed.
+    """
+
+    kind = "audio"
+
+    def __init__(self, frames: list[str]):
+        super().__init__()
+        self.frames = list(frames)
+
+    async def recv(self):
+        await asyncio.sleep(0)
+        if not self.frames:
+            raise MediaStreamError
+        return self.frames.pop(0)
+
+
+async def settle():
+    """
+    Let every ready task run until none is left waiting on another.
+    """
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def wav_bytes(samples: int = 4800) -> bytes:
+    """
+    A silent mono WAV at 48 kHz.
+    """
+    file = io.BytesIO()
+    with av.open(file, "w", format="wav") as container:
+        stream = container.add_stream("pcm_s16le", rate=48000)
+        frame = av.AudioFrame.from_ndarray(
+            np.zeros((1, samples), np.int16), format="s16", layout="mono"
+        )
+        frame.sample_rate = 48000
+        for packet in stream.encode(frame):
+            container.mux(packet)
+    return file.getvalue()
@@ -0,0 +1,120 @@
+from aiortc import RTCPeerConnection
+from app.admission import capacity_share, listener_budget, waiting_rooms
+from app.concert_manager import (
+    REJECTED_CLOSE_CODE,
+    STOPPED_CLOSE_CODE,
+    ConcertManager,
+    Listener,
+)
+from app.config import settings
+from app.outbox import Outbox
+from tests.fakes import FakeSocket, settle
+import asyncio
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def roomy_process(monkeypatch):
+    # Only the concert's capacity limits who gets in
+    monkeypatch.setattr(settings, "listener_cpu_budget", 1000.0)
+    monkeypatch.setattr(listener_budget, "in_use", 0)
+
+
+@pytest.fixture
+async def manager():
+    manager = ConcertManager(1)
+    manager.capacity = 1
+    yield manager
+    await manager.stop()
+
+
+def make_listener() -> Listener:
+    ws = FakeSocket()
+    return {"pc": RTCPeerConnection(), "ws": ws, "outbox": Outbox(ws)}  # type: ignore[typeddict-item]
+
+
+async def join(manager: ConcertManager) -> tuple[Listener, asyncio.Task]:
+    listener = make_listener()
+    task = asyncio.create_task(manager.add_listener(listener))
+    await settle()
+    return listener, task
+
+
+async def test_waiting_listeners_are_let_in_first_come_first_served(manager):
+    _, first = await join(manager)
+    second_listener, second = await join(manager)
+    third_listener, third = await join(manager)
+    assert first.done() and not second.done() and not third.done()
+
+    await manager.remove_listener(first.result())
+    await settle()
+    assert second.done() and not third.done()
+    assert {"type": "admitted"} in second_listener["ws"].frames
+
+    await manager.remove_listener(second.result())
+    await settle()
+    assert third.done()
+    assert third.result() in manager.listeners
+
+
+async def test_leaving_gives_the_slot_back(manager):
+    _, first = await join(manager)
+    assert listener_budget.in_use == 1
+
+    await manager.remove_listener(first.result())
+    assert listener_budget.in_use == 0
+    _, second = await join(manager)
+    assert second.done() and second.result() is not None
+
+
+async def test_leaving_the_waiting_room_drops_the_place(manager):
+    await join(manager)
+    listener, waiting = await join(manager)
+    assert len(manager.waiting) == 1
+
+    listener["ws"].leave()
+    await settle()
+    assert await waiting is None
+    assert not manager.waiting
+
+
+async def test_full_waiting_room_turns_listeners_away(manager, monkeypatch):
+    monkeypatch.setattr(settings, "waiting_room_size", 1)
+    await join(manager)
+    await join(manager)
+
+    listener, rejected = await join(manager)
+    assert await rejected is None
+    assert listener["ws"].closed_with == REJECTED_CLOSE_CODE
+
+
+async def test_cancelled_after_admission_gives_the_slot_back(manager):
+    _, first = await join(manager)
+    _, second = await join(manager)
+
+    # Admitted by the first leaving, then gone before registering
+    await manager.remove_listener(first.result())
+    second.cancel()
+    await settle()
+
+    assert second.cancelled()
+    assert manager._reserved == 0
+    assert listener_budget.in_use == 0
+
+
+async def test_waiting_listeners_keep_the_manager_and_leave_with_it(manager):
+    manager.capacity = 0
+    listener, waiting = await join(manager)
+    assert not manager.listeners
+    assert not manager.is_idle
+
+    await manager.stop()
+    assert await waiting is None
+    assert listener["ws"].closed_with == STOPPED_CLOSE_CODE
+    assert manager.is_idle
+    assert manager not in waiting_rooms
+
+
+def test_capacity_is_split_between_relaying_processes(monkeypatch):
+    monkeypatch.setattr(settings, "relay_processes", 3)
+    assert capacity_share(5000) == 1666
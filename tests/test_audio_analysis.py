@@ -0,0 +1,138 @@
+from app.audio_analysis import (
+    ANALYSIS_SAMPLE_RATE,
+    CHUNK_SAMPLES,
+    PEAKS_HEADER,
+    PEAKS_LEVEL,
+    PEAKS_MAGIC,
+    PEAKS_MIN_COUNT,
+    PEAKS_SAMPLES_PER_PEAK,
+    PEAKS_VERSION,
+    AudioAnalyser,
+    playback_gain,
+)
+from app.config import settings
+import numpy as np
+import pytest
+
+
+def sine(frequency: float, seconds: float, amplitude: float = 1.0, phase: float = 0.0):
+    t = np.arange(int(seconds * ANALYSIS_SAMPLE_RATE)) / ANALYSIS_SAMPLE_RATE
+    return amplitude * np.sin(2 * np.pi * frequency * t + phase)
+
+
+def analyse(*chunks: np.ndarray) -> AudioAnalyser:
+    analyser = AudioAnalyser()
+    for chunk in chunks:
+        analyser.add(chunk)
+    return analyser
+
+
+def test_full_scale_sine_in_one_channel_measures_minus_3_lufs():
+    # The BS.1770 calibration point
+    left = sine(997, 3)
+    analyser = analyse(np.stack([left, np.zeros_like(left)]))
+    assert analyser.integrated_loudness() == pytest.approx(-3.01, abs=0.01)
+
+
+def test_full_scale_stereo_sine_measures_0_lufs():
+    left = sine(997, 3)
+    analyser = analyse(np.stack([left, left]))
+    assert analyser.integrated_loudness() == pytest.approx(0.0, abs=0.01)
+    assert analyser.true_peak() == pytest.approx(0.0, abs=0.01)
+
+
+def test_true_peak_finds_the_peak_between_samples():
+    # A quarter of the sample rate at 45 degrees only ever samples +-0.707
+    wave = sine(ANALYSIS_SAMPLE_RATE / 4, 1, phase=np.pi / 4)
+    assert 20 * np.log10(np.abs(wave).max()) == pytest.approx(-3.01, abs=0.01)
+
+    analyser = analyse(np.stack([wave, wave]))
+    assert analyser.true_peak() == pytest.approx(0.0, abs=0.1)
+
+
+def test_gates_leave_out_silence_and_quiet_passages():
+    loud = sine(997, 3)
+    quiet = sine(997, 3, amplitude=10 ** (-30 / 20))
+    silence = np.zeros(3 * ANALYSIS_SAMPLE_RATE)
+
+    # The blocks fading into the silence still count, so it follows in both
+    reference = np.concatenate([loud, silence])
+    gapped = np.concatenate([loud, silence, silence, quiet, silence])
+    assert analyse(np.stack([gapped, gapped])).integrated_loudness() == pytest.approx(
+        analyse(np.stack([reference, reference])).integrated_loudness(), abs=1e-6
+    )
+
+
+def test_everything_under_the_absolute_gate_has_no_loudness():
+    faint = sine(997, 3, amplitude=10 ** (-75 / 20))
+    analyser = analyse(np.stack([faint, faint]))
+    assert analyser.integrated_loudness() is None
+    assert analyser.true_peak() == pytest.approx(-75, abs=0.01)
+
+
+def test_silence_and_clips_shorter_than_a_block_have_no_loudness():
+    silence = np.zeros((2, 3 * ANALYSIS_SAMPLE_RATE))
+    assert analyse(silence).integrated_loudness() is None
+    assert analyse(silence).true_peak() is None
+
+    short = sine(997, 0.399)
+    assert analyse(np.stack([short, short])).integrated_loudness() is None
+
+
+def test_peaks_round_trip():
+    count = PEAKS_MIN_COUNT * 4 + 1
+    wave = sine(5, count * PEAKS_SAMPLES_PER_PEAK / ANALYSIS_SAMPLE_RATE, amplitude=0.5)
+    data = analyse(np.stack([wave, -wave])).peaks()
+
+    magic, version, rate, samples_per_peak, levels = PEAKS_HEADER.unpack_from(data)
+    assert (magic, version, rate, samples_per_peak) == (
+        PEAKS_MAGIC,
+        PEAKS_VERSION,
+        ANALYSIS_SAMPLE_RATE,
+        PEAKS_SAMPLES_PER_PEAK,
+    )
+
+    offset = PEAKS_HEADER.size
+    counts = []
+    pairs = []
+    for _ in range(levels):
+        (level_count,) = PEAKS_LEVEL.unpack_from(data, offset)
+        offset += PEAKS_LEVEL.size
+        counts.append(level_count)
+        pairs.append(np.frombuffer(data, np.int8, level_count * 2, offset).reshape(-1, 2))
+        offset += level_count * 2
+    assert offset == len(data)
+
+    # Halved, rounding up, until no more than the minimum is left
+    assert counts == [count, 257, 129, 65]
+    assert counts[-2] > PEAKS_MIN_COUNT >= counts[-1]
+
+    # Both channels share a peak, mirrored around zero
+    for level in pairs:
+        assert (level[:, 0] == -level[:, 1]).all()
+        assert level[:, 1].max() == round(0.5 * 127)
+    assert pairs[-1][:, 0].min() == -64
+
+
+def test_gain_is_held_back_by_the_true_peak_ceiling(monkeypatch):
+    monkeypatch.setattr(settings, "loudness_target_lufs", -14.0)
+    monkeypatch.setattr(settings, "true_peak_ceiling_dbtp", -1.0)
+
+    assert playback_gain(-20.0, -10.0) == pytest.approx(10 ** (6 / 20))
+    # 6 dB up would take the peak to +1 dBTP
+    assert playback_gain(-20.0, -5.0) == pytest.approx(10 ** (4 / 20))
+    assert playback_gain(-20.0, None) == pytest.approx(10 ** (6 / 20))
+    assert playback_gain(None, -5.0) == 1.0
+
+
+def test_chunked_input_measures_the_same_as_one_chunk():
+    rng = np.random.default_rng(0)
+    samples = rng.uniform(-0.5, 0.5, (2, CHUNK_SAMPLES * 3 + 12345))
+    whole = analyse(samples)
+    # Whole chunks, then a short final one
+    starts = range(0, samples.shape[1], CHUNK_SAMPLES)
+    chunked = analyse(*(samples[:, start : start + CHUNK_SAMPLES] for start in starts))
+
+    assert chunked.integrated_loudness() == pytest.approx(whole.integrated_loudness(), abs=1e-9)
+    assert chunked.true_peak() == pytest.approx(whole.true_peak(), abs=1e-9)
+    assert chunked.peaks() == whole.peaks()
@@ -0,0 +1,59 @@
+from app.concert_jobs import start_job_id
+from app.dependencies import concerts
+from app.dependencies.concerts import sync_concert_managers
+from app.models.concert import Concert
+from datetime import datetime, timedelta
+import pytest
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def exec(self, query):
+        return FakeResult(self.rows)
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """
+    A job store holding concert 1's start job, counting its reads.
+    """
+    reads = []
+    scheduled = []
+
+    def scheduled_job_ids():
+        reads.append(1)
+        return {start_job_id(1)}
+
+    monkeypatch.setattr(concerts, "is_leader", lambda: True)
+    monkeypatch.setattr(concerts, "scheduled_job_ids", scheduled_job_ids)
+    monkeypatch.setattr(concerts, "schedule_concerts", scheduled.extend)
+    return reads, scheduled
+
+
+async def test_only_missing_start_jobs_are_scheduled_from_one_read(scheduler):
+    reads, scheduled = scheduler
+    start_time = datetime.now() + timedelta(hours=1)
+    rows = [Concert(id=concert_id, artist_id=1, start_time=start_time) for concert_id in (1, 2, 3)]
+
+    await sync_concert_managers(FakeSession(rows))  # type: ignore[arg-type]
+    assert len(reads) == 1
+    assert scheduled == [(2, start_time), (3, start_time)]
+
+
+async def test_nothing_is_scheduled_when_every_job_exists(scheduler):
+    reads, scheduled = scheduler
+    rows = [Concert(id=1, artist_id=1, start_time=datetime.now() + timedelta(hours=1))]
+
+    await sync_concert_managers(FakeSession(rows))  # type: ignore[arg-type]
+    assert len(reads) == 1
+    assert scheduled == []
@@ -0,0 +1,94 @@
+"""
+Discover ranks searches matching few concerts and lists the rest upcoming
+first, with every page of a search following its first.
+
+Needs the configured Postgres database, and is skipped when it cannot be
+reached. Seeds a throwaway artist with concerts and removes it afterwards.
+"""
+
+from datetime import datetime, timedelta
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, select
+from app.config import settings
+from app.database import async_engine, engine
+from app.main import app
+from app.models.artist import Artist
+from app.models.concert import Concert
+from app.models.user import User  # noqa: F401, resolves the Artist relationships
+import pytest
+
+CONCERTS = 9
+
+
+@pytest.fixture(scope="module")
+def concerts():
+    try:
+        with engine.connect():
+            pass
+    except OperationalError:
+        pytest.skip("Postgres is not reachable")
+
+    with Session(engine) as session:
+        artist = Artist(name="discover-search-test")
+        session.add(artist)
+        session.commit()
+        # Later concerts mention the term more, so rank and start time disagree
+        start = datetime.now() + timedelta(days=1)
+        for n in range(CONCERTS):
+            session.add(
+                Concert(
+                    name="zebra " * (n + 1),
+                    start_time=start + timedelta(hours=n),
+                    artist_id=artist.id,  # type: ignore[arg-type]
+                )
+            )
+        session.commit()
+        ids = session.exec(
+            select(Concert.id).where(Concert.artist_id == artist.id).order_by(Concert.start_time)  # type: ignore[arg-type]
+        ).all()
+        try:
+            yield artist.id, list(ids)
+        finally:
+            for concert in session.exec(select(Concert).where(Concert.artist_id == artist.id)).all():
+                session.delete(concert)
+            session.delete(artist)
+            session.commit()
+
+
+@pytest.fixture
+async def client(concerts):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+    # Pooled connections belong to this test's event loop
+    await async_engine.dispose()
+
+
+async def search(client: AsyncClient, artist_id: int, limit: int) -> list[int]:
+    ids, cursor = [], None
+    while True:
+        params = {"q": "zebra", "artist_id": artist_id, "limit": limit}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = await client.get("/concerts/discover", params=params)
+        response.raise_for_status()
+        page = response.json()
+        ids += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+# Each test pages with its own limit, so none is served another's cached pages
+async def test_few_matches_are_ranked(concerts, client, monkeypatch):
+    artist_id, upcoming = concerts
+    monkeypatch.setattr(settings, "search_rank_max_matches", CONCERTS)
+
+    assert await search(client, artist_id, limit=2) == upcoming[::-1]
+
+
+async def test_too_many_matches_are_listed_upcoming_first(concerts, client, monkeypatch):
+    artist_id, upcoming = concerts
+    monkeypatch.setattr(settings, "search_rank_max_matches", CONCERTS - 1)
+
+    assert await search(client, artist_id, limit=3) == upcoming
@@ -0,0 +1,18 @@
+from app.concert_manager import ConcertManager
+from app.dependencies.concerts import concert_managers, evict_idle_managers
+from tests.fakes import FakeFeed, settle
+
+
+async def test_stopped_live_manager_is_evicted():
+    manager = ConcertManager(1)
+    concert_managers[1] = manager
+    await manager._go_live(FakeFeed(["frame"] * 1000))
+    await settle()
+    assert manager.is_live
+
+    await manager.stop()
+    assert not manager.is_live
+    assert manager.is_idle
+
+    evict_idle_managers()
+    assert 1 not in concert_managers
@@ -0,0 +1,83 @@
+from app.config import settings
+from app.hls import HlsSegmenter
+from app.transcode import CANONICAL_SAMPLE_RATE
+from tests.fakes import FakeFeed
+import av
+import io
+import numpy as np
+import pytest
+
+FRAME_SAMPLES = 960
+
+
+def audio_frames(count: int) -> list[av.AudioFrame]:
+    frames = []
+    for index in range(count):
+        t = (np.arange(FRAME_SAMPLES) + index * FRAME_SAMPLES) / CANONICAL_SAMPLE_RATE
+        tone = (np.sin(2 * np.pi * 440 * t) * 10000).astype(np.int16)
+        frame = av.AudioFrame.from_ndarray(
+            np.repeat(tone, 2).reshape(1, -1), format="s16", layout="stereo"
+        )
+        frame.sample_rate = CANONICAL_SAMPLE_RATE
+        frame.pts = index * FRAME_SAMPLES
+        frames.append(frame)
+    return frames
+
+
+def decoded_samples(data: bytes) -> int:
+    with av.open(io.BytesIO(data)) as container:
+        return sum(frame.samples for frame in container.decode(audio=0))
+
+
+@pytest.fixture(autouse=True)
+def short_segments(monkeypatch):
+    # Ten frames per segment
+    monkeypatch.setattr(settings, "hls_segment_seconds", 0.2)
+    monkeypatch.setattr(settings, "hls_window_segments", 3)
+
+
+async def segmented(frame_count: int) -> HlsSegmenter:
+    segmenter = HlsSegmenter(FakeFeed(audio_frames(frame_count)))  # type: ignore[arg-type]
+    segmenter.start()
+    assert segmenter.task is not None
+    await segmenter.task
+    return segmenter
+
+
+async def test_playlist_rolls_over_the_window_and_ends():
+    segmenter = await segmented(45)
+    assert segmenter.sequence == 5
+
+    lines = segmenter.playlist.decode().splitlines()
+    assert lines[:4] == [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        "#EXT-X-TARGETDURATION:1",
+        "#EXT-X-MEDIA-SEQUENCE:2",
+    ]
+    names = [line for line in lines if line.startswith("segment-")]
+    assert names == [f"segment-{segmenter.run}-{sequence}.ts" for sequence in (2, 3, 4)]
+    assert lines[-1] == "#EXT-X-ENDLIST"
+
+    # Older segments stay fetchable for a while after leaving the playlist
+    assert segmenter.segment(f"segment-{segmenter.run}-0.ts") is not None
+    assert segmenter.segment("segment-other-0.ts") is None
+
+
+async def test_segments_decode_on_their_own_and_cover_the_stream():
+    segmenter = await segmented(45)
+
+    total = 0
+    for segment in segmenter.segments:
+        samples = decoded_samples(segment.data)
+        assert samples > 0
+        total += samples
+    # Give or take the encoder's priming and padding
+    assert abs(total - 45 * FRAME_SAMPLES) <= 3 * segmenter.encoder.frame_size
+
+
+async def test_stream_ending_on_a_boundary_leaves_no_flush_only_segment():
+    segmenter = await segmented(40)
+    assert segmenter.sequence == 4
+    assert decoded_samples(segmenter.segments[-1].data) > 0
+    assert segmenter.playlist.decode().endswith("#EXT-X-ENDLIST\n")
@@ -0,0 +1,64 @@
+from app.workers import RemoteConcertManager, hls_playlists, hls_segments, supervisor
+import httpx
+import pytest
+
+
+@pytest.fixture
+async def worker(monkeypatch):
+    requests: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        if request.url.path.endswith("missing.ts"):
+            return httpx.Response(404)
+        return httpx.Response(
+            200, content=b"data", headers={"content-type": "video/mp2t", "x-other": "1"}
+        )
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(supervisor, "client", client)
+    yield requests
+    await client.aclose()
+    hls_segments.clear()
+    hls_playlists.clear()
+
+
+async def test_segments_reach_the_worker_once(worker):
+    remote = RemoteConcertManager(1, "worker:8100")
+    for _ in range(3):
+        file = await remote.fetch_hls("segment-run-0.ts")
+        assert file.content == b"data"
+        assert file.headers == {"content-type": "video/mp2t"}
+
+    assert worker == ["/concerts/1/hls/segment-run-0.ts"]
+
+
+async def test_playlist_is_only_kept_for_its_max_age(worker, monkeypatch):
+    remote = RemoteConcertManager(1, "worker:8100")
+    await remote.fetch_hls("playlist.m3u8")
+    await remote.fetch_hls("playlist.m3u8")
+    assert len(worker) == 1
+
+    monkeypatch.setattr(hls_playlists, "ttl", 0)
+    hls_playlists.clear()
+    await remote.fetch_hls("playlist.m3u8")
+    await remote.fetch_hls("playlist.m3u8")
+    assert len(worker) == 3
+
+
+async def test_errors_are_not_kept(worker):
+    remote = RemoteConcertManager(1, "worker:8100")
+    assert (await remote.fetch_hls("missing.ts")).status_code == 404
+    await remote.fetch_hls("missing.ts")
+    assert len(worker) == 2
+
+
+async def test_unreachable_worker_raises_a_transport_error(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("refused", request=request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(supervisor, "client", client)
+    with pytest.raises(httpx.TransportError):
+        await RemoteConcertManager(1, "worker:8100").fetch_hls("segment-run-0.ts")
+    await client.aclose()
@@ -0,0 +1,62 @@
+from aiortc import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from app import concert_manager
+from app.concert_manager import ConcertManager, ListenerTrack
+from tests.fakes import FakeFeed
+import asyncio
+import pytest
+
+
+def go_live(manager: ConcertManager, track: MediaStreamTrack):
+    manager.broadcast_track = track
+    manager.live_event.set()
+
+
+def lose_feed(manager: ConcertManager):
+    manager.broadcast_track = None
+    manager.live_event.clear()
+
+
+async def test_waits_for_the_concert_to_go_live():
+    manager = ConcertManager(1)
+    track = ListenerTrack(manager)
+
+    frame = asyncio.create_task(track.recv())
+    await asyncio.sleep(0.01)
+    assert not frame.done()
+
+    go_live(manager, FakeFeed(["a"]))
+    assert await asyncio.wait_for(frame, 1) == "a"
+    track.stop()
+
+
+async def test_edge_listener_follows_the_feed_once_it_comes_back(monkeypatch):
+    monkeypatch.setattr(concert_manager, "is_edge", lambda: True)
+    manager = ConcertManager(1)
+    track = ListenerTrack(manager)
+
+    go_live(manager, FakeFeed(["a", "b"]))
+    assert await track.recv() == "a"
+    assert await track.recv() == "b"
+
+    # Feed ended, the track keeps waiting rather than ending the sender
+    frame = asyncio.create_task(track.recv())
+    await asyncio.sleep(0.05)
+    assert not frame.done()
+
+    lose_feed(manager)
+    go_live(manager, FakeFeed(["c"]))
+    assert await asyncio.wait_for(frame, 1) == "c"
+    track.stop()
+
+
+async def test_origin_listener_ends_with_the_broadcast(monkeypatch):
+    monkeypatch.setattr(concert_manager, "is_edge", lambda: False)
+    manager = ConcertManager(1)
+    track = ListenerTrack(manager)
+
+    go_live(manager, FakeFeed(["a"]))
+    assert await track.recv() == "a"
+    with pytest.raises(MediaStreamError):
+        await asyncio.wait_for(track.recv(), 1)
+    track.stop()
@@ -0,0 +1,27 @@
+from app.audio_probe import probe_audio
+from app.routers import media
+from app.routers.media import get_media
+from app.storage import LocalStorage, audio_extensions
+from tests.fakes import wav_bytes
+import io
+
+
+def test_stored_extension_comes_from_the_container():
+    metadata, container_format = probe_audio(io.BytesIO(wav_bytes()))
+    assert audio_extensions[container_format] == ".wav"
+    assert metadata["frequency"] == 48000
+
+
+async def test_media_is_served_as_its_stored_type(tmp_path, monkeypatch):
+    monkeypatch.setitem(media.backends, "local", LocalStorage(str(tmp_path)))
+    (tmp_path / "1").mkdir()
+    (tmp_path / "1" / "a.wav").write_bytes(wav_bytes())
+    (tmp_path / "1" / "b.html").write_bytes(b"<script>alert(1)</script>")
+
+    audio = await get_media("1", "a.wav")
+    assert audio.media_type == "audio/wav"
+    assert audio.headers["x-content-type-options"] == "nosniff"
+
+    # Whatever got stored under another name is never rendered as a page
+    other = await get_media("1", "b.html")
+    assert other.media_type == "application/octet-stream"
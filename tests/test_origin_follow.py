@@ -0,0 +1,137 @@
+from aiortc import RTCPeerConnection
+from app import concert_manager
+from app.admission import listener_budget
+from app.concert_manager import ConcertManager, Listener
+from app.origin_feed import CONCERT_ENDED_CLOSE_CODE, FEED_READY_MESSAGE, pack_feed_packet
+from app.outbox import Outbox
+from av.packet import Packet
+from contextlib import asynccontextmanager
+from tests.fakes import FakeSocket
+from websockets.exceptions import ConnectionClosedError
+from websockets.frames import Close
+import asyncio
+import pytest
+
+
+def feed_packet(pts: int) -> bytes:
+    packet = Packet(b"opus")
+    packet.pts = pts
+    return pack_feed_packet(packet)
+
+
+class FakeConnection:
+    """
+    Hands out the given messages, then closes with the given code, or stays
+    open without one.
+    """
+
+    def __init__(self, messages: list[bytes | str], close_code: int | None):
+        self.messages = list(messages)
+        self.code = close_code
+        self.close_code: int | None = None
+
+    async def recv(self) -> bytes | str:
+        await asyncio.sleep(0)
+        if not self.messages:
+            if self.code is None:
+                await asyncio.Event().wait()
+            self.close_code = self.code
+            raise ConnectionClosedError(Close(self.code, ""), None)
+        return self.messages.pop(0)
+
+
+@pytest.fixture
+def origin(monkeypatch):
+    """
+    Serves the queued connections to the edge, one per connect.
+    """
+    connections: list[FakeConnection] = []
+    connects: list[str] = []
+
+    @asynccontextmanager
+    async def connect(url: str, additional_headers=None):
+        connects.append(url)
+        yield connections.pop(0)
+
+    monkeypatch.setattr(concert_manager, "connect", connect)
+    monkeypatch.setattr(concert_manager, "ORIGIN_RETRY_SECONDS", 0)
+    monkeypatch.setattr(listener_budget, "in_use", 1)
+    return connections, connects
+
+
+def make_listener() -> Listener:
+    ws = FakeSocket()
+    return {"pc": RTCPeerConnection(), "ws": ws, "outbox": Outbox(ws)}  # type: ignore[typeddict-item]
+
+
+async def test_feed_lost_before_going_live_is_retried(origin):
+    connections, connects = origin
+    connections += [FakeConnection([], 1011), FakeConnection([], CONCERT_ENDED_CLOSE_CODE)]
+    manager = ConcertManager(1)
+    listener = make_listener()
+    manager.listeners["a"] = listener
+
+    await asyncio.wait_for(manager._follow_origin(), 1)
+
+    assert len(connects) == 2
+    assert manager.finished
+    assert not manager.listeners
+    assert listener["ws"].closed_with is not None
+
+
+async def test_concert_ending_on_the_origin_ends_it_on_the_edge(origin):
+    connections, connects = origin
+    connections.append(
+        FakeConnection([FEED_READY_MESSAGE, feed_packet(0)], CONCERT_ENDED_CLOSE_CODE)
+    )
+    manager = ConcertManager(1)
+    manager.listeners["a"] = make_listener()
+
+    await asyncio.wait_for(manager._follow_origin(), 1)
+
+    assert len(connects) == 1
+    assert manager.finished
+    assert manager.is_idle
+
+
+async def test_clean_close_after_going_live_ends_the_concert(origin):
+    connections, connects = origin
+    connections.append(FakeConnection([FEED_READY_MESSAGE, feed_packet(0)], 1000))
+    manager = ConcertManager(1)
+    manager.listeners["a"] = make_listener()
+
+    await asyncio.wait_for(manager._follow_origin(), 1)
+
+    assert len(connects) == 1
+    assert not manager.listeners
+
+
+async def test_feed_lost_while_live_is_reconnected(origin):
+    connections, connects = origin
+    connections += [
+        FakeConnection([FEED_READY_MESSAGE, feed_packet(0)], 1011),
+        FakeConnection([FEED_READY_MESSAGE, feed_packet(0)], CONCERT_ENDED_CLOSE_CODE),
+    ]
+    manager = ConcertManager(1)
+    manager.listeners["a"] = make_listener()
+
+    await asyncio.wait_for(manager._follow_origin(), 1)
+
+    assert len(connects) == 2
+    assert not manager.listeners
+
+
+async def test_last_listener_leaving_stops_following(origin):
+    connections, _ = origin
+    connections.append(FakeConnection([FEED_READY_MESSAGE, feed_packet(0)], None))
+    manager = ConcertManager(1)
+    manager.listeners["a"] = make_listener()
+    manager._origin_task = asyncio.create_task(manager._follow_origin())
+    while not manager.is_live:
+        await asyncio.sleep(0)
+
+    following = manager._origin_task
+    await manager.remove_listener("a")
+    with pytest.raises(asyncio.CancelledError):
+        await following
+    assert manager.is_idle
@@ -0,0 +1,86 @@
+from app.config import settings
+from app.outbox import OVERFLOW_CLOSE_CODE, Outbox
+from tests.fakes import FakeSocket, settle
+import json
+import pytest
+
+
+@pytest.fixture
+def ws():
+    return FakeSocket()
+
+
+@pytest.fixture
+async def outbox(ws):
+    outbox = Outbox(ws)  # type: ignore[arg-type]
+    outbox.start()
+    yield outbox
+    outbox.stop()
+
+
+async def test_signaling_is_delivered_in_order(ws, outbox):
+    for n in range(5):
+        outbox.send({"type": "candidate", "n": n})
+    await settle()
+
+    assert [frame["n"] for frame in ws.frames] == list(range(5))
+
+
+async def test_signaling_goes_before_a_waiting_reaction_frame(ws, outbox):
+    ws.pause()
+    outbox.send({"type": "answer"})
+    await settle()
+    # Held up writing the answer, everything below waits behind it
+    outbox.put_latest(json.dumps({"type": "reactions", "counts": {"🎉": 1}}))
+    outbox.send({"type": "candidate"})
+    ws.resume()
+    await settle()
+
+    assert [frame["type"] for frame in ws.frames] == ["answer", "candidate", "reactions"]
+
+
+async def test_only_the_latest_reaction_frame_is_kept(ws, outbox):
+    ws.pause()
+    outbox.send({"type": "answer"})
+    await settle()
+    for count in (1, 2, 3):
+        outbox.put_latest(json.dumps({"type": "reactions", "counts": {"🎉": count}}))
+    assert outbox.depth == 1
+    ws.resume()
+    await settle()
+
+    assert ws.frames == [{"type": "answer"}, {"type": "reactions", "counts": {"🎉": 3}}]
+
+
+async def test_unread_signaling_overflow_closes_the_socket(ws, outbox, monkeypatch):
+    monkeypatch.setattr(settings, "outbox_max_signaling", 4)
+    ws.pause()
+    # One is taken by the blocked write, four more fill the queue
+    for n in range(6):
+        outbox.send({"type": "candidate", "n": n})
+        await settle()
+    assert outbox.overflowed
+
+    # Nothing more is queued once the listener is being dropped
+    outbox.send({"type": "candidate"})
+    outbox.put_latest("{}")
+    assert outbox.depth == 0
+
+    ws.resume()
+    await settle()
+    assert ws.closed_with == OVERFLOW_CLOSE_CODE
+    assert [frame["n"] for frame in ws.frames] == [0]
+
+
+async def test_failed_write_ends_the_writer():
+    class BrokenSocket(FakeSocket):
+        async def send_text(self, frame: str):
+            raise RuntimeError("Connection lost")
+
+    broken = Outbox(BrokenSocket())  # type: ignore[arg-type]
+    broken.start()
+    broken.send({"type": "answer"})
+    await settle()
+
+    assert broken.task is not None and broken.task.done()
+    broken.stop()
@@ -0,0 +1,54 @@
+from app.dependencies.pagination import cursor_key, encode_cursor, get_cursor
+from datetime import datetime
+from fastapi import HTTPException
+import pytest
+
+
+def test_cursor_round_trips_its_sort_key():
+    start = datetime(2026, 5, 1, 20, 30)
+    cursor = get_cursor(encode_cursor("upcoming", [start, 42]))
+
+    assert cursor_key(cursor, "upcoming", datetime.fromisoformat, int) == [start, 42]
+
+
+def test_relevance_rank_survives_the_round_trip():
+    rank = 0.10000000149011612  # A float4 rank as Postgres returns it
+    cursor = get_cursor(encode_cursor("relevance", [rank, 3, 7]))
+
+    assert cursor_key(cursor, "relevance", float, int, int) == [rank, 3, 7]
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor("popularity", [10**12, 2**40])
+    assert not set(cursor) - set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_")
+
+
+def test_no_cursor_means_first_page():
+    assert get_cursor(None) is None
+    assert cursor_key(None, "upcoming", int) is None
+
+
+# Not base64, not JSON, and a JSON list instead of an object
+@pytest.mark.parametrize("cursor", ["not base64!", "bm90IGpzb24", "WzFd"])
+def test_garbage_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        get_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_cursor_from_another_sort_order_is_rejected():
+    cursor = get_cursor(encode_cursor("popularity", [5, 1]))
+    with pytest.raises(HTTPException) as error:
+        cursor_key(cursor, "upcoming", datetime.fromisoformat, int)
+    assert error.value.status_code == 400
+
+
+def test_cursor_with_the_wrong_shape_is_rejected():
+    # An offset cursor from before relevance paged by keyset
+    cursor = get_cursor(encode_cursor("relevance", [20]))
+    with pytest.raises(HTTPException):
+        cursor_key(cursor, "relevance", float, int, int)
+
+    cursor = get_cursor(encode_cursor("upcoming", ["yesterday", 1]))
+    with pytest.raises(HTTPException):
+        cursor_key(cursor, "upcoming", datetime.fromisoformat, int)
@@ -0,0 +1,173 @@
+"""
+The concert endpoints must issue the same number of SQL queries whatever
+the page or setlist size, otherwise an N+1 crept back into ConcertPublic
+serialization.
+
+Needs the configured Postgres database, and is skipped when it cannot be
+reached. Seeds a throwaway artist with concerts and setlists and removes
+it again afterwards.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, select
+from app.config import settings
+from app.database import async_engine, engine
+from app.dependencies.users import user_cache
+from app.main import app
+from app.models.artist import Artist, MediaAsset
+from app.models.concert import Concert, ConcertSetlistItem
+from app.models.user import User
+import pytest
+import jwt
+
+PAGE_SIZES = [1, 10, 100]
+SETLIST_SIZES = [1, 5, 20]
+
+
+@contextmanager
+def count_queries():
+    counts = [0]
+
+    def on_execute(*_):
+        counts[0] += 1
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        yield counts
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", on_execute)
+
+
+def seed(session: Session) -> tuple[User, list[int]]:
+    artist = Artist(name="query-count-test")
+    session.add(artist)
+    session.commit()
+    assert artist.id is not None
+
+    user = User(username=f"query-count-test-{artist.id}", hashed_password="", artist_id=artist.id)
+    asset = MediaAsset(
+        url="", duration=1, codec="flac", bit_rate=1, frequency=48000, channels=2, artist_id=artist.id
+    )
+    session.add(user)
+    session.add(asset)
+    session.commit()
+
+    # One concert per setlist size for get/patch, then enough to fill a page
+    setlist_sizes = SETLIST_SIZES + [3] * (max(PAGE_SIZES) - len(SETLIST_SIZES))
+    concert_ids = []
+    for size in setlist_sizes:
+        concert = Concert(artist_id=artist.id)
+        session.add(concert)
+        session.commit()
+        concert_ids.append(concert.id)
+        for track_number in range(size):
+            session.add(
+                ConcertSetlistItem(
+                    name=f"Track {track_number}",
+                    track_number=track_number,
+                    asset_id=asset.id,
+                    concert_id=concert.id,
+                )
+            )
+    session.commit()
+    session.refresh(user)
+    return user, concert_ids
+
+
+def clean_up(session: Session, user: User):
+    artist_id = user.artist_id
+    concerts = session.exec(select(Concert).where(Concert.artist_id == artist_id)).all()
+    for concert in concerts:
+        for item in session.exec(
+            select(ConcertSetlistItem).where(ConcertSetlistItem.concert_id == concert.id)
+        ).all():
+            session.delete(item)
+        session.delete(concert)
+    for asset in session.exec(select(MediaAsset).where(MediaAsset.artist_id == artist_id)).all():
+        session.delete(asset)
+    session.delete(user)
+    session.commit()
+    artist = session.get(Artist, artist_id)
+    if artist:
+        session.delete(artist)
+        session.commit()
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    try:
+        with engine.connect():
+            pass
+    except OperationalError:
+        pytest.skip("Postgres is not reachable")
+
+    with Session(engine) as session:
+        user, concert_ids = seed(session)
+        try:
+            yield user, concert_ids
+        finally:
+            clean_up(session, user)
+
+
+@pytest.fixture
+async def client(seeded):
+    user, _ = seeded
+    token = jwt.encode(
+        {
+            "sub": user.username,
+            "uid": user.id,
+            "exp": datetime.now(timezone.utc) + timedelta(minutes=5),
+        },
+        settings.secret_key,
+        algorithm=settings.algorithm,
+    )
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+        cookies={"access_token": token},
+    ) as client:
+        yield client
+    # Pooled connections belong to this test's event loop
+    await async_engine.dispose()
+
+
+async def measure(client: AsyncClient, method: str, url: str, **kwargs) -> int:
+    # Start cold so the principal lookup is counted every time
+    user_cache.clear()
+    with count_queries() as counts:
+        response = await client.request(method, url, **kwargs)
+    response.raise_for_status()
+    return counts[0]
+
+
+async def test_discover_queries_do_not_grow_with_page_size(client, seeded):
+    user, _ = seeded
+    counts = [
+        await measure(
+            client, "GET", "/concerts/discover", params={"artist_id": user.artist_id, "limit": size}
+        )
+        for size in PAGE_SIZES
+    ]
+    assert len(set(counts)) == 1, counts
+
+
+async def test_get_queries_do_not_grow_with_setlist_size(client, seeded):
+    _, concert_ids = seeded
+    counts = [
+        await measure(client, "GET", f"/concerts/{concert_id}")
+        for concert_id in concert_ids[: len(SETLIST_SIZES)]
+    ]
+    assert len(set(counts)) == 1, counts
+
+
+async def test_patch_queries_do_not_grow_with_setlist_size(client, seeded):
+    _, concert_ids = seeded
+    counts = [
+        await measure(client, "PATCH", f"/concerts/{concert_id}", json={"description": "Updated"})
+        for concert_id in concert_ids[: len(SETLIST_SIZES)]
+    ]
+    assert len(set(counts)) == 1, counts
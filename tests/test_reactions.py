@@ -0,0 +1,106 @@
+from app.config import settings
+from app.outbox import Outbox
+from app.reactions import MAX_DISTINCT_EMOJIS, ReactionAggregator
+from tests.fakes import FakeSocket, settle
+import asyncio
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def fast_ticks(monkeypatch):
+    monkeypatch.setattr(settings, "reaction_tick_ms", 10)
+
+
+@pytest.fixture
+async def audience():
+    sockets = [FakeSocket() for _ in range(3)]
+    outboxes = [Outbox(ws) for ws in sockets]  # type: ignore[arg-type]
+    for outbox in outboxes:
+        outbox.start()
+    yield sockets, outboxes
+    for outbox in outboxes:
+        outbox.stop()
+
+
+async def test_reactions_within_a_tick_go_out_as_one_frame(audience):
+    sockets, outboxes = audience
+    aggregator = ReactionAggregator(lambda: outboxes)
+
+    for emoji in ["🎉", "🎉", "❤️", "🎉"]:
+        aggregator.record(emoji)
+    await asyncio.sleep(0.03)
+    await settle()
+
+    for ws in sockets:
+        assert ws.frames == [{"type": "reactions", "counts": {"🎉": 3, "❤️": 1}}]
+
+
+async def test_ticker_stops_once_reactions_do(audience):
+    _, outboxes = audience
+    aggregator = ReactionAggregator(lambda: outboxes)
+
+    aggregator.record("🎉")
+    assert aggregator.task is not None
+    await asyncio.sleep(0.05)
+    assert aggregator.task is None
+
+    # And starts again with the next one
+    aggregator.record("🎉")
+    assert aggregator.task is not None
+    aggregator.stop()
+
+
+async def test_each_tick_counts_only_its_own_reactions(audience):
+    sockets, outboxes = audience
+    aggregator = ReactionAggregator(lambda: outboxes)
+
+    aggregator.record("🎉")
+    aggregator.flush()
+    await settle()
+    aggregator.record("🎉")
+    aggregator.flush()
+    await settle()
+    aggregator.stop()
+
+    assert [frame["counts"] for frame in sockets[0].frames] == [{"🎉": 1}, {"🎉": 1}]
+
+
+async def test_slow_listener_only_gets_the_latest_counts(audience):
+    sockets, outboxes = audience
+    aggregator = ReactionAggregator(lambda: outboxes)
+    slow = sockets[0]
+    slow.pause()
+
+    for count in (1, 2, 3):
+        for _ in range(count):
+            aggregator.record("🎉")
+        aggregator.flush()
+        await settle()
+    aggregator.stop()
+    slow.resume()
+    await settle()
+
+    # The first frame was already being written, later ones replaced each other
+    assert [frame["counts"] for frame in slow.frames] == [{"🎉": 1}, {"🎉": 3}]
+    assert len(sockets[1].frames) == 3
+
+
+@pytest.mark.parametrize("emoji", [None, 5, "", "x" * 17, {"emoji": "🎉"}])
+async def test_malformed_reactions_are_dropped(emoji):
+    aggregator = ReactionAggregator(lambda: [])
+    aggregator.record(emoji)
+    assert not aggregator.counts
+    assert aggregator.task is None
+
+
+async def test_distinct_emojis_per_tick_are_capped():
+    aggregator = ReactionAggregator(lambda: [])
+    for i in range(MAX_DISTINCT_EMOJIS + 10):
+        aggregator.record(f"e{i}")
+    # Ones already counted still are
+    aggregator.record("e0")
+    counts = dict(aggregator.counts)
+    aggregator.stop()
+
+    assert len(counts) == MAX_DISTINCT_EMOJIS
+    assert counts["e0"] == 2
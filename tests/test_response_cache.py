@@ -0,0 +1,27 @@
+from app.response_cache import cache_key
+from fastapi import Request
+
+
+def request_for(path: str, query_string: str) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": path,
+            "query_string": query_string.encode(),
+            "headers": [],
+        }
+    )
+
+
+def test_equivalent_queries_share_a_key():
+    assert cache_key(request_for("/discover", "sort_by=popularity&q=a")) == cache_key(
+        request_for("/discover", "q=a&sort_by=popularity&page=")
+    )
+
+
+def test_encoded_separators_do_not_pass_for_other_parameters():
+    crafted = request_for("/discover", "q=a%26sort_by%3Dpopularity")
+    plain = request_for("/discover", "q=a&sort_by=popularity")
+
+    assert cache_key(crafted) != cache_key(plain)
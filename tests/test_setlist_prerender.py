@@ -0,0 +1,87 @@
+from app.models.artist import Artist, MediaAsset, TRANSCODE_READY
+from app.models.concert import Concert, ConcertSetlistItemCreate
+from app.config import settings
+from app.routers import concerts
+from app.routers.concerts import create_setlist_item
+from datetime import datetime, timedelta
+from fastapi import HTTPException, status
+import pytest
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def first(self):
+        return self.value
+
+
+class FakeSession:
+    """
+    Finds the given asset for any query and records what gets committed.
+    """
+
+    def __init__(self, asset: MediaAsset):
+        self.asset = asset
+        self.added: list = []
+        self.commits = 0
+
+    async def exec(self, query):
+        return FakeResult(self.asset)
+
+    def add(self, item):
+        self.added.append(item)
+
+    async def commit(self):
+        self.commits += 1
+
+
+class FakeManager:
+    def __init__(self):
+        self.prerenders = 0
+
+    def start_prerender(self):
+        self.prerenders += 1
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    manager = FakeManager()
+    monkeypatch.setattr(concerts, "get_concert_manager", lambda concert: manager)
+    return manager
+
+
+async def add_item(start_time: datetime) -> FakeSession:
+    concert = Concert(id=1, artist_id=1, start_time=start_time)
+    session = FakeSession(MediaAsset(id=1, artist_id=1, transcode_status=TRANSCODE_READY))
+    await create_setlist_item(
+        ConcertSetlistItemCreate(name="Opener", asset_id=1, track_number=1),
+        Artist(id=1, name="Band"),
+        concert,
+        session,  # type: ignore[arg-type]
+    )
+    return session
+
+
+@pytest.mark.parametrize(
+    "minutes, prerendered",
+    [
+        (settings.prerender_lead_minutes * 2, False),  # the scheduled job fetches it
+        (settings.prerender_lead_minutes / 2, True),
+        (-10, False),  # already started or over
+    ],
+)
+async def test_only_edits_inside_the_lead_time_prerender(manager, minutes, prerendered):
+    await add_item(datetime.now() + timedelta(minutes=minutes))
+    assert manager.prerenders == int(prerendered)
+
+
+async def test_item_is_saved_without_a_manager(monkeypatch):
+    def unavailable(concert):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many active concerts"
+        )
+
+    monkeypatch.setattr(concerts, "get_concert_manager", unavailable)
+    session = await add_item(datetime.now() + timedelta(minutes=1))
+    assert session.commits == 1
@@ -0,0 +1,85 @@
+from aiortc.mediastreams import MediaStreamError
+from app.setlist_track import SAMPLES_PER_FRAME, SetlistTrack
+from app.transcode import CANONICAL_SAMPLE_RATE
+import asyncio
+import av
+import numpy as np
+import time
+
+
+def write_wav(path, value: int, samples: int) -> str:
+    """
+    A stereo WAV holding one constant sample value, so the output shows
+    which track each sample came from.
+    """
+    with av.open(str(path), "w", format="wav") as container:
+        stream = container.add_stream("pcm_s16le", rate=CANONICAL_SAMPLE_RATE, layout="stereo")
+        frame = av.AudioFrame.from_ndarray(
+            np.full((1, samples * 2), value, np.int16), format="s16", layout="stereo"
+        )
+        frame.sample_rate = CANONICAL_SAMPLE_RATE
+        for packet in stream.encode(frame):
+            container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return str(path)
+
+
+async def play(track: SetlistTrack) -> list[av.AudioFrame]:
+    """
+    Every frame of the track, as fast as it decodes.
+    """
+    # Every frame is already due
+    track._start = float("-inf")
+    frames = []
+    while True:
+        try:
+            frames.append(await track.recv())
+        except MediaStreamError:
+            return frames
+
+
+async def test_tracks_play_back_to_back_without_gaps(tmp_path):
+    first = write_wav(tmp_path / "a.wav", 1000, 5000)
+    second = write_wav(tmp_path / "b.wav", 2000, 3000)
+    frames = await play(SetlistTrack([first, str(tmp_path / "missing.wav"), second], [1.0] * 3))
+
+    # Fixed size frames across the boundary, only the very last one shorter
+    assert [frame.samples for frame in frames[:-1]] == [SAMPLES_PER_FRAME] * 8
+    assert frames[-1].samples == 8000 - 8 * SAMPLES_PER_FRAME
+    assert [frame.pts for frame in frames] == [i * SAMPLES_PER_FRAME for i in range(9)]
+
+    left = np.concatenate([frame.to_ndarray()[0, ::2] for frame in frames])
+    assert (left[:5000] == 1000).all()
+    assert (left[5000:] == 2000).all()
+
+
+async def test_each_track_plays_at_its_gain(tmp_path):
+    first = write_wav(tmp_path / "a.wav", 1000, 960)
+    second = write_wav(tmp_path / "b.wav", 30000, 960)
+    frames = await play(SetlistTrack([first, second], [0.5, 2.0]))
+
+    left = np.concatenate([frame.to_ndarray()[0, ::2] for frame in frames])
+    assert (left[:960] == 500).all()
+    # Clipped rather than wrapped around
+    assert (left[960:] == 32767).all()
+
+
+async def test_frames_are_paced_in_real_time(tmp_path):
+    track = SetlistTrack([write_wav(tmp_path / "a.wav", 1000, 11 * SAMPLES_PER_FRAME)])
+
+    started_at = time.monotonic()
+    for _ in range(11):
+        await track.recv()
+    # The first frame goes out at once, ten more take 20 ms each
+    assert time.monotonic() - started_at >= 0.19
+    track.stop()
+
+
+async def test_decoding_stays_a_small_buffer_ahead(tmp_path):
+    file = write_wav(tmp_path / "a.wav", 1000, 50 * SAMPLES_PER_FRAME)
+    track = SetlistTrack([file], buffer_frames=4)
+    await track.recv()
+    await asyncio.sleep(0.05)
+    assert track._queue.qsize() == 4
+    track.stop()
@@ -0,0 +1,206 @@
+from app import transcode_queue as queue_module
+from app.config import settings
+from app.models.artist import (
+    Artist,
+    MediaAsset,
+    MediaBlob,
+    TRANSCODE_FAILED,
+    TRANSCODE_PENDING,
+    TRANSCODE_PROCESSING,
+    TRANSCODE_READY,
+)
+from app.models.concert import Concert  # noqa: F401, resolves the Artist relationships
+from app.models.user import User  # noqa: F401
+from app.transcode_queue import TranscodeQueue, claim_jobs, fail_job
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+import pytest
+
+OUTPUTS = {
+    "transcoded_url": "/media/transcoded/a.flac",
+    "integrated_loudness": -14.0,
+    "true_peak": -1.5,
+    "peaks_url": "/media/peaks/a.peaks",
+}
+
+
+class AsyncConnectionAdapter:
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def execute(self, statement):
+        return self.connection.execute(statement)
+
+
+class AsyncEngineAdapter:
+    """
+    The engine calls the queue makes, run on a synchronous SQLite engine.
+    SQLite has no row locks, so SKIP LOCKED itself goes untested.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    @asynccontextmanager
+    async def begin(self):
+        with self.engine.begin() as connection:
+            yield AsyncConnectionAdapter(connection)
+
+    @asynccontextmanager
+    async def connect(self):
+        with self.engine.connect() as connection:
+            yield AsyncConnectionAdapter(connection)
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(
+        engine,
+        tables=[Artist.__table__, MediaBlob.__table__, MediaAsset.__table__],  # type: ignore[attr-defined]
+    )
+    with Session(engine) as session:
+        session.add_all([Artist(id=1, name="Band"), Artist(id=2, name="Other")])
+        session.commit()
+    monkeypatch.setattr(queue_module, "async_engine", AsyncEngineAdapter(engine))
+    return engine
+
+
+def add_asset(engine, artist_id: int = 1, **fields) -> int:
+    with Session(engine) as session:
+        asset = MediaAsset(
+            url="/media/1/a.wav",
+            artist_id=artist_id,
+            duration=1,
+            codec="pcm_s16le",
+            bit_rate=0,
+            frequency=48000,
+            channels=2,
+            **fields,
+        )
+        session.add(asset)
+        session.commit()
+        assert asset.id is not None
+        return asset.id
+
+
+def get_asset(engine, asset_id: int) -> MediaAsset:
+    with Session(engine) as session:
+        asset = session.get(MediaAsset, asset_id)
+        assert asset is not None
+        return asset
+
+
+async def test_due_jobs_are_claimed_once_in_id_order(engine):
+    first = add_asset(engine)
+    second = add_asset(engine, transcode_available_at=datetime.now() - timedelta(seconds=1))
+    add_asset(engine, transcode_available_at=datetime.now() + timedelta(hours=1))
+    add_asset(engine, transcode_status=TRANSCODE_READY)
+    third = add_asset(engine)
+
+    assert await claim_jobs(2) == [(first, "/media/1/a.wav", 1), (second, "/media/1/a.wav", 1)]
+    assert get_asset(engine, first).transcode_status == TRANSCODE_PROCESSING
+    assert await claim_jobs(2) == [(third, "/media/1/a.wav", 1)]
+    assert await claim_jobs(2) == []
+
+
+async def test_jobs_left_processing_too_long_are_reclaimed(engine):
+    timeout = timedelta(seconds=settings.transcode_timeout_seconds)
+    stale = add_asset(
+        engine,
+        transcode_status=TRANSCODE_PROCESSING,
+        transcode_started_at=datetime.now() - timeout - timedelta(seconds=1),
+        transcode_attempts=1,
+    )
+    add_asset(
+        engine,
+        transcode_status=TRANSCODE_PROCESSING,
+        transcode_started_at=datetime.now(),
+        transcode_attempts=1,
+    )
+
+    assert await claim_jobs(10) == [(stale, "/media/1/a.wav", 2)]
+
+
+async def test_failed_jobs_back_off_then_fail_for_good(engine, monkeypatch):
+    monkeypatch.setattr(settings, "transcode_max_attempts", 2)
+    monkeypatch.setattr(settings, "transcode_retry_base_seconds", 60)
+    asset_id = add_asset(engine)
+
+    (job,) = await claim_jobs(1)
+    await fail_job(asset_id, job[2], "bad input")
+    asset = get_asset(engine, asset_id)
+    assert asset.transcode_status == TRANSCODE_PENDING
+    assert asset.transcode_error == "bad input"
+    assert asset.transcode_available_at is not None
+    assert asset.transcode_available_at > datetime.now() + timedelta(seconds=50)
+    # Not due until the backoff has passed
+    assert await claim_jobs(1) == []
+
+    await fail_job(asset_id, 2, "bad input")
+    assert get_asset(engine, asset_id).transcode_status == TRANSCODE_FAILED
+
+
+@pytest.fixture
+def transcoder(monkeypatch):
+    """
+    Runs the queue's transcodes in a thread, recording their urls.
+    """
+    transcoded: list[str] = []
+
+    def transcode_asset(url: str) -> dict:
+        transcoded.append(url)
+        return OUTPUTS
+
+    queue = TranscodeQueue()
+    monkeypatch.setattr(queue_module, "transcode_asset", transcode_asset)
+    executor = ThreadPoolExecutor(1)
+    monkeypatch.setattr(queue, "pool", lambda: executor)
+    yield queue, transcoded
+    executor.shutdown()
+
+
+async def test_processed_job_stores_its_outputs(engine, transcoder):
+    queue, transcoded = transcoder
+    asset_id = add_asset(engine)
+
+    await queue.process(*(await claim_jobs(1))[0])
+    assert transcoded == ["/media/1/a.wav"]
+    asset = get_asset(engine, asset_id)
+    assert asset.transcode_status == TRANSCODE_READY
+    assert asset.transcoded_url == OUTPUTS["transcoded_url"]
+
+
+async def test_content_already_transcoded_is_not_transcoded_again(engine, transcoder):
+    queue, transcoded = transcoder
+    with Session(engine) as session:
+        blob = MediaBlob(content_hash="abc", url="/media/1/a.wav", size=1)
+        session.add(blob)
+        session.commit()
+        blob_id = blob.id
+    add_asset(engine, blob_id=blob_id, transcode_status=TRANSCODE_READY, **OUTPUTS)
+    asset_id = add_asset(engine, artist_id=2, blob_id=blob_id)
+
+    await queue.process(*(await claim_jobs(1))[0])
+    assert transcoded == []
+    assert get_asset(engine, asset_id).peaks_url == OUTPUTS["peaks_url"]
+
+
+async def test_failing_transcode_is_retried_later(engine, transcoder, monkeypatch):
+    queue, _ = transcoder
+
+    def broken(url: str) -> dict:
+        raise ValueError("no audio")
+
+    monkeypatch.setattr(queue_module, "transcode_asset", broken)
+    asset_id = add_asset(engine)
+
+    await queue.process(*(await claim_jobs(1))[0])
+    asset = get_asset(engine, asset_id)
+    assert asset.transcode_status == TRANSCODE_PENDING
+    assert asset.transcode_error == "ValueError('no audio')"
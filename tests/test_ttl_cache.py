@@ -0,0 +1,59 @@
+from app import ttl_cache
+from app.ttl_cache import TTLCache
+import pytest
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_returns_entries_until_they_expire(clock):
+    cache = TTLCache[str](max_entries=10, ttl=30)
+    cache.set("a", "value")
+
+    clock[0] += 29
+    assert cache.get("a") == "value"
+
+    clock[0] += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_setting_again_renews_the_ttl(clock):
+    cache = TTLCache[str](max_entries=10, ttl=30)
+    cache.set("a", "old")
+    clock[0] += 20
+    cache.set("a", "new")
+
+    clock[0] += 20
+    assert cache.get("a") == "new"
+
+
+def test_evicts_least_recently_used_first(clock):
+    cache = TTLCache[int](max_entries=2, ttl=30)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Reading "a" makes "b" the oldest
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_delete_and_clear(clock):
+    cache = TTLCache[int](max_entries=10, ttl=30)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    cache.delete("a")
+    cache.delete("missing")
+    assert cache.get("a") is None
+    assert len(cache) == 1
+
+    cache.clear()
+    assert len(cache) == 0
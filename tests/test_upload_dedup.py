@@ -0,0 +1,146 @@
+from app.models.artist import Artist, MediaAsset, MediaBlob, TRANSCODE_READY
+from app.models.concert import Concert  # noqa: F401, resolves the Artist relationships
+from app.models.user import User  # noqa: F401
+from app.routers import artists
+from app.routers.artists import upload_media
+from app.storage import LocalStorage
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+from starlette.datastructures import Headers
+from tests.fakes import wav_bytes
+import io
+import pytest
+
+
+class AsyncSessionAdapter:
+    """
+    The session calls upload_media makes, run on a synchronous SQLite one.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    async def exec(self, query):
+        return self.session.exec(query)
+
+    def add(self, item):
+        self.session.add(item)
+
+    async def commit(self):
+        self.session.commit()
+
+    async def rollback(self):
+        self.session.rollback()
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(
+        engine,
+        tables=[Artist.__table__, MediaBlob.__table__, MediaAsset.__table__],  # type: ignore[attr-defined]
+    )
+    with Session(engine) as session:
+        session.add_all([Artist(id=1, name="First"), Artist(id=2, name="Second")])
+        session.commit()
+    return engine
+
+
+@pytest.fixture
+def stored(tmp_path, monkeypatch):
+    """
+    Files saved by the local storage backend the uploads go to.
+    """
+    storage = LocalStorage(str(tmp_path))
+    monkeypatch.setattr(artists, "storage", storage)
+    monkeypatch.setattr(artists, "backend_for", lambda url: storage)
+    monkeypatch.setattr(artists.transcode_queue, "notify", lambda: None)
+    return lambda: sorted(path.name for path in tmp_path.rglob("*") if path.is_file())
+
+
+async def upload(engine, artist_id: int, content: bytes, filename: str = "take.wav"):
+    file = UploadFile(
+        io.BytesIO(content), filename=filename, headers=Headers({"content-type": "audio/wav"})
+    )
+    with Session(engine) as session:
+        artist = session.get(Artist, artist_id)
+        asset = await upload_media(file, AsyncSessionAdapter(session), artist)  # type: ignore[arg-type]
+        return asset.id, asset.blob_id, asset.transcode_status
+
+
+async def test_same_artist_uploading_again_gets_the_same_asset(engine, stored):
+    content = wav_bytes()
+    first = await upload(engine, 1, content)
+    assert await upload(engine, 1, content, "again.wav") == first
+    assert len(stored()) == 1
+
+
+async def test_other_artists_share_the_stored_file_and_its_transcode(engine, stored):
+    content = wav_bytes()
+    _, blob_id, _ = await upload(engine, 1, content)
+    with Session(engine) as session:
+        reference = session.exec(select(MediaAsset)).one()
+        reference.transcode_status = TRANSCODE_READY
+        reference.transcoded_url = "/media/transcoded/take.flac"
+        reference.integrated_loudness = -12.5
+        session.commit()
+
+    asset_id, shared_blob_id, status = await upload(engine, 2, content)
+    assert shared_blob_id == blob_id
+    assert status == TRANSCODE_READY
+    assert len(stored()) == 1
+    with Session(engine) as session:
+        copy = session.get(MediaAsset, asset_id)
+        assert copy is not None
+        assert (copy.transcoded_url, copy.integrated_loudness) == (
+            "/media/transcoded/take.flac",
+            -12.5,
+        )
+
+
+async def test_concurrent_upload_of_the_same_content(engine, stored, monkeypatch):
+    """
+    The other upload commits the content while this one stores its copy,
+    so this one loses on the unique hash and cleans its copy up.
+    """
+    save = artists.storage.save
+    winner = 1
+
+    def save_after_concurrent_upload(file, folder, extension, *args):
+        url = save(file, folder, extension, *args)
+        file.seek(0)
+        content_hash, size = artists.hash_file(file)
+        with Session(engine) as session:
+            blob = MediaBlob(content_hash=content_hash, url="/media/1/winner.wav", size=size)
+            session.add(
+                MediaAsset(
+                    url=blob.url,
+                    artist_id=winner,
+                    blob=blob,
+                    duration=0,
+                    codec="pcm_s16le",
+                    bit_rate=0,
+                    frequency=48000,
+                    channels=1,
+                )
+            )
+            session.commit()
+        return url
+
+    monkeypatch.setattr(artists.storage, "save", save_after_concurrent_upload)
+
+    # The same artist's other upload won, this one returns its asset
+    asset_id, _, _ = await upload(engine, 1, wav_bytes())
+    assert stored() == []
+    with Session(engine) as session:
+        assert session.exec(select(MediaAsset.id)).all() == [asset_id]
+
+    # Another artist won, there is nothing to return
+    winner = 2
+    with pytest.raises(HTTPException) as error:
+        await upload(engine, 1, wav_bytes(9600))
+    assert error.value.status_code == 409
+    assert stored() == []
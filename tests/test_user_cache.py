@@ -0,0 +1,32 @@
+from app.dependencies.users import detached_user
+from app.models.artist import Artist
+from app.models.concert import Concert  # noqa: F401, resolves the Artist relationships
+from app.models.user import User
+from sqlalchemy import inspect
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, SQLModel, create_engine, select
+import pytest
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine, tables=[Artist.__table__, User.__table__])  # type: ignore[attr-defined]
+    with Session(engine) as session:
+        artist = Artist(name="Band")
+        session.add(User(username="fan", hashed_password="x", artist=artist))
+        session.commit()
+        yield session
+
+
+def test_detached_user_outlives_a_rollback(session):
+    user = session.exec(select(User).options(selectinload(User.artist))).one()  # type: ignore[arg-type]
+    artist_id = user.artist_id
+    copy = detached_user(user)
+    assert inspect(copy).transient
+
+    session.rollback()
+    session.close()
+
+    assert copy.username == "fan"
+    assert copy.artist is not None and copy.artist.id == artist_id
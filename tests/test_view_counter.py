@@ -0,0 +1,77 @@
+from app import view_counter
+from app.config import settings
+from app.view_counter import ViewCounter
+from contextlib import asynccontextmanager
+from sqlalchemy.dialects import postgresql
+import pytest
+
+
+class FakeEngine:
+    """
+    Records the (id, views) rows of every UPDATE, failing while told to.
+    """
+
+    def __init__(self):
+        self.statements: list[list[int]] = []
+        self.failing = False
+
+    @asynccontextmanager
+    async def begin(self):
+        yield self
+
+    async def execute(self, statement):
+        if self.failing:
+            raise ConnectionError("database unavailable")
+        params = statement.compile(dialect=postgresql.dialect()).params
+        self.statements.append(list(params.values()))
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(view_counter, "async_engine", engine)
+    return engine
+
+
+async def test_views_are_flushed_in_batched_updates(engine, monkeypatch):
+    monkeypatch.setattr(view_counter, "MAX_CONCERTS_PER_STATEMENT", 2)
+    counter = ViewCounter()
+    for concert_id in [3, 1, 3, 2, 3]:
+        counter.record(concert_id)
+
+    await counter.flush()
+    # In id order, two concerts a statement
+    assert engine.statements == [[1, 1, 2, 1], [3, 3]]
+    assert not counter.pending and counter.pending_views == 0
+
+    # Nothing new, nothing written
+    await counter.flush()
+    assert len(engine.statements) == 2
+
+
+async def test_views_are_kept_after_a_failed_flush(engine):
+    counter = ViewCounter()
+    counter.record(1)
+    counter.record(1)
+
+    engine.failing = True
+    with pytest.raises(ConnectionError):
+        await counter.flush()
+    # Views recorded while it failed are added to what it kept
+    counter.record(1)
+    assert counter.pending == {1: 3}
+    assert counter.pending_views == 3
+
+    engine.failing = False
+    await counter.flush()
+    assert engine.statements == [[1, 3]]
+
+
+def test_many_pending_views_ask_for_an_early_flush(monkeypatch):
+    monkeypatch.setattr(settings, "view_flush_max_pending", 3)
+    counter = ViewCounter()
+    counter.record(1)
+    counter.record(2)
+    assert not counter.flush_now.is_set()
+    counter.record(1)
+    assert counter.flush_now.is_set()
@@ -0,0 +1,155 @@
+from app import workers
+from app.concert_manager import ConcertManager
+from app.dependencies.concerts import concert_managers, remote_concert_manager
+from app.routers import internal
+from app.routers.internal import assign_workers, run_control
+from app.workers import RemoteConcertManager, WorkerSupervisor, owner_of, supervisor
+from fastapi import HTTPException
+import concurrent.futures
+import asyncio
+import httpx
+import pytest
+
+
+@pytest.fixture
+async def worker(monkeypatch):
+    """
+    Answers control calls with the queued statuses, then 200.
+    """
+    statuses: list[int] = []
+    requests: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        return httpx.Response(statuses.pop(0) if statuses else 200)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(supervisor, "client", client)
+    monkeypatch.setattr(workers, "CONTROL_RETRY_SECONDS", 0)
+    yield statuses, requests
+    await client.aclose()
+
+
+def test_no_workers_means_no_owner(monkeypatch):
+    assert owner_of(1, []) is None
+
+    monkeypatch.setattr(supervisor, "processes", {})
+    with pytest.raises(HTTPException) as error:
+        remote_concert_manager(1)
+    assert error.value.status_code == 503
+
+
+async def test_failing_worker_is_retried(worker):
+    statuses, requests = worker
+    statuses += [503, 502]
+
+    await RemoteConcertManager(1, "worker:8100")._request("POST", "/start")
+    assert requests == ["/internal/concerts/1/start"] * 3
+
+
+async def test_refused_request_is_not_retried(worker):
+    statuses, requests = worker
+    statuses.append(403)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await RemoteConcertManager(1, "worker:8100")._request("POST", "/start")
+    assert len(requests) == 1
+
+
+async def test_start_failure_reaches_the_caller(worker, monkeypatch):
+    statuses, requests = worker
+    statuses += [503] * workers.CONTROL_ATTEMPTS
+    monkeypatch.setattr("app.main.MAIN_LOOP", asyncio.get_running_loop())
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await asyncio.wrap_future(RemoteConcertManager(1, "worker:8100").start())
+    assert len(requests) == workers.CONTROL_ATTEMPTS
+
+
+class FakeProcess:
+    def __init__(self, returncode: int | None = None):
+        self.returncode = returncode
+        self.killed = False
+
+    def poll(self) -> int | None:
+        return self.returncode
+
+    def kill(self):
+        self.killed = True
+
+
+@pytest.fixture
+def watched(monkeypatch):
+    """
+    A supervisor whose workers are fakes, recording respawns and rebalances.
+    """
+    watched = WorkerSupervisor()
+    spawned: list[str] = []
+    rebalances: list[list[str]] = []
+
+    def spawn(address: str):
+        spawned.append(address)
+        return FakeProcess()
+
+    async def ready(address: str):
+        pass
+
+    async def rebalance():
+        rebalances.append(watched.addresses)
+
+    monkeypatch.setattr(watched, "_spawn", spawn)
+    monkeypatch.setattr(watched, "_wait_ready", ready)
+    monkeypatch.setattr(watched, "rebalance", rebalance)
+    return watched, spawned, rebalances
+
+
+async def test_exited_worker_is_respawned_at_its_address(watched):
+    watched, spawned, rebalances = watched
+    watched.processes = {"a:1": FakeProcess(), "b:2": FakeProcess(returncode=1)}
+
+    await watched._replace_exited()
+    assert spawned == ["b:2"]
+    assert watched.processes["b:2"].poll() is None
+    assert rebalances == [["a:1", "b:2"]]
+
+    # Nothing exited since
+    await watched._replace_exited()
+    assert len(rebalances) == 1
+
+
+async def test_worker_that_does_not_come_back_is_dropped(watched, monkeypatch):
+    watched, _, rebalances = watched
+    watched.processes = {"a:1": FakeProcess(), "b:2": FakeProcess(returncode=1)}
+
+    async def never_ready(address: str):
+        raise RuntimeError(f"Concert worker {address} did not start")
+
+    monkeypatch.setattr(watched, "_wait_ready", never_ready)
+    await watched._replace_exited()
+    assert rebalances == [["a:1"]]
+    assert watched.owner(1) == "a:1"
+
+
+async def test_only_idle_concerts_move_to_their_new_owner(monkeypatch):
+    monkeypatch.setattr(internal, "is_worker", lambda: True)
+    monkeypatch.setattr(internal, "owns", lambda concert_id: False)
+    idle, starting, waited_for = ConcertManager(1), ConcertManager(2), ConcertManager(3)
+    starting.starting = True
+    waited_for.listeners["a"] = object()  # type: ignore[assignment]
+    concert_managers.update({1: idle, 2: starting, 3: waited_for})
+
+    try:
+        assert await assign_workers(["elsewhere:8100"]) == {"active": [2, 3]}
+        assert list(concert_managers) == [2, 3]
+    finally:
+        concert_managers.clear()
+        workers.worker_addresses.clear()
+
+
+async def test_failed_start_reaches_the_front_end():
+    future: concurrent.futures.Future = concurrent.futures.Future()
+    future.set_exception(RuntimeError("no setlist"))
+
+    with pytest.raises(HTTPException) as error:
+        await run_control(1, "start", future)
+    assert error.value.status_code == 500